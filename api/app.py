@@ -1,6 +1,43 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from core.config import settings
-from routers import ingest, train, series, init_backfill, metrics, futures
+from core.db import init_pool, close_pool
+from core.aiodb import init_async_pool, close_async_pool
+from core.executor import shutdown_executors
+from core.http import close_http
+from core.telemetry import TimingMiddleware
+from core import jobs as core_jobs
+from routers import ingest, train, series, init_backfill, metrics, futures, jobs, predict, candles, telemetry
+from services import ingestion_service, futures_service, series_cache_service, backfill_service, training_service
+from services.stream_service import kline_stream
+from services.predict_service import drain_batchers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# Abre o pool e garante as tabelas auxiliares uma única vez (e não a cada requisição)
+	init_pool()
+	ingestion_service.ensure_table()
+	futures_service.ensure_table()
+	series_cache_service.ensure_table()
+	backfill_service.ensure_table()
+	training_service.ensure_table()
+	core_jobs.ensure_table()
+	await init_async_pool()
+	# Consumidor do stream de klines (candles fechados por push); o /ingest por polling segue disponível
+	if settings.KLINE_STREAM:
+		kline_stream.start()
+	yield
+	await kline_stream.stop()
+	# Lotes do /predict em andamento terminam antes de o executor de CPU ser desligado
+	await drain_batchers()
+	# Jobs na fila/em andamento ficam 'cancelled' em job_logs enquanto o pool asyncpg ainda está aberto
+	await core_jobs.job_runner.shutdown()
+	await close_http()
+	await close_async_pool()
+	shutdown_executors()
+	close_pool()
+
 
 app = FastAPI(
     title="BTC ML API",
@@ -11,16 +48,24 @@ app = FastAPI(
         "Inclui endpoints prospectivos ('futuros') usados na análise de direção/erro."
     ),
     root_path=settings.API_ROOT_PATH or "",
+    lifespan=lifespan,
 )
 
+# Duração por rota (histogramas em /telemetry) e, com SERVER_TIMING, o header Server-Timing
+app.add_middleware(TimingMiddleware)
+
 app.include_router(ingest.router)
 app.include_router(train.router)
 app.include_router(series.router)
 app.include_router(init_backfill.router)
 app.include_router(metrics.router)
 app.include_router(futures.router)
+app.include_router(jobs.router)
+app.include_router(predict.router)
+app.include_router(candles.router)
+app.include_router(telemetry.router)
 
 # rota raiz para indicar status da API
 @app.get("/")
-def read_root():
+async def read_root():
 	return {"status": "ok", "message": "Visite /docs para explorar os endpoints."}
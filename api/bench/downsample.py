@@ -0,0 +1,55 @@
+"""Custo e fidelidade da redução de resolução (services/downsample.py, parâmetro max_points).
+
+Sobre a série sintética de bench.series_format: mede o tempo de downsample_series e o tamanho
+do JSON de /series/cached antes e depois, confere as invariantes dos buckets OHLCV (primeiro
+open, último close, high/low extremos e volume total preservados) e compara o pior erro por
+bucket com a amostragem por passo fixo em quanto do maior pico de erro de previsão sobrevive.
+
+Uso (a partir de api/):  python -m bench.downsample --rows 26000 --max-points 1000 2000
+"""
+import argparse, json, time
+import numpy as np
+from services.series_format import cached_points
+from services.downsample import downsample_series, downsample_futures
+from bench.series_format import synthetic_frames
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=26_000)
+    ap.add_argument("--max-points", type=int, nargs="+", default=[500, 1000, 2000])
+    args = ap.parse_args()
+
+    cache, fut = synthetic_frames(args.rows)[4:]
+    full_bytes = len(json.dumps({"points": cached_points(cache)}, separators=(",", ":")))
+    peak = float(np.nanmax(np.abs(cache["err_close_signed"])))
+    print(f"linhas: {len(cache)}  JSON completo: {full_bytes / 1e6:.2f} MB  maior |erro|: {peak:.2f}")
+
+    ok = True
+    for m in args.max_points:
+        t0 = time.perf_counter()
+        ds = downsample_series(cache, m)
+        ms = (time.perf_counter() - t0) * 1e3
+        t0 = time.perf_counter()
+        downsample_futures(fut, m)
+        fut_ms = (time.perf_counter() - t0) * 1e3
+        checks = {
+            "open": ds["open"].iloc[0] == cache["open"].iloc[0],
+            "close": ds["close"].iloc[-1] == cache["close"].iloc[-1],
+            "high": ds["high"].max() == cache["high"].max(),
+            "low": ds["low"].min() == cache["low"].min(),
+            "volume": np.isclose(ds["volume"].sum(), cache["volume"].sum()),
+        }
+        ok &= all(checks.values()) and len(ds) == m
+        nbytes = len(json.dumps({"points": cached_points(ds)}, separators=(",", ":")))
+        stride = cache.iloc[::-(-len(cache) // m)]
+        kept_bucket = float(np.nanmax(np.abs(ds["err_close_signed"]))) / peak
+        kept_stride = float(np.nanmax(np.abs(stride["err_close_signed"]))) / peak
+        print(f"max_points={m:>5}: {ms:6.1f} ms (futures {fut_ms:5.1f} ms)  JSON {nbytes / 1e3:8.1f} kB "
+              f"({full_bytes / nbytes:5.1f}x menor)  pico de erro mantido: bucket {kept_bucket:.0%} × passo fixo {kept_stride:.0%}  "
+              f"OHLCV: {'ok' if all(checks.values()) else checks}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
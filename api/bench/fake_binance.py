@@ -0,0 +1,226 @@
+"""Servidor local que imita GET /api/v3/klines e o stream de klines da Binance (testes e benchmarks de ingestão).
+
+Os candles são determinísticos (função do horário de abertura), então qualquer janela pedida
+é consistente com as demais, e o WebSocket publica os mesmos candles do REST. Opcionalmente
+simula latência, limite de peso (429 ou 418 + Retry-After), o header X-MBX-USED-WEIGHT-1M e quedas
+do WebSocket a cada N mensagens.
+
+Uso (a partir de api/):  python -m bench.fake_binance --port 9999 --ws-port 9998 --drop-after 50
+e então BINANCE_BASE=http://127.0.0.1:9999 BINANCE_WS_BASE=ws://127.0.0.1:9998 KLINE_STREAM=true
+(intervalos de segundos, ex. MARKETS=BTCUSDT:1s, fecham um candle por segundo)
+"""
+import argparse, asyncio, json, math, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+INTERVAL_MS = {"s": 1_000, "m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 7 * 86_400_000}
+
+
+def interval_ms(interval: str) -> int:
+    return INTERVAL_MS[interval[-1]] * int(interval[:-1])
+
+
+def kline(open_ms: int, step_ms: int) -> list:
+    i = open_ms // step_ms
+    base = 60_000 * (1 + 0.05 * math.sin(i / 500) + 0.01 * math.sin(i / 37))
+    noise = ((i * 2654435761) % 1000) / 1000 - 0.5
+    o = round(base, 2)
+    c = round(base * (1 + noise * 0.002), 2)
+    h = round(max(o, c) * 1.0007, 2)
+    l = round(min(o, c) * 0.9993, 2)
+    v = round(10 + 5 * abs(noise) + (i % 7), 5)
+    return [open_ms, f"{o:.2f}", f"{h:.2f}", f"{l:.2f}", f"{c:.2f}", f"{v:.5f}",
+            open_ms + step_ms - 1, "0", 100, "0", "0", "0"]
+
+
+def klines(start_ms: int | None, end_ms: int | None, step_ms: int, limit: int, now_ms: int) -> list:
+    last_open = (now_ms // step_ms) * step_ms
+    end = min(end_ms if end_ms is not None else last_open, last_open)
+    if start_ms is None:
+        first = end - (limit - 1) * step_ms
+    else:
+        first = -(-start_ms // step_ms) * step_ms
+    return [kline(t, step_ms) for t in range(first, end + 1, step_ms)][:limit]
+
+
+class FakeBinance(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, latency_ms: int = 0, rate_limit_every: int = 0, retry_after: int = 1,
+                 rate_limit_status: int = 429):
+        super().__init__(addr, _Handler)
+        self.latency_ms = latency_ms
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.rate_limit_status = rate_limit_status
+        self.rate_limited = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeBinance
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body, headers: dict | None = None):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/api/v3/klines":
+            return self._send(404, {"code": -1, "msg": "not found"})
+        with self.server.lock:
+            self.server.requests += 1
+            n = self.server.requests
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000)
+        every = self.server.rate_limit_every
+        if every and n % every == 0:
+            with self.server.lock:
+                self.server.rate_limited += 1
+            return self._send(self.server.rate_limit_status, {"code": -1003, "msg": "Too many requests"},
+                              {"Retry-After": str(self.server.retry_after)})
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        step = interval_ms(q.get("interval", "5m"))
+        data = klines(
+            int(q["startTime"]) if "startTime" in q else None,
+            int(q["endTime"]) if "endTime" in q else None,
+            step, int(q.get("limit", 500)), int(time.time() * 1000),
+        )
+        self._send(200, data, {"X-MBX-USED-WEIGHT-1M": str(2 * (n % 60))})
+
+
+def kline_event(symbol: str, interval: str, open_ms: int, closed: bool) -> dict:
+    """Mensagem do stream combinado (/stream?streams=...) para o candle aberto em open_ms."""
+    t, o, h, l, c, v, close_ms, q, n, *_ = kline(open_ms, interval_ms(interval))
+    k = {"t": t, "T": close_ms, "s": symbol.upper(), "i": interval, "o": o, "c": c, "h": h, "l": l,
+         "v": v, "n": n, "x": closed, "q": q, "V": "0", "Q": "0", "B": "0"}
+    return {"stream": f"{symbol.lower()}@kline_{interval}",
+            "data": {"e": "kline", "E": int(time.time() * 1000), "s": symbol.upper(), "k": k}}
+
+
+class FakeKlineStream:
+    """WebSocket local que imita wss://stream.binance.com/stream?streams=<sym>@kline_<int>/...
+
+    A cada tick publica o candle aberto de cada stream (x=false) e, ao virar o intervalo, o
+    candle que acabou de fechar (x=true). Com drop_after, fecha a conexão depois de N mensagens
+    (para testar reconexão e preenchimento de lacunas).
+    """
+
+    def __init__(self, port: int = 0, tick_ms: int = 250, drop_after: int = 0):
+        self.port = port
+        self.tick = tick_ms / 1000
+        self.drop_after = drop_after
+        self.connections = self.sent = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    async def _handler(self, ws):
+        from websockets.exceptions import ConnectionClosed
+        self.connections += 1
+        names = parse_qs(urlparse(ws.request.path).query).get("streams", [""])[0].split("/")
+        subs = []
+        for name in filter(None, names):
+            sym, _, interval = name.partition("@kline_")
+            step = interval_ms(interval)
+            subs.append([sym, interval, step, (int(time.time() * 1000) // step) * step])
+        sent = 0
+        try:
+            while True:
+                now = int(time.time() * 1000)
+                for sub in subs:
+                    sym, interval, step, open_ms = sub
+                    current = (now // step) * step
+                    events = []
+                    if current > open_ms:
+                        events.append(kline_event(sym, interval, current - step, True))
+                        sub[3] = current
+                    events.append(kline_event(sym, interval, current, False))
+                    for ev in events:
+                        await ws.send(json.dumps(ev))
+                        sent += 1
+                        self.sent += 1
+                        if self.drop_after and sent >= self.drop_after:
+                            await ws.close()
+                            return
+                await asyncio.sleep(self.tick)
+        except ConnectionClosed:
+            pass
+
+    def start(self) -> "FakeKlineStream":
+        from websockets.asyncio.server import serve
+        ready = threading.Event()
+
+        async def main():
+            self._server = await serve(self._handler, "127.0.0.1", self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            await self._server.serve_forever()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(main())
+            except asyncio.CancelledError:
+                pass
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait(5)
+        return self
+
+    def shutdown(self) -> None:
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+
+def start_stream(port: int = 0, **kwargs) -> FakeKlineStream:
+    """Sobe o WebSocket em uma thread daemon e o retorna (use .base_url, .connections e .shutdown())."""
+    return FakeKlineStream(port, **kwargs).start()
+
+
+def start(port: int = 0, **kwargs) -> FakeBinance:
+    """Sobe o servidor em uma thread daemon e o retorna (use .base_url e .shutdown())."""
+    srv = FakeBinance(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=9999)
+    ap.add_argument("--latency-ms", type=int, default=0)
+    ap.add_argument("--rate-limit-every", type=int, default=0, help="responde 429 (ou 418) a cada N requisições")
+    ap.add_argument("--rate-limit-status", type=int, default=429, choices=[418, 429], help="status dessas respostas")
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--ws-port", type=int, default=0, help="sobe também o stream de klines nessa porta")
+    ap.add_argument("--drop-after", type=int, default=0, help="derruba o WebSocket a cada N mensagens")
+    args = ap.parse_args()
+    if args.ws_port:
+        ws = start_stream(args.ws_port, drop_after=args.drop_after)
+        print(f"stream de klines em {ws.base_url}")
+    srv = FakeBinance(("127.0.0.1", args.port), latency_ms=args.latency_ms,
+                      rate_limit_every=args.rate_limit_every, retry_after=args.retry_after,
+                      rate_limit_status=args.rate_limit_status)
+    print(f"fake binance em {srv.base_url}")
+    srv.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Paridade e tempo da inferência fundida (ml/inference.py) contra o caminho antigo por modelo.
+
+Caminho antigo: um XGBModel.predict por alvo sobre o DataFrame, mais predict e predict_proba do
+classificador (que percorre as árvores duas vezes). Caminho novo: InferenceEngine.predict_parts,
+com um buffer float32 único e uma passada por modelo (em paralelo acima de PARALLEL_MIN_ROWS).
+
+Sai com código 1 se as saídas divergirem; a paridade (1, 256 e 5000 linhas, remapeamento de
+colunas e bundle multi-saída antigo) é garantida por tests/test_inference.py.
+
+Uso (a partir de api/):  python -m bench.inference --rows 1,256,25000 --trees 400
+"""
+import argparse, os, time
+import numpy as np
+import pandas as pd
+from ml.features import TARGET_REG_COLS
+from ml.inference import InferenceEngine, PARALLEL_MIN_ROWS
+from bench.predict import synthetic_snapshot
+
+
+def old_path(snap, X: pd.DataFrame):
+    models = snap.reg_bundle["models"]
+    reg_pred = pd.DataFrame({t: models[t].predict(X) for t in TARGET_REG_COLS}, index=X.index)
+    return reg_pred, snap.cls.predict(X), snap.cls.predict_proba(X)
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e3
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", default="1,256,25000", help="tamanhos de lote separados por vírgula")
+    ap.add_argument("--trees", type=int, default=400)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.rows.split(",")]
+    snap, X_all = synthetic_snapshot(max(2000, max(sizes)), args.trees)
+    engine = InferenceEngine(snap.reg_bundle, snap.cls, snap.version)
+
+    ok = True
+    print(f"{'linhas':>8} {'antigo ms':>10} {'fundido ms':>11} {'ganho':>6}  paridade")
+    for n in sizes:
+        X = X_all.iloc[:n]
+        ref_reg, ref_cls, ref_prob = old_path(snap, X)
+        reg, cls, prob = engine.predict_parts(X)
+        same = (np.array_equal(ref_reg.to_numpy(), reg.to_numpy()) and np.array_equal(ref_cls, cls)
+                and np.array_equal(ref_prob, prob))
+        ok &= same
+        t_old = best_of(lambda: old_path(snap, X), args.repeat)
+        t_new = best_of(lambda: engine.predict_parts(X), args.repeat)
+        par = " (paralelo)" if n >= PARALLEL_MIN_ROWS and (os.cpu_count() or 1) > 1 else ""
+        print(f"{n:>8} {t_old:>10.2f} {t_new:>11.2f} {t_old / t_new:>5.1f}x  {'ok' if same else 'DIVERGE'}{par}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
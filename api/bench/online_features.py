@@ -0,0 +1,57 @@
+"""Paridade e custo do estado online de features (ml/online_features.py).
+
+Reproduz os candles um a um no OnlineFeatureState e compara cada linha de features com o X
+de build_features_targets (o caminho em lote usado no treino); também mede o custo por
+candle do push() contra refazer build_features_targets sobre a janela de 3 dias a cada ingest.
+Com --gaps, remove candles ao acaso para conferir a paridade em volta de lacunas.
+A paridade (com e sem lacunas) é garantida por tests/test_online_features.py.
+
+Uso (a partir de api/):  python -m bench.online_features --rows 20000 --gaps 50
+"""
+import argparse, time
+import numpy as np
+from ml.features import build_features_targets, FEATURE_COLS
+from ml.online_features import OnlineFeatureState
+from bench.series_format import synthetic_frames
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=20_000)
+    ap.add_argument("--rtol", type=float, default=1e-9)
+    ap.add_argument("--gaps", type=int, default=0, help="candles removidos ao acaso (lacunas)")
+    args = ap.parse_args()
+
+    df = synthetic_frames(args.rows)[0]
+    step = df["time"].diff().min()
+    if args.gaps:
+        drop = np.random.default_rng(3).choice(np.arange(1, len(df) - 1), args.gaps, replace=False)
+        df = df.drop(index=df.index[drop]).reset_index(drop=True)
+    df2, X, _, _ = build_features_targets(df)
+
+    state = OnlineFeatureState(step.to_pytimedelta())
+    online = {}
+    t0 = time.perf_counter()
+    for t, o, h, l, c, v in df[["time","open","high","low","close","volume"]].itertuples(index=False, name=None):
+        if state.push(t, o, h, l, c, v) is not None:
+            online[t] = state.feature_row()
+    push_us = (time.perf_counter() - t0) / len(df) * 1e6
+
+    # build_features_targets descarta a última linha (sem target): compara só os tempos em comum
+    got = np.array([online[t] for t in df2["time"]])
+    ok = np.allclose(got, X[FEATURE_COLS].to_numpy(), rtol=args.rtol, atol=0)
+    max_rel = float(np.max(np.abs(got - X.to_numpy()) / np.maximum(np.abs(X.to_numpy()), 1e-300)))
+
+    window = df.tail(3 * 288)
+    t0 = time.perf_counter()
+    for _ in range(20):
+        build_features_targets(window)
+    batch_ms = (time.perf_counter() - t0) / 20 * 1e3
+
+    print(f"linhas comparadas: {len(df2)} (lacunas: {args.gaps})  paridade (rtol={args.rtol}): {'ok' if ok else 'FALHOU'}  max erro relativo: {max_rel:.2e}")
+    print(f"push() por candle: {push_us:.1f} µs   build_features_targets (3 dias): {batch_ms:.2f} ms")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Latência e vazão do /predict (services/predict_service.py) com e sem micro-batching.
+
+Treina seis modelos sintéticos com o mesmo formato dos publicados (cinco regressores + classificador)
+e simula `--clients` chamadores concorrentes, cada um pedindo uma linha por vez:
+  - dataframe: caminho antigo (DataFrame + XGBModel.predict/predict_proba por modelo, por requisição)
+  - inplace:   inplace_predict em buffer NumPy, uma requisição por vez no executor de CPU
+  - batched:   MicroBatcher (janelas de --window-ms) juntando as requisições concorrentes
+
+Uso (a partir de api/):  python -m bench.predict --clients 64 --requests 2000 --window-ms 1
+"""
+import argparse, asyncio, time
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor, XGBClassifier
+from core.executor import run_cpu
+from ml.features import FEATURE_COLS, TARGET_REG_COLS
+from services import predict_service
+from services.predict_service import MicroBatcher, predict_matrix
+
+
+def synthetic_snapshot(rows: int, trees: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(rows, len(FEATURE_COLS))), columns=FEATURE_COLS).astype(np.float32)
+    y = X["close"] * 2 + rng.normal(size=rows)
+    params = dict(n_estimators=trees, max_depth=6, learning_rate=0.05, tree_method="hist", n_jobs=1)
+    models = {t: XGBRegressor(**params).fit(X, y) for t in TARGET_REG_COLS}
+    cls = XGBClassifier(**params).fit(X, (y > 0).astype(int))
+    return SimpleNamespace(reg_bundle={"models": models, "feature_cols": FEATURE_COLS}, cls=cls, version="bench"), X
+
+
+def dataframe_predict(snap, X: np.ndarray):
+    df = pd.DataFrame(X, columns=FEATURE_COLS)
+    out = np.column_stack([snap.reg_bundle["models"][t].predict(df) for t in TARGET_REG_COLS])
+    proba = snap.cls.predict_proba(df)
+    return np.c_[out, proba[:, 1], proba[:, 0], snap.cls.predict(df)], snap.version
+
+
+async def load(call, clients: int, requests: int, X: np.ndarray) -> tuple[float, np.ndarray]:
+    lat = []
+    per_client = requests // clients
+
+    async def client(c):
+        for i in range(per_client):
+            row = X[(c * per_client + i) % len(X)][None, :]
+            t0 = time.perf_counter()
+            await call(row)
+            lat.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    return time.perf_counter() - t0, np.array(lat) * 1e3
+
+
+async def main_async(args):
+    snap, X = synthetic_snapshot(2000, args.trees)
+    X = X.to_numpy()
+    # predict_matrix lê o registro do mercado; aqui ele devolve o snapshot sintético
+    predict_service.registry_for = lambda market=None: SimpleNamespace(get=lambda: snap)
+
+    ref = dataframe_predict(snap, X[:256])[0]
+    got = predict_matrix(X[:256])[0]
+    print(f"paridade inplace × DataFrame: max |dif| = {np.abs(ref - got).max():.2e}")
+
+    batcher = MicroBatcher(predict_matrix, args.window_ms, args.max_rows)
+    modes = {
+        "dataframe": lambda row: run_cpu(dataframe_predict, snap, row),
+        "inplace": lambda row: run_cpu(predict_matrix, row),
+        "batched": batcher.predict,
+    }
+    for name, call in modes.items():
+        wall, lat = await load(call, args.clients, args.requests, X)
+        extra = f"  lotes: {batcher.batches} (média {batcher.calls / max(batcher.batches, 1):.1f} req/lote)" if name == "batched" else ""
+        print(f"{name:>9}: {len(lat) / wall:8.0f} req/s  p50 {np.percentile(lat, 50):7.2f} ms  "
+              f"p99 {np.percentile(lat, 99):7.2f} ms{extra}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--clients", type=int, default=64)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--trees", type=int, default=400)
+    ap.add_argument("--window-ms", type=float, default=1.0)
+    ap.add_argument("--max-rows", type=int, default=256)
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Benchmark da montagem de pontos de /series, /series/cached e /futures.
+
+Compara as versões antigas (linha a linha com iloc/iterrows) com as vetorizadas de
+services/series_format.py sobre dados sintéticos e confere que o JSON é idêntico.
+
+Uso (a partir de api/):  python -m bench.series_format --rows 26000
+"""
+import argparse, json, math, time
+import numpy as np
+import pandas as pd
+from ml.features import add_features_targets, TARGET_REG_COLS
+from services.series_format import series_points, cached_points, futures_points
+
+
+def synthetic_frames(n: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    close = 60_000 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.002, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.002, n))
+    df2 = pd.DataFrame({
+        "time": pd.date_range("2025-01-01", periods=n, freq="5min"),
+        "open": open_, "high": high, "low": low, "close": close,
+        "volume": rng.uniform(1, 100, n),
+    })
+    # Todas as linhas com close_next/amp_next (o real do próximo candle usado nos erros)
+    df2 = add_features_targets(df2)
+    reg_pred = pd.DataFrame({
+        k: (df2["close"] * (1 + rng.normal(0, 0.001, n))).astype(np.float32) for k in TARGET_REG_COLS
+    })
+    reg_pred["amp_next"] = (df2["high"] - df2["low"]).astype(np.float32)
+    p_up = rng.uniform(0, 1, n).astype(np.float32)
+    prob = np.c_[1 - p_up, p_up]
+    cls_pred = (p_up > 0.5).astype(int)
+
+    cache = df2[["time", "open", "high", "low", "close", "volume"]].copy()
+    for k in TARGET_REG_COLS:
+        cache[f"pred_{k}"] = reg_pred[k].astype(np.float64)
+    cache["cls_dir_next"] = cls_pred.astype(float)
+    cache["prob_up"] = prob[:, 1].astype(np.float64)
+    cache["prob_down"] = prob[:, 0].astype(np.float64)
+    cache["err_close_abs"] = (cache["pred_close_next"] - cache["close"].shift(-1)).abs()
+    cache["err_close_signed"] = cache["pred_close_next"] - cache["close"].shift(-1)
+    cache["err_amp_abs"] = (cache["pred_amp_next"] - (cache["high"] - cache["low"]).shift(-1)).abs()
+    cache.loc[cache.sample(frac=0.01, random_state=seed).index, "pred_close_next"] = np.nan
+
+    fut = pd.DataFrame({
+        "time": df2["time"], "pred_close": cache["pred_close_next"],
+        "real_close": df2["close"], "err_close": cache["err_close_abs"],
+    })
+    return df2, reg_pred, cls_pred, prob, cache, fut
+
+
+# --- Implementações antigas (referência) ---
+
+def legacy_series_points(df2, reg_pred, cls_pred, prob):
+    out = []
+    for i in range(len(df2)):
+        real = {k: (float(df2.iloc[i][k]) if k!="time" else df2.iloc[i]["time"].isoformat())
+                for k in ["time","open","high","low","close","volume"]}
+        pred = {k: float(reg_pred.iloc[i][k]) for k in TARGET_REG_COLS} if reg_pred is not None else None
+        clsinfo = ({"dir_next": int(cls_pred[i]), "prob_up": float(prob[i][1]), "prob_down": float(prob[i][0])}
+                   if cls_pred is not None else None)
+        err = None
+        if pred is not None and i+1 < len(df2):
+            real_next_close = float(df2.iloc[i+1]["close"])
+            real_next_amp = float(df2.iloc[i+1]["high"] - df2.iloc[i+1]["low"])
+            err = {
+                "close_abs": abs(pred["close_next"] - real_next_close),
+                "close_signed": pred["close_next"] - real_next_close,
+                "amp_abs": abs(pred["amp_next"] - real_next_amp)
+            }
+        out.append({"real": real, "pred": pred, "cls": clsinfo, "err": err})
+    return out
+
+
+def _safe(x):
+    if pd.isna(x):
+        return None
+    try:
+        v = float(x)
+        if math.isnan(v) or math.isinf(v):
+            return None
+        return v
+    except Exception:
+        return None
+
+
+def legacy_cached_points(df):
+    points = []
+    for _, r in df.iterrows():
+        real = {"time": pd.to_datetime(r["time"]).isoformat(), "open": _safe(r["open"]), "high": _safe(r["high"]),
+                "low": _safe(r["low"]), "close": _safe(r["close"]), "volume": _safe(r["volume"])}
+        pred = None
+        pcn = _safe(r["pred_close_next"])
+        if pcn is not None:
+            pred = {"open_next": _safe(r["pred_open_next"]), "high_next": _safe(r["pred_high_next"]),
+                    "low_next": _safe(r["pred_low_next"]), "close_next": pcn, "amp_next": _safe(r["pred_amp_next"])}
+        cls = None
+        cdn = _safe(r["cls_dir_next"])
+        if cdn is not None:
+            cls = {"dir_next": int(cdn), "prob_up": _safe(r["prob_up"]), "prob_down": _safe(r["prob_down"])}
+        err = None
+        eca = _safe(r["err_close_abs"])
+        if eca is not None:
+            err = {"close_abs": eca, "close_signed": _safe(r["err_close_signed"]), "amp_abs": _safe(r["err_amp_abs"])}
+        points.append({"real": real, "pred": pred, "cls": cls, "err": err})
+    return points
+
+
+def legacy_futures_points(df):
+    return [{"time": pd.to_datetime(r["time"]).isoformat(), "pred_close": _safe(r.get("pred_close")),
+             "real_close": _safe(r.get("real_close")), "err_close": _safe(r.get("err_close"))}
+            for _, r in df.iterrows()]
+
+
+def _timed(fn, *args, repeat: int = 1):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=26_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    df2, reg_pred, cls_pred, prob, cache, fut = synthetic_frames(args.rows)
+    cases = [
+        ("series", legacy_series_points, series_points, (df2, reg_pred, cls_pred, prob)),
+        ("series/cached", legacy_cached_points, cached_points, (cache,)),
+        ("futures", legacy_futures_points, futures_points, (fut,)),
+    ]
+    print(f"rows={args.rows}")
+    print(f"{'endpoint':<15}{'legacy (s)':>12}{'vectorized (s)':>16}{'speedup':>10}  identical")
+    for name, old, new, fargs in cases:
+        t_old, out_old = _timed(old, *fargs)
+        t_new, out_new = _timed(new, *fargs, repeat=args.repeat)
+        same = json.dumps(out_old) == json.dumps(out_new)
+        print(f"{name:<15}{t_old:>12.3f}{t_new:>16.4f}{t_old / t_new:>9.1f}x  {same}")
+        if not same:
+            raise SystemExit(f"{name}: saída vetorizada difere da versão antiga")
+
+
+if __name__ == "__main__":
+    main()
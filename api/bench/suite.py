@@ -0,0 +1,299 @@
+"""Suíte de benchmarks dos caminhos quentes (ML e serviço) sobre candles sintéticos, com baseline.
+
+Gera candles por passeio aleatório (log-retornos normais, volume log-normal) em cada tamanho de
+--sizes, grava em um Postgres efêmero (initdb em diretório temporário, porta livre, removido no
+fim) e mede, por tamanho:
+  upsert          upsert_candles (COPY + INSERT ON CONFLICT) em btc_candles vazia
+  features        build_features_targets
+  train           train_job completo (mesmos parâmetros do /train; só até --train-max candles)
+  predict         InferenceEngine.predict_parts sobre todas as linhas (modelo do último treino)
+  series_data     series_data (leitura + features + predict + pontos do /series)
+  series_cache    build_series_cache completo (materialização)
+  series_cached   load_series_cached + serialização JSON da resposta do /series/cached
+
+Cada medida é a mediana de --repeat execuções (treino: --train-repeat), com o mínimo e o máximo
+ao lado. O resultado sai em JSON (--out) e, com --baseline, é comparado a um resultado gravado:
+é regressão quando a mediana fica mais de --tolerance e mais de --min-ms acima da do baseline e
+nem a execução mais rápida alcança a mediana do baseline; o processo sai com código 1. O
+baseline só vale na mesma máquina: não há baseline versionado, grave um com --save-baseline no
+ambiente onde a comparação vai rodar. Com plataforma, CPU ou versões diferentes a comparação é
+recusada (código 2).
+
+Como root o initdb não roda; use --server para criar um banco temporário no Postgres de PG_HOST/PG_PORT.
+
+Uso (a partir de api/):
+  python -m bench.suite --sizes 1000,10000,100000 --out /tmp/bench.json
+  python -m bench.suite --save-baseline bench/baseline.json
+  python -m bench.suite --baseline bench/baseline.json
+"""
+import argparse, json, math, os, platform, shutil, socket, subprocess, sys, tempfile, time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+SCHEMA_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema.sql")
+
+
+def random_walk_candles(n: int, freq: str = "5min", seed: int = 0, end=None) -> pd.DataFrame:
+    """n candles OHLCV por passeio aleatório, terminando no último candle fechado antes de `end` (padrão: agora)."""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now(tz="UTC").tz_localize(None)
+    times = pd.date_range(end=end.floor(freq) - pd.Timedelta(freq), periods=n, freq=freq)
+    close = 60_000 * np.exp(np.cumsum(rng.normal(0, 0.0015, n)))
+    open_ = np.r_[60_000, close[:-1]]
+    wick = np.abs(rng.normal(0, 0.0008, (2, n)))
+    return pd.DataFrame({
+        "time": times,
+        "open": open_.round(2),
+        "high": (np.maximum(open_, close) * (1 + wick[0])).round(2),
+        "low": (np.minimum(open_, close) * (1 - wick[1])).round(2),
+        "close": close.round(2),
+        "volume": rng.lognormal(3, 0.5, n).round(5),
+    })
+
+
+def _pg_bin() -> str:
+    if os.getenv("PG_BIN"):
+        return os.environ["PG_BIN"]
+    found = shutil.which("initdb")
+    if found:
+        return os.path.dirname(found)
+    try:
+        import pgserver
+        return os.path.join(os.path.dirname(pgserver.__file__), "pginstall", "bin")
+    except ImportError:
+        raise SystemExit("initdb não encontrado: instale o PostgreSQL, defina PG_BIN ou use --server")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def ephemeral_postgres():
+    """Cluster descartável: initdb em diretório temporário e postgres só no socket Unix desse diretório."""
+    bin_dir = _pg_bin()
+    tmp = tempfile.mkdtemp(prefix="btcml-bench-")
+    data, log = os.path.join(tmp, "data"), os.path.join(tmp, "postgres.log")
+    port = _free_port()
+    try:
+        subprocess.run([os.path.join(bin_dir, "initdb"), "-D", data, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([os.path.join(bin_dir, "pg_ctl"), "-D", data, "-l", log, "-w",
+                        "-o", f"-p {port} -k {tmp} -c listen_addresses=''", "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+        try:
+            yield {"PG_HOST": tmp, "PG_PORT": str(port), "PG_DB": "postgres", "PG_USER": "postgres", "PG_PWD": ""}
+        finally:
+            subprocess.run([os.path.join(bin_dir, "pg_ctl"), "-D", data, "-m", "immediate", "stop"],
+                           stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+@contextmanager
+def scratch_database():
+    """Banco temporário no servidor de PG_HOST/PG_PORT, apagado ao sair."""
+    import psycopg2
+    name = f"btcml_bench_{os.getpid()}"
+    conn = psycopg2.connect(dbname=os.getenv("PG_DB", "postgres"), user=os.getenv("PG_USER"), password=os.getenv("PG_PWD"),
+                            host=os.getenv("PG_HOST"), port=os.getenv("PG_PORT"))
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'CREATE DATABASE "{name}"')
+    try:
+        yield {"PG_DB": name}
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        conn.close()
+
+
+def _configure(pg_env: dict, model_dir: str) -> None:
+    # Antes de importar core.config: banco efêmero, artefatos em diretório temporário e só o mercado padrão
+    os.environ.update(pg_env)
+    os.environ.update(MODEL_DIR=model_dir, MARKETS="", REG_PATH="", CLS_PATH="")
+    for k, v in {"BINANCE_SYMBOL": "BTCUSDT", "BINANCE_INTERVAL": "5m", "BINANCE_LIMIT": "1000",
+                 "BACKFILL_DAYS": "90", "BACKFILL_SLEEP_MS": "0"}.items():
+        os.environ.setdefault(k, v)
+
+
+def measure(fn, repeat: int, setup=None) -> tuple[list[float], object]:
+    """Tempos (s) de `repeat` execuções de fn (setup fora da medida) e o resultado da última."""
+    samples, out = [], None
+    for _ in range(max(1, repeat)):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        out = fn()
+        samples.append(time.perf_counter() - t0)
+    return samples, out
+
+
+def run_suite(sizes: list[int], repeat: int, train_max: int, seed: int, train_repeat: int = 3) -> dict:
+    from core.db import init_pool, close_pool, pg_conn
+    from core import jobs as core_jobs
+    from core.markets import DEFAULT_MARKET
+    from core.response_cache import _json_bytes
+    from ml.features import build_features_targets
+    from ml.inference import engine_for
+    from ml.registry import registry_for
+    from services import ingestion_service, futures_service, series_cache_service, training_service
+    from services.prediction_service import series_data
+    from services.series_cache_service import build_series_cache, load_series_cached
+
+    init_pool()
+    # Mesmo esquema inicial do docker-compose (docker-entrypoint-initdb.d), depois os ensure_table do lifespan
+    with open(SCHEMA_SQL) as f, pg_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f.read())
+    for svc in (ingestion_service, futures_service, series_cache_service, training_service, core_jobs):
+        svc.ensure_table()
+
+    def truncate(*tables):
+        with pg_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"TRUNCATE {', '.join(tables)}")
+
+    results = {}
+    try:
+        for n in sizes:
+            df = random_walk_candles(n, seed=seed)
+            days = math.ceil(n * 5 / 1440) + 1
+            timings = {}
+
+            timings["upsert"], _ = measure(lambda: ingestion_service.upsert_candles(df), repeat,
+                                           setup=lambda: truncate("btc_candles", "series_cache"))
+            timings["features"], feats = measure(lambda: build_features_targets(df), repeat)
+            if n <= train_max:
+                timings["train"], res = measure(lambda: training_service.train_job(days, mode="full"), train_repeat)
+                if res.get("status") != "ok":
+                    raise RuntimeError(f"train_job falhou com {n} candles: {res.get('message')}")
+            try:
+                engine = engine_for(registry_for(DEFAULT_MARKET).get())
+            except FileNotFoundError:
+                engine = None
+            if engine is not None:
+                timings["predict"], _ = measure(lambda: engine.predict_parts(feats[1]), repeat)
+            timings["series_data"], _ = measure(lambda: series_data(None, None, days), repeat)
+            timings["series_cache"], _ = measure(lambda: build_series_cache(days), repeat)
+            timings["series_cached"], _ = measure(lambda: _json_bytes(load_series_cached(None, None, days)), repeat)
+
+            for case, samples in timings.items():
+                secs = float(np.median(samples))
+                results[f"{case}/{n}"] = {"case": case, "rows": n, "secs": round(secs, 6),
+                                          "min": round(min(samples), 6), "max": round(max(samples), 6),
+                                          "runs": len(samples), "rows_per_sec": round(n / secs) if secs > 0 else None}
+                print(f"  {case:>14} {n:>9}  {secs * 1e3:10.2f} ms", file=sys.stderr)
+    finally:
+        close_pool()
+    return results
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def environment() -> dict:
+    import xgboost
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "cpu": _cpu_model(), "numpy": np.__version__, "pandas": pd.__version__, "xgboost": xgboost.__version__}
+
+
+# Campos do ambiente que precisam coincidir para a comparação com o baseline fazer sentido
+COMPARABLE_ENV = ("platform", "cpus", "cpu", "python", "numpy", "pandas", "xgboost")
+
+
+def env_mismatch(current: dict, baseline: dict) -> list[str]:
+    return [f"{k}: {baseline.get(k)!r} ≠ {current.get(k)!r}" for k in COMPARABLE_ENV if baseline.get(k) != current.get(k)]
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_ms: float) -> tuple[list, list]:
+    """Linhas da tabela de comparação e as chaves que regrediram."""
+    rows, regressions = [], []
+    base = baseline.get("results", {})
+    for key, r in results.items():
+        b = base.get(key)
+        if b is None:
+            rows.append((key, r["secs"], None, None, "novo"))
+            continue
+        ratio = r["secs"] / b["secs"] if b["secs"] > 0 else float("inf")
+        # Mediana acima da tolerância e do piso absoluto, e nem a execução mais rápida chega à mediana anterior
+        slower = (ratio > 1 + tolerance and (r["secs"] - b["secs"]) * 1e3 > min_ms
+                  and r.get("min", r["secs"]) > b["secs"])
+        if slower:
+            regressions.append(key)
+        rows.append((key, r["secs"], b["secs"], ratio, "REGRESSÃO" if slower else ("melhor" if ratio < 1 - tolerance else "ok")))
+    return rows, regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="1000,10000,100000", help="quantidades de candles separadas por vírgula (até 1000000)")
+    ap.add_argument("--repeat", type=int, default=5, help="execuções por medida (vale a mediana)")
+    ap.add_argument("--train-repeat", type=int, default=3, help="execuções do train_job por tamanho")
+    ap.add_argument("--train-max", type=int, default=100_000, help="maior tamanho em que train_job é medido")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--server", action="store_true", help="banco temporário no Postgres de PG_HOST/PG_PORT em vez do initdb")
+    ap.add_argument("--out", help="grava o resultado em JSON nesse arquivo ('-' = stdout)")
+    ap.add_argument("--baseline", help="resultado anterior para comparar; sai com 1 se houver regressão")
+    ap.add_argument("--save-baseline", help="grava o resultado como novo baseline")
+    ap.add_argument("--tolerance", type=float, default=0.5, help="piora relativa tolerada da mediana (0.5 = 50%%)")
+    ap.add_argument("--min-ms", type=float, default=50.0, help="diferenças absolutas abaixo disso não contam como regressão (ruído)")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Antes de rodar: baseline de outra máquina não se compara (falsas regressões ou melhoras)
+        mismatch = env_mismatch(environment(), baseline.get("env", {}))
+        if mismatch:
+            print("baseline gravado em outro ambiente; grave um aqui com --save-baseline:\n  " + "\n  ".join(mismatch),
+                  file=sys.stderr)
+            raise SystemExit(2)
+    model_dir = tempfile.mkdtemp(prefix="btcml-bench-models-")
+    try:
+        with (scratch_database() if args.server else ephemeral_postgres()) as pg_env:
+            _configure(pg_env, model_dir)
+            results = run_suite(sizes, args.repeat, args.train_max, args.seed, args.train_repeat)
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+    report = {"created_at": pd.Timestamp.now(tz="UTC").isoformat(), "env": environment(),
+              "params": {"sizes": sizes, "repeat": args.repeat, "train_repeat": args.train_repeat,
+                         "train_max": args.train_max, "seed": args.seed},
+              "results": results}
+    if args.out == "-":
+        print(json.dumps(report, indent=1))
+    elif args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if baseline is not None:
+        rows, regressions = compare(results, baseline, args.tolerance, args.min_ms)
+        print(f"\n{'caso':>22} {'atual ms':>10} {'baseline ms':>12} {'razão':>6}", file=sys.stderr)
+        for key, secs, base, ratio, status in rows:
+            b = f"{base * 1e3:12.2f}" if base is not None else f"{'-':>12}"
+            r = f"{ratio:6.2f}" if ratio is not None else f"{'-':>6}"
+            print(f"{key:>22} {secs * 1e3:10.2f} {b} {r}  {status}", file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)} regressão(ões): {', '.join(regressions)}", file=sys.stderr)
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import json, re
+from datetime import datetime
+import asyncpg
+import pandas as pd
+from core.config import settings
+
+# Pool asyncpg por processo, usado pelas rotas async (leituras). Escritas em lote (COPY) seguem
+# no psycopg2 (core.db) dentro do executor de jobs.
+_pool: asyncpg.Pool | None = None
+
+
+async def _init_conn(conn) -> None:
+    # NUMERIC como float (mesmo resultado do coerce_float do pandas com psycopg2) e JSON decodificado
+    await conn.set_type_codec("numeric", encoder=str, decoder=float, schema="pg_catalog", format="text")
+    for t in ("json", "jsonb"):
+        await conn.set_type_codec(t, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+async def init_async_pool() -> asyncpg.Pool:
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            database=settings.PG_DB, user=settings.PG_USER, password=settings.PG_PWD,
+            host=settings.PG_HOST, port=settings.PG_PORT,
+            min_size=settings.PG_POOL_MIN, max_size=settings.PG_ASYNC_POOL_MAX,
+            init=_init_conn,
+        )
+    return _pool
+
+
+async def connect() -> asyncpg.Connection:
+    """Conexão própria, fora do pool (sessões longas não ocupam as conexões das rotas)."""
+    return await asyncpg.connect(
+        database=settings.PG_DB, user=settings.PG_USER, password=settings.PG_PWD,
+        host=settings.PG_HOST, port=settings.PG_PORT,
+    )
+
+
+async def close_async_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+def dollar(query: str) -> str:
+    """Troca os placeholders %s (psycopg2) por $1..$n (asyncpg), para reaproveitar o mesmo SQL."""
+    counter = iter(range(1, 1 << 16))
+    return _PLACEHOLDER.sub(lambda _: f"${next(counter)}", query)
+
+
+def as_timestamp(value) -> datetime | None:
+    """Converte o parâmetro de data da query string para TIMESTAMP sem fuso (como o cast do Postgres faria)."""
+    if value is None or isinstance(value, datetime):
+        return value
+    ts = pd.Timestamp(value)
+    return ts.tz_localize(None).to_pydatetime() if ts.tzinfo is not None else ts.to_pydatetime()
+
+
+async def fetchrow(query: str, *args):
+    pool = await init_async_pool()
+    return await pool.fetchrow(dollar(query), *args)
+
+
+async def fetch(query: str, *args):
+    pool = await init_async_pool()
+    return await pool.fetch(dollar(query), *args)
+
+
+def _frame(rows, columns) -> pd.DataFrame:
+    return pd.DataFrame.from_records([tuple(r) for r in rows], columns=columns, coerce_float=True)
+
+
+async def fetch_frame(query: str, *args) -> pd.DataFrame:
+    """Resultado da query como DataFrame (colunas preservadas mesmo sem linhas)."""
+    pool = await init_async_pool()
+    async with pool.acquire() as conn:
+        stmt = await conn.prepare(dollar(query))
+        columns = [a.name for a in stmt.get_attributes()]
+        return _frame(await stmt.fetch(*args), columns)
+
+
+async def iter_frames(query: str, *args, chunk_size: int | None = None):
+    """Versão async de core.db.iter_query_frames: cursor server-side lido em blocos de chunk_size linhas."""
+    chunk_size = chunk_size or settings.STREAM_CHUNK_ROWS
+    pool = await init_async_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            stmt = await conn.prepare(dollar(query))
+            columns = [a.name for a in stmt.get_attributes()]
+            cur = await stmt.cursor(*args)
+            while True:
+                rows = await cur.fetch(chunk_size)
+                if not rows:
+                    break
+                yield _frame(rows, columns)
@@ -0,0 +1,81 @@
+import csv, io, math
+from datetime import datetime
+from typing import Iterable, NamedTuple, Sequence
+import numpy as np
+from psycopg2 import sql
+
+
+class UpsertResult(NamedTuple):
+    inserted: int
+    updated: int
+
+
+def _cell(v):
+    # None e float não finito viram NULL (campo vazio sem aspas no CSV do COPY)
+    if v is None:
+        return None
+    if isinstance(v, (float, np.floating)):
+        v = float(v)
+        return repr(v) if math.isfinite(v) else None
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+
+def copy_upsert(conn, table: str, columns: Sequence[str], rows: Iterable[tuple],
+                key: Sequence[str], update: Sequence[str] | None = None) -> UpsertResult:
+    """Upsert em lote: COPY FROM STDIN para uma tabela temporária e um único INSERT ... ON CONFLICT.
+
+    Sem `update` o conflito é ignorado (DO NOTHING); com `update` as colunas listadas são
+    sobrescritas (DO UPDATE). Linhas repetidas na mesma chave são consolidadas antes do COPY
+    (vale a primeira no DO NOTHING e a última no DO UPDATE, como no executemany).
+    Retorna quantas linhas foram inseridas e quantas atualizadas.
+    """
+    key_idx = [columns.index(k) for k in key]
+    unique: dict[tuple, tuple] = {}
+    for r in rows:
+        k = tuple(r[i] for i in key_idx)
+        if update or k not in unique:
+            unique[k] = r
+    if not unique:
+        return UpsertResult(0, 0)
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in unique.values():
+        writer.writerow([_cell(v) for v in r])
+    buf.seek(0)
+
+    stage = sql.Identifier(f"_stage_{table}")
+    cols = sql.SQL(",").join(map(sql.Identifier, columns))
+    if update:
+        on_conflict = sql.SQL("DO UPDATE SET ") + sql.SQL(",").join(
+            sql.SQL("{c} = EXCLUDED.{c}").format(c=sql.Identifier(c)) for c in update
+        )
+    else:
+        on_conflict = sql.SQL("DO NOTHING")
+
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL(
+            "CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+        ).format(stage=stage, table=sql.Identifier(table)))
+        cur.copy_expert(sql.SQL("COPY {stage} ({cols}) FROM STDIN WITH (FORMAT csv)").format(
+            stage=stage, cols=cols).as_string(conn), buf)
+        # xmax = 0 identifica linhas recém-inseridas; as demais vieram do DO UPDATE
+        cur.execute(sql.SQL(
+            """
+            WITH merged AS (
+              INSERT INTO {table} ({cols})
+              SELECT {cols} FROM {stage}
+              ON CONFLICT ({key}) {on_conflict}
+              RETURNING (xmax = 0) AS inserted
+            )
+            SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+            """
+        ).format(
+            table=sql.Identifier(table), cols=cols, stage=stage,
+            key=sql.SQL(",").join(map(sql.Identifier, key)), on_conflict=on_conflict,
+        ))
+        inserted, updated = cur.fetchone()
+        cur.execute(sql.SQL("DROP TABLE {stage}").format(stage=stage))
+    return UpsertResult(inserted, updated)
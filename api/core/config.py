@@ -8,20 +8,71 @@ class Settings:
     PG_PWD = os.getenv("PG_PWD")
     PG_HOST = os.getenv("PG_HOST")
     PG_PORT = int(os.getenv("PG_PORT"))
+    # Pool de conexões (por processo)
+    PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+    PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+    PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))
+    # Conexões ociosas há mais que isso são revalidadas com SELECT 1 antes do uso
+    PG_POOL_CHECK_SECS = float(os.getenv("PG_POOL_CHECK_SECS", "30"))
+    # Pool asyncpg das rotas de leitura (async)
+    PG_ASYNC_POOL_MAX = int(os.getenv("PG_ASYNC_POOL_MAX", "10"))
+    # Executores limitados: CPU (features/predict das rotas) e jobs bloqueantes (ingest/treino/backfill)
+    CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    # Timeout (s) do cliente HTTP assíncrono usado nas chamadas à Binance
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+    # Micro-batching do /predict: janela (ms) para juntar requisições concorrentes e tamanho máximo do lote
+    PREDICT_BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "1"))
+    PREDICT_BATCH_MAX_ROWS = int(os.getenv("PREDICT_BATCH_MAX_ROWS", "256"))
+    # Memória máxima (MB) do cache de respostas das rotas de leitura (/series/cached, /futures, /metrics)
+    RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "64"))
+    # Header Server-Timing com a duração das etapas (db_read, features, predict...) em cada resposta
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+    # Linhas por bloco lidas do cursor server-side nas respostas em streaming
+    STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "2000"))
 
     BINANCE_BASE = os.getenv("BINANCE_BASE")
     BINANCE_SYMBOL = os.getenv("BINANCE_SYMBOL")
     BINANCE_INTERVAL = os.getenv("BINANCE_INTERVAL")
     BINANCE_LIMIT = int(os.getenv("BINANCE_LIMIT"))
     BINANCE_API_KEY = os.getenv("BINANCE_API_KEY")
+    # Stream de klines por WebSocket: liga o consumidor contínuo (alternativa ao /ingest por polling)
+    BINANCE_WS_BASE = os.getenv("BINANCE_WS_BASE", "wss://stream.binance.com:9443")
+    KLINE_STREAM = os.getenv("KLINE_STREAM", "false").lower() in ("1", "true", "yes")
+    # Espera máxima (s) entre tentativas de reconexão do stream (backoff exponencial com jitter)
+    KLINE_STREAM_MAX_BACKOFF = float(os.getenv("KLINE_STREAM_MAX_BACKOFF", "60"))
+    # Tentativas de gravar um lote de candles do stream antes de descartá-lo (fica para o reparo de lacunas)
+    KLINE_STREAM_MAX_RETRIES = int(os.getenv("KLINE_STREAM_MAX_RETRIES", "5"))
+    # Mercados atendidos pelo processo ("BTCUSDT:5m,ETHUSDT:5m,ETHUSDT:1m"); vazio = só BINANCE_SYMBOL:BINANCE_INTERVAL
+    MARKETS = os.getenv("MARKETS", "")
+    # Workers do pool que roda treino/materialização/gravação de vários mercados ao mesmo tempo
+    MARKET_WORKERS = int(os.getenv("MARKET_WORKERS", "4"))
 
     LOOKBACK_DAYS = int(os.getenv("LOOKBACK_DAYS", "90"))
     ALPHA_DECAY = float(os.getenv("ALPHA_DECAY", "0.999"))
     REG_PATH = os.getenv("REG_PATH")
     CLS_PATH = os.getenv("CLS_PATH")
+    # Diretório versionado dos artefatos (padrão: <dir do REG_PATH>/versions) e quantas versões manter
+    MODEL_DIR = os.getenv("MODEL_DIR")
+    MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "5"))
+    # Intervalo mínimo entre verificações de mtime dos artefatos pelo registro de modelos
+    MODEL_CHECK_SECS = float(os.getenv("MODEL_CHECK_SECS", "5"))
+    # Treino incremental: rodadas extras sobre o booster anterior, periodicidade do retreino
+    # completo e piora tolerada do MAE de validação antes de cair para o completo
+    TRAIN_INCREMENTAL_ROUNDS = int(os.getenv("TRAIN_INCREMENTAL_ROUNDS", "50"))
+    TRAIN_FULL_EVERY_HOURS = float(os.getenv("TRAIN_FULL_EVERY_HOURS", "24"))
+    TRAIN_DEGRADE_TOL = float(os.getenv("TRAIN_DEGRADE_TOL", "0.05"))
+    # Threads totais para o treino (divididas entre os modelos treinados em paralelo); 0 = todos os núcleos
+    TRAIN_CPU_BUDGET = int(os.getenv("TRAIN_CPU_BUDGET", "0"))
+    # Rodadas sem melhora na validação temporal antes de parar o boosting (0 desliga)
+    TRAIN_EARLY_STOPPING_ROUNDS = int(os.getenv("TRAIN_EARLY_STOPPING_ROUNDS", "30"))
 
     BACKFILL_DAYS = int(os.getenv("BACKFILL_DAYS"))
     BACKFILL_SLEEP_MS = int(os.getenv("BACKFILL_SLEEP_MS"))
+    BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))
+    BACKFILL_MAX_RETRIES = int(os.getenv("BACKFILL_MAX_RETRIES", "5"))
+    # Orçamento de request weight por minuto (limite da Binance é 6000; deixamos folga)
+    BINANCE_WEIGHT_PER_MIN = int(os.getenv("BINANCE_WEIGHT_PER_MIN", "4800"))
 
     # Subcaminho quando servido atrás de proxy reverso (Traefik) ex.: /fase3
     API_ROOT_PATH = os.getenv("API_PATH_PREFIX", "")
@@ -1,11 +1,141 @@
+import threading, time
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import pool as pg_pool
 from core.config import settings
 
-def pg_conn():
-    return psycopg2.connect(
+class _Pool(pg_pool.ThreadedConnectionPool):
+    """O psycopg2 fecha, ao devolver, toda conexão acima de minconn; aqui mantemos até maxconn ociosas."""
+
+    def _putconn(self, conn, key=None, close=False):
+        minconn, self.minconn = self.minconn, self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
+
+
+# Pool único por processo, compartilhado por rotas, serviços e jobs.
+_pool: _Pool | None = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool levanta PoolError quando esgota; o semáforo faz o chamador esperar
+_slots: threading.BoundedSemaphore | None = None
+# id(conn) -> instante em que voltou ao pool (para decidir quando revalidar)
+_last_used: dict[int, float] = {}
+
+
+def _connect_kwargs() -> dict:
+    return dict(
         dbname=settings.PG_DB,
         user=settings.PG_USER,
         password=settings.PG_PWD,
         host=settings.PG_HOST,
         port=settings.PG_PORT,
     )
+
+
+def init_pool() -> _Pool:
+    """Cria o pool (idempotente). Chamado no startup da API; o primeiro pg_conn() também o cria."""
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = _Pool(
+                settings.PG_POOL_MIN, settings.PG_POOL_MAX, **_connect_kwargs()
+            )
+            _slots = threading.BoundedSemaphore(settings.PG_POOL_MAX)
+            _last_used.clear()
+        return _pool
+
+
+def connect():
+    """Conexão própria, fora do pool, para sessões longas (ex.: advisory locks de um job em execução)."""
+    return psycopg2.connect(**_connect_kwargs())
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
+
+
+def _healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < settings.PG_POOL_CHECK_SECS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def _checkout(p: _Pool):
+    # Descarta conexões mortas (restart do Postgres, idle timeout) e tenta de novo
+    for _ in range(settings.PG_POOL_MAX + 1):
+        conn = p.getconn()
+        if _healthy(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        p.putconn(conn, close=True)
+    raise psycopg2.OperationalError("Nenhuma conexão saudável disponível no pool.")
+
+
+@contextmanager
+def pg_conn():
+    """Empresta uma conexão do pool.
+
+    Faz commit ao sair normalmente, rollback em caso de exceção, e devolve a conexão ao pool.
+    Bloqueia até PG_POOL_TIMEOUT segundos quando todas as conexões estão em uso.
+    """
+    p = _pool if _pool is not None and not _pool.closed else init_pool()
+    slots = _slots
+    if not slots.acquire(timeout=settings.PG_POOL_TIMEOUT):
+        raise pg_pool.PoolError(f"Pool esgotado: {settings.PG_POOL_MAX} conexões em uso.")
+    try:
+        conn = _checkout(p)
+        try:
+            yield conn
+            if not conn.closed and not conn.autocommit:
+                conn.commit()
+        except BaseException:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            if not conn.closed and conn.autocommit:
+                conn.autocommit = False
+            _last_used[id(conn)] = time.monotonic()
+            if conn.closed:
+                _last_used.pop(id(conn), None)
+            p.putconn(conn, close=conn.closed)
+    finally:
+        slots.release()
+
+
+def iter_query_frames(query: str, params: tuple = (), chunk_size: int | None = None):
+    """Executa a query em um cursor nomeado (server-side) e produz DataFrames de até chunk_size linhas.
+
+    A memória fica limitada a um bloco por vez, independente do tamanho do resultado. A conexão
+    permanece emprestada enquanto o gerador estiver aberto e volta ao pool ao ser fechado.
+    """
+    import pandas as pd
+    chunk_size = chunk_size or settings.STREAM_CHUNK_ROWS
+    with pg_conn() as conn:
+        with conn.cursor(name="iter_query_frames") as cur:
+            cur.itersize = chunk_size
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(rows, columns=[d[0] for d in cur.description], coerce_float=True)
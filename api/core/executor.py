@@ -0,0 +1,31 @@
+import asyncio, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from core.config import settings
+
+# Trabalho de CPU das rotas (features, predict, montagem de pontos): poucos workers
+cpu_executor = ThreadPoolExecutor(max_workers=settings.CPU_WORKERS, thread_name_prefix="cpu")
+# Jobs bloqueantes e longos (ingest, treino, backfill, materialização): isolados dos gráficos
+job_executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix="job")
+# Treino/materialização/gravação por mercado dentro de um job (core.markets.run_markets)
+market_executor = ThreadPoolExecutor(max_workers=settings.MARKET_WORKERS, thread_name_prefix="market")
+
+
+def _submit(executor, fn, args, kwargs):
+    # Propaga os contextvars (ex.: job atual do core.jobs) para a thread, como asyncio.to_thread
+    ctx = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, partial(ctx.run, fn, *args, **kwargs))
+
+
+async def run_cpu(fn, *args, **kwargs):
+    return await _submit(cpu_executor, fn, args, kwargs)
+
+
+async def run_job(fn, *args, **kwargs):
+    return await _submit(job_executor, fn, args, kwargs)
+
+
+def shutdown_executors() -> None:
+    # Não espera jobs longos (ex.: backfill) no shutdown; as threads terminam o que já começaram
+    for ex in (cpu_executor, job_executor, market_executor):
+        ex.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,24 @@
+import httpx
+from core.config import settings
+
+# Cliente HTTP assíncrono compartilhado (keep-alive/conexões reaproveitadas entre requisições)
+_client: httpx.AsyncClient | None = None
+
+
+def http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        headers = {"X-MBX-APIKEY": settings.BINANCE_API_KEY} if settings.BINANCE_API_KEY else {}
+        _client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _client
+
+
+async def close_http() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,194 @@
+import asyncio, json, threading, time, zlib
+from contextvars import ContextVar
+from datetime import datetime
+from core import aiodb, db
+from core.db import pg_conn
+from core.executor import run_job
+from core.markets import job_scope
+
+# Linha de job_logs do job em execução no contexto atual (usado por log_job e report_progress)
+current_job: ContextVar[int | None] = ContextVar("current_job", default=None)
+
+# Intervalo mínimo entre gravações de progresso de um mesmo job
+PROGRESS_MIN_SECS = 1.0
+_progress_at: dict[int, float] = {}
+_progress_lock = threading.Lock()
+
+
+def ensure_table() -> None:
+    """Colunas de acompanhamento dos jobs assíncronos em job_logs (parâmetros, progresso, resultado)."""
+    with pg_conn() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                ALTER TABLE job_logs ADD COLUMN IF NOT EXISTS params JSONB;
+                ALTER TABLE job_logs ADD COLUMN IF NOT EXISTS result JSONB;
+                ALTER TABLE job_logs ADD COLUMN IF NOT EXISTS progress REAL;
+                ALTER TABLE job_logs ALTER COLUMN finished_at DROP NOT NULL;
+                CREATE INDEX IF NOT EXISTS job_logs_name_id_idx ON job_logs (job_name, id DESC);
+                """
+            )
+
+
+def report_progress(fraction: float, message: str | None = None) -> None:
+    """Atualiza o progresso (0..1) do job atual; sem job no contexto não faz nada."""
+    job_id = current_job.get()
+    if job_id is None:
+        return
+    now = time.monotonic()
+    with _progress_lock:
+        if fraction < 1 and now - _progress_at.get(job_id, 0.0) < PROGRESS_MIN_SECS:
+            return
+        _progress_at[job_id] = now
+    with pg_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE job_logs SET progress=%s, message=COALESCE(%s, message) WHERE id=%s",
+                (round(float(fraction), 4), message, job_id),
+            )
+
+
+def _lock_key(key: str) -> int:
+    return zlib.crc32(f"btcml:{key}".encode())
+
+
+# Resultado de _run_locked quando outro processo detém algum dos locks
+_SKIPPED = object()
+SKIPPED_MESSAGE = "Job da mesma chave já em execução em outro processo"
+RUNNING_SQL = "UPDATE job_logs SET status='running', started_at=%s WHERE id=%s"
+
+
+def _run_locked(job_id: int, locks: list[int], fn, args, kwargs):
+    """Corpo de um job sync, já na thread do executor de jobs.
+
+    Os advisory locks são pegos só agora, que o job tem slot, em uma sessão própria (fora dos
+    pools); fechar a sessão libera todos eles, inclusive os pegos antes de um que falhou.
+    """
+    conn = db.connect()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for lock in locks:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (lock,))
+                if not cur.fetchone()[0]:
+                    return _SKIPPED
+            cur.execute(RUNNING_SQL, (datetime.utcnow(), job_id))
+        return fn(*args, **kwargs)
+    finally:
+        conn.close()
+
+
+async def _run_locked_async(job_id: int, locks: list[int], fn, args, kwargs):
+    """Como _run_locked, para jobs coroutine: sessão asyncpg própria, aberta só ao começar."""
+    conn = await aiodb.connect()
+    try:
+        for lock in locks:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", lock):
+                return _SKIPPED
+        await conn.execute(aiodb.dollar(RUNNING_SQL), datetime.utcnow(), job_id)
+        return await fn(*args, **kwargs)
+    finally:
+        await conn.close()
+
+
+class JobRunner:
+    """Executa jobs pesados (ingest, treino, backfill, materialização) fora da requisição.
+
+    submit() grava a linha em job_logs e devolve o id na hora. A chave (core.markets.job_key) vale
+    pelo nome e pelos mercados que cobre, e cada (nome, mercado) roda no máximo uma vez por vez:
+    dentro do processo, um disparo cujos mercados já estão todos em um job do mesmo nome na fila
+    ou em execução é unido a ele (coalesced); se só parte deles está, o novo job espera os que se
+    sobrepõem terminarem. Entre processos/réplicas, advisory locks do Postgres por (nome, mercado)
+    garantem o single-flight (o segundo termina como 'skipped'): são pegos em uma sessão própria só
+    quando o job sai da fila do executor, então jobs na fila não seguram conexão nem aparecem como
+    'running'. O job atualiza a própria linha (log_job, report_progress) via current_job.
+    """
+
+    def __init__(self):
+        # id do job → (nome, mercados, task); sai daqui quando a task termina
+        self._active: dict[int, tuple[str, frozenset, asyncio.Task]] = {}
+
+    async def submit(self, key: str, fn, *args, params: dict | None = None, **kwargs) -> tuple[int, asyncio.Task, bool]:
+        """Agenda fn(*args, **kwargs) (sync no executor de jobs, ou coroutine). Retorna (id, task, coalesced)."""
+        name, markets = job_scope(key)
+        overlapping = []
+        for job_id, (n, covered, task) in self._active.items():
+            if n != name or task.done():
+                continue
+            if markets <= covered:
+                return job_id, task, True
+            if markets & covered:
+                overlapping.append(task)
+        row = await aiodb.fetchrow(
+            """
+            INSERT INTO job_logs(job_name, status, message, started_at, params, progress)
+            VALUES (%s, 'queued', NULL, %s, %s, 0) RETURNING id
+            """,
+            name, datetime.utcnow(), params or {},
+        )
+        job_id = row[0]
+        task = asyncio.create_task(self._run(job_id, name, markets, fn, args, kwargs, overlapping))
+        self._active[job_id] = (name, markets, task)
+        task.add_done_callback(lambda _: self._active.pop(job_id, None))
+        return job_id, task, False
+
+    async def _run(self, job_id: int, name: str, markets: frozenset, fn, args, kwargs, after: list):
+        current_job.set(job_id)
+        locks = sorted(_lock_key(f"{name}:{m}") for m in markets)
+        try:
+            if after:
+                # Mesmos mercados em outro job deste processo: fica na fila até ele terminar
+                await asyncio.wait(after)
+            if asyncio.iscoroutinefunction(fn):
+                result = await _run_locked_async(job_id, locks, fn, args, kwargs)
+            else:
+                result = await run_job(_run_locked, job_id, locks, fn, args, kwargs)
+            if result is _SKIPPED:
+                await self._finish(job_id, "skipped", SKIPPED_MESSAGE, None)
+                return {"status": "skipped", "job_id": job_id}
+            status = "error" if isinstance(result, dict) and result.get("status") == "error" else "ok"
+            await self._finish(job_id, status, None, result)
+            return result
+        except asyncio.CancelledError:
+            # Desligamento do processo (shutdown) com o job na fila ou em andamento: a linha não fica 'running'
+            try:
+                await self._finish(job_id, "cancelled", "Job cancelado (encerramento do processo)", None)
+            except Exception:
+                pass  # o cancelamento prevalece sobre a falha ao registrar
+            raise
+        except Exception as e:
+            await self._finish(job_id, "error", str(e), None)
+            return {"status": "error", "message": str(e), "job_id": job_id}
+        finally:
+            with _progress_lock:
+                _progress_at.pop(job_id, None)
+
+    async def shutdown(self) -> None:
+        """Cancela os jobs na fila e em andamento e espera suas linhas serem fechadas (antes de fechar os pools).
+
+        Um job sync já em execução não é interrompido na thread; só deixa de ser acompanhado.
+        """
+        tasks = [task for _, _, task in self._active.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _finish(self, job_id: int, status: str, message: str | None, result) -> None:
+        # log_job (chamado pelo próprio serviço) pode já ter fechado a linha com status/mensagem
+        await aiodb.fetch(
+            """
+            UPDATE job_logs SET
+              status = CASE WHEN status IN ('queued','running') THEN %s ELSE status END,
+              message = COALESCE(%s, message),
+              result = %s,
+              progress = CASE WHEN %s = 'ok' THEN 1 ELSE progress END,
+              finished_at = COALESCE(finished_at, %s)
+            WHERE id = %s
+            """,
+            status, message, json.loads(json.dumps(result, default=str)) if result is not None else None,
+            status, datetime.utcnow(), job_id,
+        )
+
+
+job_runner = JobRunner()
@@ -1,9 +1,22 @@
 from datetime import datetime
 from core.db import pg_conn
+from core.jobs import current_job
+from core.telemetry import JOB_DURATION
 
 def log_job(job_name: str, status: str, message: str, started_at: datetime, finished_at: datetime):
+    JOB_DURATION.observe(max((finished_at - started_at).total_seconds(), 0.0), job_name, status)
+    # Dentro de um job do core.jobs, fecha a própria linha (criada no submit) em vez de inserir outra
+    job_id = current_job.get()
     with pg_conn() as conn:
         with conn.cursor() as cur:
+            if job_id is not None:
+                cur.execute(
+                    """UPDATE job_logs SET status=%s, message=%s, started_at=%s, finished_at=%s
+                       WHERE id=%s AND job_name=%s;""",
+                    (status, message, started_at, finished_at, job_id, job_name)
+                )
+                if cur.rowcount:
+                    return
             cur.execute(
                 """INSERT INTO job_logs(job_name, status, message, started_at, finished_at)
                    VALUES (%s,%s,%s,%s,%s);""",
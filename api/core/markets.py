@@ -0,0 +1,153 @@
+import contextvars
+from typing import NamedTuple, Optional
+from fastapi import HTTPException, Query
+from core.config import settings
+from core.executor import market_executor
+
+
+class Market(NamedTuple):
+    """Par (símbolo, intervalo) da Binance: a chave de candles, futures, series_cache e modelos."""
+    symbol: str
+    interval: str
+
+    @property
+    def key(self) -> str:
+        # Mesmo formato da chave de feature_state ("BTCUSDT:5m")
+        return f"{self.symbol}:{self.interval}"
+
+    @property
+    def slug(self) -> str:
+        return f"{self.symbol}_{self.interval}"
+
+
+# Mercado das configurações antigas (BINANCE_SYMBOL/BINANCE_INTERVAL): linhas sem símbolo migram para ele
+DEFAULT_MARKET = Market(settings.BINANCE_SYMBOL, settings.BINANCE_INTERVAL)
+
+
+def parse_markets(spec: str | None) -> list[Market]:
+    """'BTCUSDT:5m,ETHUSDT:5m,ETHUSDT:1m' → [Market, ...]; vazio → só o mercado padrão."""
+    out = []
+    for item in (spec or "").replace(" ", "").split(","):
+        if not item:
+            continue
+        symbol, _, interval = item.partition(":")
+        m = Market(symbol.upper(), interval or DEFAULT_MARKET.interval)
+        if m not in out:
+            out.append(m)
+    return out or [DEFAULT_MARKET]
+
+
+MARKETS = parse_markets(settings.MARKETS)
+
+
+def select_markets(symbol: str | None = None, interval: str | None = None) -> list[Market]:
+    """Mercados configurados que casam com o filtro (sem filtro, todos). ValueError se nenhum casar."""
+    sel = [m for m in MARKETS
+           if (symbol is None or m.symbol == symbol.upper()) and (interval is None or m.interval == interval)]
+    if not sel:
+        raise ValueError(f"Mercado não configurado: {symbol or '*'} {interval or '*'} (MARKETS={settings.MARKETS or DEFAULT_MARKET.key})")
+    return sel
+
+
+def resolve_market(symbol: str | None = None, interval: str | None = None) -> Market:
+    """Um mercado configurado: sem símbolo, o padrão; sem intervalo, o primeiro configurado para o símbolo."""
+    if symbol is None and interval is None:
+        return DEFAULT_MARKET
+    return select_markets(symbol or DEFAULT_MARKET.symbol, interval)[0]
+
+
+def market_param(
+    symbol: Optional[str] = Query(None, description="Símbolo da Binance (padrão BINANCE_SYMBOL); precisa estar em MARKETS"),
+    interval: Optional[str] = Query(None, description="Intervalo dos candles (padrão: o primeiro configurado para o símbolo)"),
+) -> Market:
+    """Dependência das rotas de leitura: mercado pedido na query string (404 se não configurado)."""
+    try:
+        return resolve_market(symbol, interval)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def markets_param(
+    symbol: Optional[str] = Query(None, description="Restringe a um símbolo (padrão: todos os mercados de MARKETS)"),
+    interval: Optional[str] = Query(None, description="Restringe a um intervalo"),
+) -> list[Market]:
+    """Dependência dos jobs (ingest, treino, rebuild): mercados selecionados (sem filtro, todos)."""
+    try:
+        return select_markets(symbol, interval)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def job_key(name: str, markets: list[Market]) -> str:
+    """Chave de single-flight do job: o nome puro quando cobre todos os mercados configurados."""
+    if set(markets) == set(MARKETS):
+        return name
+    return f"{name}:{','.join(m.key for m in markets)}"
+
+
+def job_scope(key: str) -> tuple[str, frozenset]:
+    """(nome, chaves dos mercados cobertos) de uma chave de job_key; o nome puro cobre todos os mercados."""
+    name, _, keys = key.partition(":")
+    return name, frozenset(keys.split(",")) if keys else frozenset(m.key for m in MARKETS)
+
+
+def run_markets(fn, markets: list[Market], *args, **kwargs) -> dict:
+    """fn(*args, market=m, **kwargs) para cada mercado, em paralelo no market_executor.
+
+    Com um único mercado roda na própria thread e devolve o resultado de fn como está (mesmo
+    formato de antes dos mercados); com vários, devolve {"status", "markets": {chave: resultado}}
+    com status "error" se algum mercado falhou. Cada mercado roda sem o job atual no contexto,
+    então log_job grava uma linha própria por mercado em vez de sobrescrever a do job.
+    """
+    from core.jobs import current_job
+    if len(markets) == 1:
+        return fn(*args, market=markets[0], **kwargs)
+
+    def one(m):
+        ctx = contextvars.copy_context()
+        ctx.run(current_job.set, None)
+        return ctx.run(fn, *args, market=m, **kwargs)
+
+    futures = {m: market_executor.submit(one, m) for m in markets}
+    results = {}
+    for m, fut in futures.items():
+        try:
+            results[m.key] = fut.result()
+        except Exception as e:
+            results[m.key] = {"status": "error", "message": str(e)}
+    failed = any(isinstance(r, dict) and r.get("status") == "error" for r in results.values())
+    return {"status": "error" if failed else "ok", "markets": results}
+
+
+def _primary_key(cur, table: str) -> tuple[str | None, list[str]]:
+    cur.execute(
+        """
+        SELECT c.conname, array_agg(a.attname::text ORDER BY k.ord)
+        FROM pg_constraint c
+        CROSS JOIN unnest(c.conkey) WITH ORDINALITY k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+        WHERE c.conrelid = %s::regclass AND c.contype = 'p'
+        GROUP BY c.conname
+        """,
+        (table,),
+    )
+    row = cur.fetchone()
+    return (row[0], list(row[1])) if row else (None, [])
+
+
+def migrate_market_key(cur, table: str) -> None:
+    """Leva uma tabela chaveada só por time para a chave (symbol, interval, time).
+
+    As linhas existentes ficam com o mercado padrão. Idempotente: sem efeito quando a tabela já
+    tem a chave nova. Roda no ensure_table de cada serviço (cursor em autocommit).
+    """
+    from psycopg2 import sql
+    t = sql.Identifier(table)
+    for col, default in (("symbol", DEFAULT_MARKET.symbol), ("interval", DEFAULT_MARKET.interval)):
+        cur.execute(sql.SQL("ALTER TABLE {t} ADD COLUMN IF NOT EXISTS {c} TEXT NOT NULL DEFAULT {d}").format(
+            t=t, c=sql.Identifier(col), d=sql.Literal(default)))
+        cur.execute(sql.SQL("ALTER TABLE {t} ALTER COLUMN {c} DROP DEFAULT").format(t=t, c=sql.Identifier(col)))
+    name, cols = _primary_key(cur, table)
+    if cols != ["symbol", "interval", "time"]:
+        drop = sql.SQL("DROP CONSTRAINT {n}, ").format(n=sql.Identifier(name)) if name else sql.SQL("")
+        cur.execute(sql.SQL("ALTER TABLE {t} {drop}ADD PRIMARY KEY (symbol, interval, time)").format(t=t, drop=drop))
@@ -0,0 +1,63 @@
+import asyncio, threading, time
+from core.config import settings
+
+
+class TokenBucket:
+    """Limitador token-bucket compartilhado entre threads.
+
+    Modela o orçamento de request weight da Binance: `capacity` pesos por `period` segundos,
+    reabastecidos continuamente. acquire(peso) bloqueia até haver saldo. pause(s) suspende
+    todos os chamadores (ex.: Retry-After de um 429/418) e sync_used() alinha o saldo local com
+    o peso já consumido informado pela exchange (header X-MBX-USED-WEIGHT-1M).
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, tokens: float) -> float:
+        """Debita `tokens` e devolve 0, ou devolve quanto esperar antes de tentar de novo."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        tokens = min(tokens, self.capacity)
+        while (wait := self._reserve(tokens)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0) -> None:
+        """Como acquire(), mas espera sem bloquear o event loop."""
+        tokens = min(tokens, self.capacity)
+        while (wait := self._reserve(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = now
+
+    def sync_used(self, used: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, max(0.0, self.capacity - used))
+
+
+# Orçamento único do processo para chamadas REST à Binance
+binance_limiter = TokenBucket(settings.BINANCE_WEIGHT_PER_MIN, 60.0)
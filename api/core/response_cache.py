@@ -0,0 +1,164 @@
+import asyncio, hashlib, json, threading, time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request
+from fastapi.responses import Response
+from core import aiodb
+from core.config import settings
+from core.executor import run_cpu
+from core.markets import Market, DEFAULT_MARKET
+
+# Estado barato dos dados do mercado servidos pelas rotas de leitura: só buscas pelo índice das PKs
+STATE_QUERY = """
+SELECT (SELECT MAX(time) FROM btc_candles WHERE symbol = %s AND interval = %s),
+       (SELECT MAX(time) FROM futures WHERE symbol = %s AND interval = %s),
+       (SELECT model_version FROM series_cache WHERE symbol = %s AND interval = %s ORDER BY time DESC LIMIT 1)
+"""
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    etag: str
+    last_modified: float
+    body: bytes
+    media_type: str
+
+
+class ResponseCache:
+    """Respostas já serializadas das rotas de leitura, em LRU limitado por bytes.
+
+    A chave é (rota, parâmetros); cada entrada guarda o ETag do estado dos dados em que foi
+    gerada (último candle, última previsão em futures, versão do modelo publicado e versão da
+    série materializada). Uma entrada só é servida se o ETag do estado atual for o mesmo;
+    invalidate() (chamado por ingest, treino e materialização) descarta tudo de uma vez.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self._size = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.not_modified = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: tuple, etag: str) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.etag != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+
+
+response_cache = ResponseCache(int(settings.RESPONSE_CACHE_MB * 1024 * 1024))
+
+# Montagens em andamento por (chave, etag): polls simultâneos no mesmo estado esperam a mesma
+_building: dict[tuple, asyncio.Task] = {}
+
+
+async def data_state(market: Market = DEFAULT_MARKET) -> tuple:
+    from ml.registry import registry_for
+    row = await aiodb.fetchrow(STATE_QUERY, *market, *market, *market)
+    return (response_cache.generation, await registry_for(market).published_async(), *(tuple(row) if row else ()))
+
+
+def _etag(key: tuple, state: tuple) -> str:
+    digest = hashlib.blake2b(repr((key, state)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or etag[2:] in tags
+
+
+def _not_modified_since(header: str | None, last_modified: float) -> bool:
+    if not header:
+        return False
+    try:
+        return int(last_modified) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _headers(etag: str, last_modified: float | None) -> dict:
+    # no-cache: o navegador pode guardar, mas revalida a cada poll (If-None-Match → 304)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def _json_bytes(payload) -> bytes:
+    # Mesma serialização do JSONResponse do Starlette
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+async def json_response(payload) -> Response:
+    return Response(await run_cpu(_json_bytes, payload), media_type="application/json")
+
+
+async def conditional(request: Request, endpoint: str, params: tuple, render, store: bool = True,
+                      market: Market = DEFAULT_MARKET) -> Response:
+    """Responde `render()` (coroutine que devolve uma Response) com ETag/Last-Modified.
+
+    If-None-Match (ou If-Modified-Since) com o estado atual devolve 304 sem montar nada; senão
+    serve a resposta guardada para o estado atual ou monta, guarda e serve. Com store=False
+    (respostas em streaming) só vale a revalidação: a resposta recebe o ETag e não é guardada.
+    O ETag segue o estado do `market` da rota.
+    """
+    key = (endpoint, market.key, params)
+    etag = _etag(key, await data_state(market))
+    entry = response_cache.get(key, etag) if store else None
+    last_modified = entry.last_modified if entry is not None else None
+    inm = request.headers.get("if-none-match")
+    if _matches(inm, etag) or (inm is None and entry is not None
+                               and _not_modified_since(request.headers.get("if-modified-since"), last_modified)):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=_headers(etag, last_modified))
+    if not store:
+        response = await render()
+        response.headers.update(_headers(etag, None))
+        return response
+    if entry is None:
+        build = _building.get((key, etag))
+        if build is None:
+            build = _building[(key, etag)] = asyncio.ensure_future(render())
+            build.add_done_callback(lambda _: _building.pop((key, etag), None))
+        response = await asyncio.shield(build)
+        entry = CachedResponse(etag, time.time(), bytes(response.body), response.media_type)
+        response_cache.put(key, entry)
+    return Response(entry.body, media_type=entry.media_type, headers=_headers(etag, entry.last_modified))
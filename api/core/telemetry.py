@@ -0,0 +1,157 @@
+import threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from core.config import settings
+
+# Limites (s) dos buckets de latência: de 1 ms (uma leitura pequena) a 10 min (um treino completo)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, le=None) -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Histograma cumulativo no formato de exposição do Prometheus (buckets `le`, _sum e _count) por labels."""
+
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    s[0][i] += 1
+                    break
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for values, counts, total, n in series:
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {acc}")
+            out.append(f"{self.name}_bucket{_labels(self.labels, values, '+Inf')} {n}")
+            out.append(f"{self.name}_sum{_labels(self.labels, values)} {total}")
+            out.append(f"{self.name}_count{_labels(self.labels, values)} {n}")
+        return out
+
+
+def render_samples(name: str, kind: str, help: str, samples: list[tuple[dict, float]]) -> list[str]:
+    """Contador/gauge lido na hora do scrape (ex.: estatísticas do cache de respostas)."""
+    out = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        out.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return out
+
+
+HTTP_DURATION = Histogram("btcml_http_request_duration_seconds", "Duração das requisições HTTP por rota.",
+                          ("method", "route", "status"))
+STAGE_DURATION = Histogram("btcml_stage_duration_seconds", "Duração das etapas (leitura, features, modelo, predict, montagem, gravação) por operação.",
+                           ("op", "stage"))
+JOB_DURATION = Histogram("btcml_job_duration_seconds", "Duração dos jobs registrados em job_logs.", ("job", "status"))
+
+class RequestTimings:
+    """Soma das etapas de uma requisição (para o Server-Timing).
+
+    As etapas chegam também das threads dos executores (o contexto é copiado, o objeto é o mesmo)
+    e podem terminar ao mesmo tempo: a soma é feita sob lock.
+    """
+
+    def __init__(self):
+        self._stages: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, secs: float) -> None:
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + secs
+
+    def items(self) -> list[tuple[str, float]]:
+        with self._lock:
+            return list(self._stages.items())
+
+
+# Operação atual (series_data, build_series_cache, train_job...) e etapas da requisição para o Server-Timing.
+# Propagam para o executor junto com o contexto (core.executor copia os contextvars).
+_op: ContextVar[str | None] = ContextVar("telemetry_op", default=None)
+_timings: ContextVar[RequestTimings | None] = ContextVar("server_timing", default=None)
+
+
+@contextmanager
+def operation(name: str):
+    """Nomeia a operação das etapas medidas dentro do bloco (também serve como decorador)."""
+    token = _op.set(name)
+    try:
+        yield
+    finally:
+        _op.reset(token)
+
+
+@contextmanager
+def span(stage: str, op: str | None = None):
+    """Mede uma etapa: histograma por (operação, etapa) e, na requisição atual, o Server-Timing."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_DURATION.observe(dt, op or _op.get() or "other", stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings.add(stage, dt)
+
+
+class TimingMiddleware:
+    """Middleware ASGI: duração de cada requisição por rota (template, não a URL) e o header Server-Timing.
+
+    A duração vai até o fim do corpo (inclui respostas em streaming); o Server-Timing sai com os
+    headers, então soma as etapas concluídas até ali mais o total da aplicação.
+    """
+
+    def __init__(self, app, server_timing: bool | None = None):
+        self.app = app
+        self.server_timing = settings.SERVER_TIMING if server_timing is None else server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    total = (time.perf_counter() - t0) * 1e3
+                    value = ", ".join([f"{k};dur={v * 1e3:.1f}" for k, v in timings.items()] + [f"app;dur={total:.1f}"])
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
+            route = scope.get("route")
+            HTTP_DURATION.observe(time.perf_counter() - t0, scope["method"], getattr(route, "path", "unmatched"), str(status))
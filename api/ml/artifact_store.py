@@ -0,0 +1,154 @@
+import json, os, secrets, shutil, threading
+from datetime import datetime, timezone
+from core.config import settings
+from core.markets import Market, DEFAULT_MARKET
+from ml.model_paths import MODEL_DIR
+
+# Arquivo com o nome da versão publicada (trocado atomicamente com os.replace)
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ArtifactStore:
+    """Diretório versionado de modelos.
+
+    Cada treino grava <root>/<versão>/ com um booster por modelo no formato binário nativo do
+    XGBoost (.ubj) e um manifest.json (features, split, métricas, melhores iterações). A versão é
+    montada em um diretório temporário, renomeada de uma vez e só então publicada trocando o
+    arquivo CURRENT; leitores resolvem CURRENT e carregam aquela versão inteira, então nunca veem
+    um arquivo pela metade nem regressores e classificador de treinos diferentes.
+    """
+
+    def __init__(self, root: str, keep: int):
+        self.root = root
+        self.keep = keep
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def current(self) -> str | None:
+        try:
+            with open(self._path(CURRENT)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self) -> list[str]:
+        """Versões completas (com manifest), da mais antiga para a mais nova."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if not n.startswith(".") and os.path.isfile(self._path(n, MANIFEST)))
+
+    def manifest(self, version: str) -> dict:
+        with open(self._path(version, MANIFEST)) as f:
+            return json.load(f)
+
+    def load(self, version: str):
+        """Carrega (regressores por alvo, classificador, manifest) de uma versão."""
+        from xgboost import XGBRegressor, XGBClassifier
+        manifest = self.manifest(version)
+        def load_model(kind, name):
+            model = kind()
+            model.load_model(self._path(version, manifest["files"][name]))
+            return model
+        reg_models = {t: load_model(XGBRegressor, t) for t in manifest["targets"]}
+        cls = load_model(XGBClassifier, manifest["classifier"])
+        return reg_models, cls, manifest
+
+    def publish(self, reg_models: dict, cls, cls_name: str, manifest: dict) -> str:
+        """Grava uma nova versão e a torna a atual. Retorna o nome da versão."""
+        os.makedirs(self.root, exist_ok=True)
+        now = datetime.now(timezone.utc)
+        version = f"{now:%Y%m%dT%H%M%S}-{secrets.token_hex(3)}"
+        tmp = self._path(f".tmp-{version}")
+        os.makedirs(tmp)
+        try:
+            files = {}
+            for name, model in [*reg_models.items(), (cls_name, cls)]:
+                files[name] = f"{name}.ubj"
+                model.get_booster().save_model(os.path.join(tmp, files[name]))
+            manifest = {
+                **manifest,
+                "version": version,
+                "published_at": now.isoformat(),
+                "targets": list(reg_models),
+                "classifier": cls_name,
+                "files": files,
+            }
+            with open(os.path.join(tmp, MANIFEST), "w") as f:
+                json.dump(manifest, f, indent=2, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            _fsync_dir(tmp)
+            os.rename(tmp, self._path(version))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.set_current(version)
+        self.prune()
+        return version
+
+    def set_current(self, version: str) -> None:
+        if version not in self.versions():
+            raise FileNotFoundError(f"Versão inexistente: {version}")
+        tmp = self._path(f".{CURRENT}.{secrets.token_hex(4)}")
+        with open(tmp, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(CURRENT))
+        _fsync_dir(self.root)
+
+    def rollback(self, version: str | None = None) -> str:
+        """Republica `version` (ou a versão anterior à atual) sem retreinar."""
+        if version is None:
+            versions = self.versions()
+            cur = self.current()
+            older = [v for v in versions if cur is None or v < cur]
+            if not older:
+                raise FileNotFoundError("Não há versão anterior para rollback")
+            version = older[-1]
+        self.set_current(version)
+        return version
+
+    def prune(self) -> list[str]:
+        """Remove as versões mais antigas além de `keep` (nunca a atual) e sobras de publicações interrompidas."""
+        cur = self.current()
+        versions = self.versions()
+        drop = [v for v in versions[:max(0, len(versions) - self.keep)] if v != cur]
+        for v in drop:
+            shutil.rmtree(self._path(v), ignore_errors=True)
+        for n in os.listdir(self.root):
+            if n.startswith(".tmp-") and n[len(".tmp-"):] < (cur or ""):
+                shutil.rmtree(self._path(n), ignore_errors=True)
+        return drop
+
+
+artifact_store = ArtifactStore(MODEL_DIR, settings.MODEL_KEEP_VERSIONS)
+
+# Demais mercados: um diretório por mercado dentro de MODEL_DIR (<MODEL_DIR>/ETHUSDT_5m/<versão>/)
+_stores: dict[Market, ArtifactStore] = {DEFAULT_MARKET: artifact_store}
+_stores_lock = threading.Lock()
+
+
+def store_for(market: Market = DEFAULT_MARKET) -> ArtifactStore:
+    store = _stores.get(market)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(market, ArtifactStore(os.path.join(MODEL_DIR, market.slug), settings.MODEL_KEEP_VERSIONS))
+    return store
@@ -3,13 +3,37 @@ import pandas as pd
 
 FEATURE_COLS = ["close","ret","acc","amp","vol_rel"]
 TARGET_REG_COLS = ["open_next","high_next","low_next","close_next","amp_next"]
+# Janela do volume relativo
+VOL_WINDOW = 10
 
-def build_features_targets(df: pd.DataFrame):
+def segment_positions(times: pd.Series):
+    """Posição de cada candle no seu trecho contíguo e se ele é o último do trecho.
+
+    O passo é a menor diferença entre candles consecutivos (a grade do intervalo); qualquer
+    diferença maior é uma lacuna. Retorna None quando não há lacunas.
+    """
+    if len(times) < 2:
+        return None
+    gap = times.diff()
+    brk = gap.ne(gap[gap > pd.Timedelta(0)].min()).to_numpy()
+    if brk.sum() <= 1:
+        return None
+    idx = np.arange(len(brk))
+    pos = idx - np.maximum.accumulate(np.where(brk, idx, 0))
+    last = np.append(brk[1:], True)
+    return pos, last
+
+def add_features_targets(df: pd.DataFrame) -> pd.DataFrame:
+    """Todas as linhas de df com features e alvos do próximo candle.
+
+    Ficam NaN onde não há histórico suficiente (início da janela ou de cada trecho depois de
+    uma lacuna) e, nos alvos, onde o próximo candle não é o seguinte da grade (fim de trecho).
+    """
     df = df.copy()
     df["ret"] = df["close"].pct_change()
     df["acc"] = df["ret"].diff()
     df["amp"] = df["high"] - df["low"]
-    df["vol_rel"] = df["volume"] / df["volume"].rolling(10).mean()
+    df["vol_rel"] = df["volume"] / df["volume"].rolling(VOL_WINDOW).mean()
 
     df["open_next"]  = df["open"].shift(-1)
     df["high_next"]  = df["high"].shift(-1)
@@ -18,7 +42,26 @@ def build_features_targets(df: pd.DataFrame):
     df["amp_next"]   = (df["high"].shift(-1) - df["low"].shift(-1))
     df["dir_next"]   = (df["close"].shift(-1) > df["close"]).astype(int)
 
-    df = df.dropna().reset_index(drop=True)
+    # Lacunas em btc_candles: ret/acc/vol_rel e os alvos do próximo candle não atravessam o buraco
+    seg = segment_positions(df["time"]) if "time" in df else None
+    if seg is not None:
+        pos, last = seg
+        df.loc[pos < 1, "ret"] = np.nan
+        df.loc[pos < 2, "acc"] = np.nan
+        df.loc[pos < VOL_WINDOW - 1, "vol_rel"] = np.nan
+        df.loc[last, TARGET_REG_COLS] = np.nan
+    # Sem próximo candle (último da janela ou do trecho) a direção também não existe
+    df["dir_next"] = df["dir_next"].where(df["close_next"].notna())
+    return df
+
+def feature_rows(df: pd.DataFrame) -> np.ndarray:
+    """Máscara das linhas de add_features_targets com todas as features (as que podem ser previstas)."""
+    return df[FEATURE_COLS].notna().all(axis=1).to_numpy()
+
+def build_features_targets(df: pd.DataFrame):
+    """Linhas de treino: features e alvos completos (add_features_targets sem os NaN)."""
+    df = add_features_targets(df).dropna().reset_index(drop=True)
+    df["dir_next"] = df["dir_next"].astype(int)
     X = df[FEATURE_COLS].copy()
     Yreg = df[TARGET_REG_COLS].copy()
     Ycls = df["dir_next"].copy()
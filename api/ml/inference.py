@@ -0,0 +1,119 @@
+import os, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from core.markets import MARKETS
+from ml.features import FEATURE_COLS, TARGET_REG_COLS
+
+# Colunas da matriz de saída (float32): os cinco regressores, as probabilidades e a direção (0/1)
+OUTPUT_COLS = TARGET_REG_COLS + ["prob_up", "prob_down", "dir_next"]
+PROB_UP, PROB_DOWN, DIR_NEXT = (OUTPUT_COLS.index(c) for c in ("prob_up", "prob_down", "dir_next"))
+N_MODELS = len(TARGET_REG_COLS) + 1
+
+# Abaixo disso o custo de despachar para as threads supera o ganho de rodar os modelos em paralelo
+PARALLEL_MIN_ROWS = 2048
+_CORES = os.cpu_count() or 1
+_pool = ThreadPoolExecutor(max_workers=min(N_MODELS, _CORES), thread_name_prefix="infer") if _CORES > 1 else None
+
+
+def _engine_booster(model):
+    """Booster usado pela engine. Em paralelo, cada um fica com sua fatia dos núcleos
+    (evita N_MODELS × todos os núcleos), numa cópia: o modelo do snapshot é compartilhado com
+    futures e treino, que seguem com todas as threads."""
+    booster = model.get_booster()
+    if _pool is None:
+        return booster
+    booster = booster.copy()
+    booster.set_param({"nthread": max(1, _CORES // N_MODELS)})
+    return booster
+
+
+def _iteration_range(model) -> tuple:
+    # Mesmo corte do XGBModel.predict: até a melhor iteração quando houve early stopping no objeto
+    best = getattr(model, "best_iteration", None)
+    return (0, best + 1) if best is not None else (0, 0)
+
+
+class InferenceEngine:
+    """Passada única de inferência dos modelos de um snapshot do registro.
+
+    As features viram um único buffer float32 contíguo (na ordem em que os modelos foram
+    treinados) e cada booster roda inplace_predict sobre ele, escrevendo na sua coluna de uma
+    matriz pré-alocada; com muitas linhas os seis modelos rodam em paralelo (o XGBoost libera o
+    GIL). O classificador é percorrido uma vez só: dir_next sai de prob_up com a mesma regra do
+    XGBClassifier.predict (prob_up > 0.5) e prob_down = 1 - prob_up, como no predict_proba.
+    """
+
+    def __init__(self, reg_bundle, cls, version: str | None = None):
+        self.version = version
+        cols = reg_bundle.get("feature_cols", FEATURE_COLS) if isinstance(reg_bundle, dict) else FEATURE_COLS
+        self.feature_cols = list(cols)
+        self._order = None if self.feature_cols == FEATURE_COLS else [FEATURE_COLS.index(c) for c in self.feature_cols]
+        if isinstance(reg_bundle, dict) and "models" in reg_bundle:
+            models = reg_bundle["models"]
+            self._regs = [
+                (j, _engine_booster(models[t]), _iteration_range(models[t])) if models.get(t) is not None else (j, None, None)
+                for j, t in enumerate(TARGET_REG_COLS)
+            ]
+            self._legacy = None
+        else:
+            # Formato antigo: um único modelo multi-saída
+            self._regs, self._legacy = [], reg_bundle
+        self._cls = (PROB_UP, _engine_booster(cls), _iteration_range(cls))
+
+    def features(self, X) -> np.ndarray:
+        """DataFrame (com as colunas de features) ou array em FEATURE_COLS → buffer float32 contíguo."""
+        if isinstance(X, pd.DataFrame):
+            return np.ascontiguousarray(X[self.feature_cols].to_numpy(dtype=np.float32))
+        X = np.asarray(X, dtype=np.float32)
+        if self._order is not None:
+            X = X[:, self._order]
+        return np.ascontiguousarray(X)
+
+    def predict(self, X) -> np.ndarray:
+        """Matriz n × OUTPUT_COLS (float32) com todos os alvos, em uma passada por modelo."""
+        X = self.features(X)
+        out = np.empty((len(X), len(OUTPUT_COLS)), dtype=np.float32)
+
+        def run(task):
+            j, booster, rng = task
+            out[:, j] = booster.inplace_predict(X, iteration_range=rng) if booster is not None else np.nan
+
+        tasks = [*self._regs, self._cls]
+        if _pool is not None and len(X) >= PARALLEL_MIN_ROWS:
+            list(_pool.map(run, tasks))
+        else:
+            for task in tasks:
+                run(task)
+        if self._legacy is not None:
+            out[:, :len(TARGET_REG_COLS)] = self._legacy.predict(X)
+        np.subtract(np.float32(1.0), out[:, PROB_UP], out=out[:, PROB_DOWN])
+        np.greater(out[:, PROB_UP], 0.5, out=out[:, DIR_NEXT], casting="unsafe")
+        return out
+
+    def predict_parts(self, X, index=None):
+        """Mesmas saídas no formato usado pelas séries: (reg_pred DataFrame, cls_pred, prob [down, up])."""
+        out = self.predict(X)
+        if index is None and isinstance(X, pd.DataFrame):
+            index = X.index
+        reg_pred = pd.DataFrame(out[:, :len(TARGET_REG_COLS)], columns=TARGET_REG_COLS, index=index)
+        return reg_pred, out[:, DIR_NEXT].astype(np.int64), out[:, [PROB_DOWN, PROB_UP]]
+
+
+# Engines por versão de modelo (uma por mercado, mais a anterior de cada um durante a troca)
+_engines: OrderedDict[str, InferenceEngine] = OrderedDict()
+_engine_lock = threading.Lock()
+
+
+def engine_for(snap) -> InferenceEngine:
+    """Engine do snapshot do registro (montada uma vez por versão de modelo)."""
+    e = _engines.get(snap.version)
+    if e is None:
+        with _engine_lock:
+            e = _engines.get(snap.version)
+            if e is None:
+                e = _engines[snap.version] = InferenceEngine(snap.reg_bundle, snap.cls, snap.version)
+                while len(_engines) > 2 * len(MARKETS):
+                    _engines.popitem(last=False)
+    return e
@@ -1,3 +1,5 @@
+import os
 from core.config import settings
 REG_PATH = settings.REG_PATH
-CLS_PATH = settings.CLS_PATH
\ No newline at end of file
+CLS_PATH = settings.CLS_PATH
+MODEL_DIR = settings.MODEL_DIR or os.path.join(os.path.dirname(REG_PATH) if REG_PATH else "models", "versions")
@@ -0,0 +1,89 @@
+import math
+from collections import deque
+from datetime import datetime, timedelta
+from ml.features import FEATURE_COLS, VOL_WINDOW
+
+
+class OnlineFeatureState:
+    """Versão incremental de build_features_targets para o caminho de previsão ao vivo.
+
+    Guarda apenas o último close, o último ret e os últimos VOL_WINDOW volumes; push() recebe
+    o próximo candle fechado e devolve as features dele em tempo constante:
+        ret = close / close_anterior - 1        (pct_change)
+        acc = ret - ret_anterior                 (diff)
+        amp = high - low
+        vol_rel = volume / média dos últimos VOL_WINDOW volumes (incluindo o atual)
+    Enquanto não houver histórico suficiente (os mesmos NaN que o dropna remove) devolve None.
+    Com `step` (duração do candle), um candle depois de uma lacuna recomeça o histórico, como
+    os trechos contíguos de build_features_targets.
+    """
+
+    def __init__(self, step: timedelta | None = None):
+        self.step = step
+        self.last_time: datetime | None = None
+        self.last_close: float | None = None
+        self.last_ret: float | None = None
+        self.volumes: deque = deque(maxlen=VOL_WINDOW)
+        self.features: dict | None = None
+
+    def _features(self, high: float, low: float, close: float, volume: float, volumes) -> tuple:
+        ret = close / self.last_close - 1.0 if self.last_close is not None else None
+        acc = ret - self.last_ret if ret is not None and self.last_ret is not None else None
+        vol_rel = volume / (math.fsum(volumes) / VOL_WINDOW) if len(volumes) == VOL_WINDOW else None
+        if acc is None or vol_rel is None:
+            return ret, None
+        return ret, {"close": close, "ret": ret, "acc": acc, "amp": high - low, "vol_rel": vol_rel}
+
+    def is_next(self, time: datetime) -> bool:
+        """Se `time` é o candle imediatamente seguinte ao último (sem lacuna no meio)."""
+        return self.step is None or self.last_time is None or time - self.last_time == self.step
+
+    def push(self, time: datetime, open: float, high: float, low: float, close: float, volume: float) -> dict | None:
+        if self.last_time is not None and time <= self.last_time:
+            raise ValueError(f"Candle fora de ordem: {time} <= {self.last_time}")
+        if not self.is_next(time):
+            self.last_close = self.last_ret = None
+            self.volumes.clear()
+        self.volumes.append(volume)
+        ret, self.features = self._features(high, low, close, volume, self.volumes)
+        self.last_time = time
+        self.last_close = close
+        self.last_ret = ret
+        return self.features
+
+    def peek(self, open: float, high: float, low: float, close: float, volume: float) -> dict | None:
+        """Features que push() devolveria para o próximo candle, sem alterar o estado."""
+        volumes = deque(self.volumes, maxlen=VOL_WINDOW)
+        volumes.append(volume)
+        return self._features(high, low, close, volume, volumes)[1]
+
+    def feature_row(self) -> list | None:
+        """Features do último candle na ordem de FEATURE_COLS (entrada dos modelos)."""
+        return [self.features[c] for c in FEATURE_COLS] if self.features is not None else None
+
+    @classmethod
+    def replay(cls, candles, step: timedelta | None = None) -> "OnlineFeatureState":
+        """Reconstrói o estado a partir de um DataFrame de candles (time, open, high, low, close, volume)."""
+        state = cls(step)
+        for t, o, h, l, c, v in candles[["time","open","high","low","close","volume"]].itertuples(index=False, name=None):
+            state.push(t.to_pydatetime() if hasattr(t, "to_pydatetime") else t, float(o), float(h), float(l), float(c), float(v))
+        return state
+
+    def to_dict(self) -> dict:
+        return {
+            "last_time": self.last_time.isoformat() if self.last_time else None,
+            "last_close": self.last_close,
+            "last_ret": self.last_ret,
+            "volumes": list(self.volumes),
+            "features": self.features,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict, step: timedelta | None = None) -> "OnlineFeatureState":
+        state = cls(step)
+        state.last_time = datetime.fromisoformat(d["last_time"]) if d.get("last_time") else None
+        state.last_close = d.get("last_close")
+        state.last_ret = d.get("last_ret")
+        state.volumes.extend(d.get("volumes") or [])
+        state.features = d.get("features")
+        return state
@@ -0,0 +1,139 @@
+import os, threading, time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import joblib
+from core.config import settings
+from core.executor import run_cpu
+from core.markets import Market, DEFAULT_MARKET
+from ml.artifact_store import ArtifactStore, artifact_store, store_for
+from ml.model_paths import REG_PATH, CLS_PATH
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    reg_bundle: object
+    cls: object
+    version: str
+    loaded_at: datetime
+    stamp: tuple
+
+
+class ModelRegistry:
+    """Mantém os modelos desserializados em memória e recarrega só quando a versão publicada muda.
+
+    Leitores recebem um snapshot imutável (regressores + classificador da mesma versão); a troca
+    é uma atribuição única, então o caminho quente não usa lock. O ponteiro CURRENT do
+    artifact store é verificado no máximo a cada MODEL_CHECK_SECS; o train_job força o reload
+    logo após publicar. Sem versão publicada, cai para os arquivos joblib legados (REG_PATH/CLS_PATH).
+    """
+
+    def __init__(self, store: ArtifactStore, reg_path: str | None, cls_path: str | None, check_secs: float):
+        self.store = store
+        self.reg_path = reg_path
+        self.cls_path = cls_path
+        self.check_secs = check_secs
+        self._snapshot: ModelSnapshot | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._published: str | None = None
+        self._published_at = float("-inf")
+
+    def _note_published(self, version: str | None) -> None:
+        self._published, self._published_at = version, time.monotonic()
+
+    def published(self) -> str | None:
+        """Versão apontada pelo CURRENT do store (pode ainda não estar carregada), relida no máximo a cada MODEL_CHECK_SECS."""
+        if time.monotonic() - self._published_at >= self.check_secs:
+            self._note_published(self.store.current())
+        return self._published
+
+    async def published_async(self) -> str | None:
+        """published() para o event loop: o CURRENT só é relido (no executor de CPU) quando o valor guardado venceu."""
+        if time.monotonic() - self._published_at < self.check_secs:
+            return self._published
+        return await run_cpu(self.published)
+
+    def _stamp(self) -> tuple:
+        version = self.store.current()
+        self._note_published(version)
+        if version is not None:
+            return ("store", version)
+        if self.reg_path is None:
+            raise FileNotFoundError(f"Nenhuma versão publicada em {self.store.root}")
+        r = os.stat(self.reg_path)
+        c = os.stat(self.cls_path)
+        return ("legacy", r.st_mtime_ns, r.st_size, c.st_mtime_ns, c.st_size)
+
+    def _load(self, stamp: tuple) -> ModelSnapshot:
+        if stamp[0] == "store":
+            reg_models, cls, manifest = self.store.load(stamp[1])
+            reg_bundle = {"models": reg_models, "feature_cols": manifest["features"], "meta": manifest}
+            version = stamp[1]
+        else:
+            reg_bundle = joblib.load(self.reg_path)
+            cls = joblib.load(self.cls_path)
+            published = datetime.fromtimestamp(max(stamp[1], stamp[3]) / 1e9, tz=timezone.utc)
+            version = published.strftime("%Y%m%dT%H%M%S")
+        return ModelSnapshot(
+            reg_bundle=reg_bundle,
+            cls=cls,
+            version=version,
+            loaded_at=datetime.now(timezone.utc),
+            stamp=stamp,
+        )
+
+    def get(self) -> ModelSnapshot:
+        snap = self._snapshot
+        now = time.monotonic()
+        if snap is not None and now - self._checked_at < self.check_secs:
+            return snap
+        try:
+            stamp = self._stamp()
+        except FileNotFoundError:
+            if snap is not None:
+                return snap
+            raise
+        if snap is not None and snap.stamp == stamp:
+            self._checked_at = now
+            return snap
+        return self._reload(stamp)
+
+    def reload(self) -> ModelSnapshot:
+        return self._reload(self._stamp())
+
+    def _reload(self, stamp: tuple) -> ModelSnapshot:
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap.stamp == stamp:
+                return snap
+            try:
+                snap = self._load(stamp)
+            except Exception:
+                # Versão removida/corrompida ou arquivo legado ainda sendo escrito: mantém a anterior
+                if snap is not None:
+                    self._checked_at = time.monotonic()
+                    return snap
+                raise
+            self._snapshot = snap
+            self._checked_at = time.monotonic()
+            return snap
+
+    @property
+    def version(self) -> str | None:
+        snap = self._snapshot
+        return snap.version if snap is not None else None
+
+
+model_registry = ModelRegistry(artifact_store, REG_PATH, CLS_PATH, settings.MODEL_CHECK_SECS)
+
+# Um registro por mercado; só o padrão cai para os joblib legados (REG_PATH/CLS_PATH)
+_registries: dict[Market, ModelRegistry] = {DEFAULT_MARKET: model_registry}
+_registries_lock = threading.Lock()
+
+
+def registry_for(market: Market = DEFAULT_MARKET) -> ModelRegistry:
+    reg = _registries.get(market)
+    if reg is None:
+        with _registries_lock:
+            reg = _registries.setdefault(market, ModelRegistry(store_for(market), None, None, settings.MODEL_CHECK_SECS))
+    return reg
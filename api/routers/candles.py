@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+from core.markets import Market, market_param, markets_param, job_key
+from services.gap_service import gaps_report, repair_job
+from routers.jobs import dispatch
+
+router = APIRouter(prefix="/candles", tags=["candles"])
+
+@router.get("/gaps", summary="Lacunas em btc_candles", description="Lista os intervalos sem candle do mercado na janela pedida (padrão: últimos LOOKBACK_DAYS dias até o último candle fechado), a partir do primeiro candle gravado. A busca é uma única consulta contra generate_series na grade do intervalo, agrupando os slots vazios em lacunas contíguas.")
+async def candle_gaps(start: Optional[str] = Query(None), end: Optional[str] = Query(None),
+                      days: Optional[int] = Query(None, ge=1, le=3650, description="Janela quando start não é informado (padrão LOOKBACK_DAYS)"),
+                      limit: int = Query(500, ge=1, le=10000, description="Máximo de lacunas listadas (os totais consideram todas)"),
+                      market: Market = Depends(market_param)):
+    return await gaps_report(days, start, end, limit, market)
+
+
+@router.post("/gaps/repair", summary="Preenche as lacunas de btc_candles", description="Busca na Binance exatamente os intervalos listados por /candles/gaps (janelas de até 1000 candles, sob o limitador de request weight) e os grava; com candles novos, rematerializa a series_cache do mercado. Sem symbol/interval repara todos os mercados de MARKETS. Roda como job: responde 202 com job_id (acompanhe em /jobs/{id}) ou, com wait=true, o resultado.")
+async def repair_gaps(start: Optional[str] = Query(None), end: Optional[str] = Query(None),
+                      days: Optional[int] = Query(None, ge=1, le=3650),
+                      wait: bool = Query(False, description="Espera o fim do reparo em vez de responder 202"),
+                      markets: list[Market] = Depends(markets_param)):
+    return await dispatch(job_key("repair", markets), repair_job, days, start, end, markets=markets, wait=wait,
+                          params={"days": days, "start": start, "end": end, "markets": [m.key for m in markets]})
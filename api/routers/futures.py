@@ -1,24 +1,38 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from typing import Optional
-from services.futures_service import save_predictions_for_times, load_futuros_series
+from core import aiodb
+from core.executor import run_cpu, run_job
+from core.response_cache import conditional, json_response, response_cache
+from core.markets import Market, market_param
+from services.futures_service import save_predictions_for_times, load_futuros_series_async, load_futuros_frame_async, stream_futuros_series_async
+from services.series_format import negotiate_format, encode_columns, NDJSON_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE
 from models.schemas import FuturesResponse, FutUpdateResponse
 
 router = APIRouter(prefix="/futures", tags=["futures"])
 
 @router.post("/update", response_model=FutUpdateResponse, summary="Atualiza 'futures' para o último timestamp", description="Calcula a previsão prospectiva (t→t+1) para o último candle disponível e persiste em 'futures'.")
-def futures_update():
+async def futures_update(market: Market = Depends(market_param)):
 	# Atualiza somente o último timestamp disponível para evitar retro-preenchimento
-	from core.db import pg_conn
-	with pg_conn() as conn:
-		with conn.cursor() as cur:
-			cur.execute("SELECT MAX(time) FROM btc_candles")
-			row = cur.fetchone()
-			last_time = row[0] if row else None
+	row = await aiodb.fetchrow("SELECT MAX(time) FROM btc_candles WHERE symbol = %s AND interval = %s", *market)
+	last_time = row[0] if row else None
 	if not last_time:
 		return {"status":"ok","updated": 0}
-	inserted = save_predictions_for_times([last_time])
+	inserted = await run_job(save_predictions_for_times, [last_time], market)
+	response_cache.invalidate()
 	return {"status":"ok","updated": inserted}
 
-@router.get("", response_model=FuturesResponse, summary="Série prospectiva 'futures'", description="Retorna a série de previsões prospectivas (pred_close × real_close × err_close) alinhadas por timestamp.")
-def futures_series(start: Optional[str]=Query(None), end: Optional[str]=Query(None)):
-    return load_futuros_series(start, end)
+@router.get("", response_model=FuturesResponse, summary="Série prospectiva 'futures'", description="Retorna a série de previsões prospectivas (pred_close × real_close × err_close) alinhadas por timestamp. Com format=ndjson (ou Accept: application/x-ndjson) os pontos são enviados em streaming, um por linha; com format=columnar (ou Accept: application/vnd.btcml.columns), no formato binário colunar. Com max_points a série é reduzida no servidor por LTTB. Responde com ETag/Last-Modified e serve do cache de respostas enquanto não houver candle/previsão nova; If-None-Match com o ETag atual devolve 304.")
+async def futures_series(request: Request, start: Optional[str]=Query(None), end: Optional[str]=Query(None),
+                   format: Optional[str]=Query(None, pattern="^(json|ndjson|columnar)$"),
+                   max_points: Optional[int]=Query(None, ge=10, le=50000, description="Reduz a série a no máximo N pontos (LTTB sobre o close previsto)"),
+                   market: Market=Depends(market_param)):
+    fmt = negotiate_format(format, request.headers.get("accept"))
+    async def render():
+        if fmt == "ndjson":
+            return StreamingResponse(stream_futuros_series_async(start, end, max_points, market), media_type=NDJSON_MEDIA_TYPE)
+        if fmt == "columnar":
+            frame = await load_futuros_frame_async(start, end, max_points, market)
+            return Response(await run_cpu(encode_columns, frame), media_type=COLUMNAR_MEDIA_TYPE)
+        return await json_response(await load_futuros_series_async(start, end, max_points, market))
+    return await conditional(request, "futures", (start, end, fmt, max_points), render, store=fmt != "ndjson", market=market)
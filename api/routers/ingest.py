@@ -1,23 +1,56 @@
-from fastapi import APIRouter
-from services.ingestion_service import fetch_binance_klines, upsert_candles
-from services.futures_service import save_predictions_for_times
+import asyncio
+from fastapi import APIRouter, Depends, Query
+from services.ingestion_service import fetch_new_klines_async, upsert_candles
+from services.futures_service import save_live_predictions
+from services.series_cache_service import build_series_cache
+from services.stream_service import kline_stream
+from core.executor import run_job
 from core.logging import log_job
+from core.response_cache import response_cache
+from core.markets import Market, MARKETS, DEFAULT_MARKET, markets_param, job_key, run_markets
 from datetime import datetime
+from routers.jobs import dispatch
 from models.schemas import IngestResponse
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 
-@router.post("", response_model=IngestResponse, summary="Ingestão de candles recentes", description="Busca klines na Binance e upserta em btc_candles. Atualiza a série prospectiva 'futuros' para o último timestamp válido.")
-def ingest():
-	start = datetime.utcnow()
+
+def _store(frames, start, market: Market = DEFAULT_MARKET):
+	# Parte bloqueante (COPY, features/predict, materialização) roda no executor de jobs / pool de mercados
 	try:
-		df = fetch_binance_klines()
-		inserted = upsert_candles(df)
+		df = frames[market]
+		if isinstance(df, Exception):
+			raise df
+		# O primeiro candle é o último já gravado, relido: sobrescreve caso tenha sido gravado ainda aberto
+		inserted = upsert_candles(df, market, overwrite=True)
 		# Usar penúltimo timestamp (tem par com T-1 nas features)
 		last_valid_time = df["time"].iloc[-2] if len(df) >= 2 else None
-		updated = save_predictions_for_times([last_valid_time]) if last_valid_time is not None else 0
-		log_job("ingest","ok",f"Inserted {inserted}; futures_updated {updated}",start,datetime.utcnow())
-		return {"status":"ok","inserted":inserted, "futures_updated": updated}
+		updated = save_live_predictions(last_valid_time, market) if last_valid_time is not None else 0
+		# Mantém series_cache em dia só com os candles novos (rebuild completo apenas após novo treino)
+		materialized = build_series_cache(incremental=True, market=market)
+		response_cache.invalidate()
 	except Exception as e:
-		log_job("ingest","error",str(e),start,datetime.utcnow())
+		log_job("ingest","error",f"{market.key}: {e}",start,datetime.utcnow())
 		return {"status":"error","message":str(e)}
+	log_job("ingest","ok",f"{market.key}: Inserted {inserted}; futures_updated {updated}; materialized {materialized}",start,datetime.utcnow())
+	return {"status":"ok","inserted":inserted, "futures_updated": updated, "materialized": materialized}
+
+
+async def ingest_job(markets: list | None = None):
+	start = datetime.utcnow()
+	markets = markets or MARKETS
+	# Todos os mercados ao mesmo tempo (cada um a partir do seu último candle), no cliente HTTP compartilhado e sob o mesmo orçamento de weight
+	frames = await asyncio.gather(*(fetch_new_klines_async(m) for m in markets), return_exceptions=True)
+	return await run_job(run_markets, _store, markets, dict(zip(markets, frames)), start)
+
+
+@router.post("", response_model=IngestResponse, summary="Ingestão de candles recentes", description="Busca na Binance só os klines a partir do último candle gravado de cada mercado (delta, paginado) e upserta em btc_candles. Atualiza a série prospectiva 'futuros' para o último timestamp válido. Sem symbol/interval ingere todos os mercados de MARKETS: as buscas saem juntas (mesmo cliente HTTP e limitador de weight) e a gravação de cada mercado roda no pool de mercados. Roda como job: responde 202 com job_id (acompanhe em /jobs/{id}) ou, com wait=true, o resultado; disparos sobrepostos são unidos.")
+async def ingest(wait: bool = Query(False, description="Espera o fim da ingestão em vez de responder 202"),
+				 markets: list[Market] = Depends(markets_param)):
+	return await dispatch(job_key("ingest", markets), ingest_job, markets, wait=wait,
+						  params={"markets": [m.key for m in markets]})
+
+
+@router.get("/stream", summary="Status do stream de klines", description="Estado do consumidor do WebSocket de klines (KLINE_STREAM=true): conexão, reconexões, mensagens, candles fechados recebidos e preenchidos pelo REST após reconexão, último erro e, por mercado, o último candle gravado com o atraso (ms) entre o fechamento do candle e a gravação.")
+async def stream_status():
+	return kline_stream.stats()
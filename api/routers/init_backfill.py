@@ -1,23 +1,31 @@
 from fastapi import APIRouter, Query
 from typing import Optional
-from services.ingestion_service import backfill_job
+from services.backfill_service import backfill_job
 from core.config import settings
+from routers.jobs import dispatch
 from models.schemas import BackfillResponse
 
 router = APIRouter(prefix="/init", tags=["init"])
 
-@router.post("/backfill", response_model=BackfillResponse, summary="Backfill histórico de candles", description="Busca candles históricos na Binance e persiste em btc_candles, respeitando limites e pausa entre chamadas.")
-def backfill(
+@router.post("/backfill", response_model=BackfillResponse, summary="Backfill histórico de candles", description="Busca candles históricos na Binance em janelas paralelas (limitadas pelo orçamento de request weight) e persiste em btc_candles. Janelas concluídas ficam registradas em backfill_checkpoints e são puladas ao retomar. Roda como job: responde 202 com job_id (progresso em /jobs/{id}) ou, com wait=true, o resumo ao terminar.")
+async def backfill(
     days: Optional[int] = Query(None, ge=1, le=90),
     symbol: Optional[str] = Query(None),
     interval: Optional[str] = Query(None),
     sleep_ms: Optional[int] = Query(None, ge=0),
-    limit: Optional[int] = Query(None, ge=1, le=1000)
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    workers: Optional[int] = Query(None, ge=1, le=16),
+    resume: bool = Query(True),
+    wait: bool = Query(False, description="Espera o fim do backfill em vez de responder 202")
 ):
-    return backfill_job(
+    params = dict(
         days=days or settings.BACKFILL_DAYS,
         symbol=symbol or settings.BINANCE_SYMBOL,
         interval=interval or settings.BINANCE_INTERVAL,
         sleep_ms=sleep_ms if sleep_ms is not None else settings.BACKFILL_SLEEP_MS,
-        limit=limit or 1000
+        limit=limit or 1000,
+        workers=workers,
+        resume=resume
     )
+    # O backfill tem seu próprio pool de workers; roda como job (progresso por janela em /jobs/{id})
+    return await dispatch("backfill", backfill_job, wait=wait, params=params, **params)
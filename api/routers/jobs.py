@@ -0,0 +1,45 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
+from typing import Optional
+from datetime import datetime
+from core import aiodb
+from core.jobs import job_runner
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+JOB_COLS = "id, job_name, status, progress, message, params, result, started_at, finished_at"
+
+
+async def dispatch(key: str, fn, *args, wait: bool = False, params: dict | None = None, **kwargs):
+	"""Agenda o job e responde 202 com o id; com wait=true espera e devolve o resultado do job."""
+	job_id, task, coalesced = await job_runner.submit(key, fn, *args, params=params, **kwargs)
+	if wait:
+		result = await asyncio.shield(task)
+		return {**result, "job_id": job_id, "coalesced": coalesced} if isinstance(result, dict) else result
+	return JSONResponse(status_code=202, content={"status":"accepted","job_id":job_id,"coalesced":coalesced})
+
+
+def _job(row) -> dict:
+	out = dict(row)
+	for k in ("started_at", "finished_at"):
+		if isinstance(out[k], datetime):
+			out[k] = out[k].isoformat()
+	return out
+
+
+@router.get("/{job_id}", summary="Status de um job", description="Estado (queued, running, ok, error, skipped, cancelled), progresso (0..1), mensagem, parâmetros e resultado de um job disparado por /ingest, /train, /init/backfill ou /series/rebuild.")
+async def get_job(job_id: int):
+	row = await aiodb.fetchrow(f"SELECT {JOB_COLS} FROM job_logs WHERE id=%s", job_id)
+	if row is None:
+		raise HTTPException(status_code=404, detail="Job não encontrado")
+	return _job(row)
+
+
+@router.get("", summary="Jobs recentes", description="Últimos jobs registrados em job_logs (mais recente primeiro), opcionalmente filtrados por nome.")
+async def list_jobs(name: Optional[str] = Query(None), limit: int = Query(20, ge=1, le=200)):
+	if name:
+		rows = await aiodb.fetch(f"SELECT {JOB_COLS} FROM job_logs WHERE job_name=%s ORDER BY id DESC LIMIT %s", name, limit)
+	else:
+		rows = await aiodb.fetch(f"SELECT {JOB_COLS} FROM job_logs ORDER BY id DESC LIMIT %s", limit)
+	return {"jobs": [_job(r) for r in rows]}
@@ -1,6 +1,10 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Query, Request
 from datetime import datetime
+from core import aiodb
 from core.db import pg_conn
+from core.executor import run_job
+from core.response_cache import conditional, json_response
+from core.markets import Market, DEFAULT_MARKET, market_param
 from ml.features import build_features_targets
 from core.config import settings
 from models.schemas import MetricsResponse
@@ -38,11 +42,11 @@ def compute_validation_start_iso() -> str | None:
 				"""
 				SELECT time, open, high, low, close, volume
 				FROM btc_candles
-				WHERE time >= NOW() - INTERVAL %s
+				WHERE symbol = %s AND interval = %s AND time >= NOW() - INTERVAL %s
 				ORDER BY time
 				""",
 				conn,
-				params=(f"{settings.LOOKBACK_DAYS} days",),
+				params=(*DEFAULT_MARKET, f"{settings.LOOKBACK_DAYS} days"),
 			)
 		if df.empty:
 			return None
@@ -58,8 +62,29 @@ def compute_validation_start_iso() -> str | None:
 		return None
 
 
-@router.get("", response_model=MetricsResponse, summary="Métricas do último treino", description="Extrai métricas (MAE, MAPE, SMAPE) e metadados do último treino bem-sucedido, além do início do período de validação para sombreamento no front-end.")
-def get_metrics():
+RUN_COLS = """model_version, mode, reason, samples, split_idx, val_start, trained_until, mae, mape, smape,
+	target_metrics, trees, fit_secs, total_secs, started_at, finished_at"""
+
+
+def _iso(v):
+	return v.isoformat() if isinstance(v, datetime) else (str(v) if v is not None else None)
+
+
+def _run_row(row) -> dict:
+	(version, mode, reason, samples, split_idx, val_start, trained_until, mae, mape, smape,
+	 targets, trees, fit_secs, total_secs, started_at, finished_at) = row
+	return {
+		"model_version": version, "mode": mode, "reason": reason,
+		"mae": mae, "mape": mape, "smape": smape,
+		"samples": samples, "split_train": split_idx, "split_total": samples,
+		"validation_start": _iso(val_start), "trained_until": _iso(trained_until),
+		"targets": targets, "trees": trees, "fit_secs": fit_secs, "total_secs": total_secs,
+		"started_at": _iso(started_at), "finished_at": _iso(finished_at),
+	}
+
+
+def _legacy_metrics():
+	# Sem registro em train_runs (treinos anteriores à tabela): extrai do texto de job_logs
 	with pg_conn() as conn:
 		with conn.cursor() as cur:
 			cur.execute(
@@ -72,14 +97,43 @@ def get_metrics():
 				"""
 			)
 			row = cur.fetchone()
-			if not row:
-				return {"status":"empty"}
-			msg, started_at, finished_at = row
-			m = parse_metrics(msg)
-			m.update({
-				"status": "ok",
-				"started_at": started_at.isoformat() if isinstance(started_at, datetime) else str(started_at),
-				"finished_at": finished_at.isoformat() if isinstance(finished_at, datetime) else str(finished_at),
-				"validation_start": compute_validation_start_iso(),
-			})
-			return m
+	if not row:
+		return {"status":"empty"}
+	msg, started_at, finished_at = row
+	m = parse_metrics(msg)
+	m.update({
+		"status": "ok",
+		"started_at": _iso(started_at),
+		"finished_at": _iso(finished_at),
+		"validation_start": compute_validation_start_iso(),
+	})
+	return m
+
+
+async def _render_metrics(market: Market = DEFAULT_MARKET):
+	from ml.registry import registry_for
+	version = await registry_for(market).published_async()
+	row = None
+	if version is not None:
+		row = await aiodb.fetchrow(f"SELECT {RUN_COLS} FROM train_runs WHERE model_version=%s", version)
+	if row is None:
+		row = await aiodb.fetchrow(
+			f"SELECT {RUN_COLS} FROM train_runs WHERE symbol=%s AND interval=%s ORDER BY id DESC LIMIT 1", *market)
+	if row is None:
+		# Treinos anteriores a train_runs só existem para o mercado padrão
+		if market != DEFAULT_MARKET:
+			return await json_response({"status":"empty"})
+		return await json_response(await run_job(_legacy_metrics))
+	return await json_response({"status": "ok", **_run_row(row)})
+
+
+@router.get("", response_model=MetricsResponse, summary="Métricas do último treino", description="Métricas de validação (MAE, MAPE, SMAPE; também por alvo) e metadados do treino da versão de modelo publicada, além do início do período de validação para sombreamento no front-end. Lê uma única linha de train_runs; com ETag/Last-Modified e cache em memória até o próximo treino ou candle (If-None-Match com o ETag atual devolve 304).")
+async def get_metrics(request: Request, market: Market = Depends(market_param)):
+	return await conditional(request, "metrics", (), lambda: _render_metrics(market), market=market)
+
+
+@router.get("/history", summary="Histórico de métricas entre treinos", description="Métricas de validação dos últimos treinos publicados (mais recente primeiro), para acompanhar a evolução entre execuções.")
+async def get_metrics_history(limit: int = Query(50, ge=1, le=500), market: Market = Depends(market_param)):
+	rows = await aiodb.fetch(
+		f"SELECT {RUN_COLS} FROM train_runs WHERE symbol=%s AND interval=%s ORDER BY id DESC LIMIT %s", *market, limit)
+	return {"status": "ok", "runs": [_run_row(r) for r in rows]}
@@ -0,0 +1,45 @@
+import numpy as np
+from fastapi import APIRouter, Body, Depends, HTTPException
+from typing import List, Union
+from core.executor import run_cpu
+from core.markets import Market, market_param
+from ml.features import FEATURE_COLS
+from services.futures_service import live_features
+from services.predict_service import batcher_for, prediction_rows
+from schemas.predict import PredictInput, PredictLiteInput, PredictResponse
+
+router = APIRouter(prefix="/predict", tags=["predict"])
+
+
+async def _predict(X: np.ndarray, market: Market, real_close_next=None, real_amp_next=None):
+	try:
+		out, version = await batcher_for(market).predict(X)
+	except FileNotFoundError:
+		raise HTTPException(status_code=503, detail="Nenhum modelo publicado (rode /train)")
+	return {"model_version": version, "predictions": prediction_rows(out, real_close_next, real_amp_next)}
+
+
+@router.post("", response_model=PredictResponse, summary="Previsão a partir de features", description="Recebe uma linha de features (close, ret, acc, amp, vol_rel) ou uma lista delas e devolve os cinco alvos de regressão e as probabilidades de direção do modelo publicado. Requisições concorrentes de poucas linhas são agrupadas em micro-lotes (PREDICT_BATCH_WINDOW_MS) e previstas com inplace_predict sobre um buffer NumPy. Com real_close_next/real_amp_next informados, devolve também os erros absolutos.")
+async def predict(body: Union[PredictInput, List[PredictInput]] = Body(...), market: Market = Depends(market_param)):
+	rows = body if isinstance(body, list) else [body]
+	if not rows:
+		return {"predictions": []}
+	X = np.array([[getattr(r, c) for c in FEATURE_COLS] for r in rows], dtype=np.float32)
+	return await _predict(X, market, [r.real_close_next for r in rows], [r.real_amp_next for r in rows])
+
+
+@router.post("/lite", response_model=PredictResponse, summary="Previsão a partir de um candle", description="Recebe o candle seguinte ao último ingerido (open, close, volume e opcionalmente high/low) e calcula as features com o estado online do /ingest, sem alterá-lo. Em uma lista, cada candle é tratado de forma independente como o próximo após o último ingerido.")
+async def predict_lite(body: Union[PredictLiteInput, List[PredictLiteInput]] = Body(...), market: Market = Depends(market_param)):
+	rows = body if isinstance(body, list) else [body]
+	if not rows:
+		return {"predictions": []}
+	candles = [
+		(r.open, r.high if r.high is not None else max(r.open, r.close),
+		 r.low if r.low is not None else min(r.open, r.close), r.close, r.volume)
+		for r in rows
+	]
+	feats = await run_cpu(live_features, candles, market)
+	if any(f is None for f in feats):
+		raise HTTPException(status_code=409, detail="Estado online de features ainda não inicializado (rode /ingest)")
+	X = np.array([[f[c] for c in FEATURE_COLS] for f in feats], dtype=np.float32)
+	return await _predict(X, market)
@@ -1,23 +1,47 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from typing import Optional
-from services.prediction_service import series_data
-from services.series_cache_service import load_series_cached
+from core.executor import run_cpu
+from services.prediction_service import series_data_async, series_data_frame_async
+from services.series_cache_service import load_series_cached_async, load_series_cached_frame_async, stream_series_cached_async
+from services.series_format import negotiate_format, encode_columns, NDJSON_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE
+from core.response_cache import conditional, json_response
+from core.markets import Market, market_param, markets_param, job_key
+from routers.jobs import dispatch
 from models.schemas import SeriesResponse
 
 router = APIRouter(prefix="/series", tags=["series"])
 
-@router.get("", response_model=SeriesResponse, summary="Série consolidada para gráficos (on-demand)", description="Calcula on-demand a série consolidada (real × previsto). Para produção, prefira /series_cached.")
-def series(start: Optional[str]=Query(None), end: Optional[str]=Query(None), fallback_days: int=90):
-    return series_data(start, end, fallback_days)
+@router.get("", response_model=SeriesResponse, summary="Série consolidada para gráficos (on-demand)", description="Calcula on-demand a série consolidada (real × previsto). Para produção, prefira /series_cached. Com format=columnar (ou Accept: application/vnd.btcml.columns) responde no formato binário colunar. Com max_points a série é reduzida no servidor (buckets OHLCV + LTTB na previsão).")
+async def series(request: Request, start: Optional[str]=Query(None), end: Optional[str]=Query(None), fallback_days: int=90,
+           format: Optional[str]=Query(None, pattern="^(json|columnar)$"), max_points: Optional[int]=Query(None, ge=10, le=50000, description="Reduz a série a no máximo N pontos (candles agregados em OHLCV, previsão/erro por LTTB)"),
+           market: Market=Depends(market_param)):
+    if negotiate_format(format, request.headers.get("accept")) == "columnar":
+        frame = await series_data_frame_async(start, end, fallback_days, max_points, market)
+        return Response(await run_cpu(encode_columns, frame), media_type=COLUMNAR_MEDIA_TYPE)
+    return await series_data_async(start, end, fallback_days, max_points, market)
 
 
-@router.get("/cached", response_model=SeriesResponse, summary="Série consolidada materializada", description="Retorna a série já materializada em banco (series_cache), gerada pelo job de treino.")
-def series_cached(start: Optional[str]=Query(None), end: Optional[str]=Query(None), fallback_days: int=90):
-    return load_series_cached(start, end, fallback_days)
+@router.get("/cached", response_model=SeriesResponse, summary="Série consolidada materializada", description="Retorna a série já materializada em banco (series_cache), gerada pelo job de treino. Responde com ETag/Last-Modified e guarda a resposta serializada em memória até chegar candle novo ou mudar o modelo; If-None-Match com o ETag atual devolve 304. Com format=ndjson (ou Accept: application/x-ndjson) os pontos são enviados em streaming, um por linha; com format=columnar (ou Accept: application/vnd.btcml.columns), no formato binário colunar.")
+async def series_cached(request: Request, start: Optional[str]=Query(None), end: Optional[str]=Query(None), fallback_days: int=90,
+                  format: Optional[str]=Query(None, pattern="^(json|ndjson|columnar)$"), max_points: Optional[int]=Query(None, ge=10, le=50000, description="Reduz a série a no máximo N pontos (candles agregados em OHLCV, previsão/erro por LTTB)"),
+                  market: Market=Depends(market_param)):
+    fmt = negotiate_format(format, request.headers.get("accept"))
+    async def render():
+        if fmt == "ndjson":
+            return StreamingResponse(stream_series_cached_async(start, end, fallback_days, max_points, market), media_type=NDJSON_MEDIA_TYPE)
+        if fmt == "columnar":
+            frame = await load_series_cached_frame_async(start, end, fallback_days, max_points, market)
+            return Response(await run_cpu(encode_columns, frame), media_type=COLUMNAR_MEDIA_TYPE)
+        return await json_response(await load_series_cached_async(start, end, fallback_days, max_points, market))
+    return await conditional(request, "series_cached", (start, end, fallback_days, fmt, max_points), render,
+                             store=fmt != "ndjson", market=market)
 
 
-@router.post("/rebuild", summary="Recalcula e materializa a série consolidada")
-def series_rebuild(days: int = Query(90, ge=1, le=90)):
-    from services.series_cache_service import build_series_cache
-    n = build_series_cache(days)
-    return {"status":"ok","materialized": n}
+@router.post("/rebuild", summary="Recalcula e materializa a série consolidada", description="Roda como job (202 + job_id; acompanhe em /jobs/{id}). Com incremental=true recalcula apenas os candles novos desde a última materialização (rebuild completo se a versão do modelo mudou). Sem symbol/interval materializa todos os mercados de MARKETS, em paralelo.")
+async def series_rebuild(days: int = Query(90, ge=1, le=90), incremental: bool = Query(False),
+                         wait: bool = Query(False, description="Espera o fim do job em vez de responder 202"),
+                         markets: list[Market] = Depends(markets_param)):
+    from services.series_cache_service import rebuild_job
+    return await dispatch(job_key("rebuild", markets), rebuild_job, days, incremental=incremental, markets=markets, wait=wait,
+                          params={"days": days, "incremental": incremental, "markets": [m.key for m in markets]})
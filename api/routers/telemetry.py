@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from core.response_cache import response_cache
+from core.telemetry import HTTP_DURATION, STAGE_DURATION, JOB_DURATION, render_samples
+from services import predict_service
+from services.stream_service import kline_stream
+
+router = APIRouter(prefix="/telemetry", tags=["telemetry"])
+
+# Formato de exposição em texto do Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render_telemetry() -> str:
+	lines = []
+	for h in (HTTP_DURATION, STAGE_DURATION, JOB_DURATION):
+		lines += h.render()
+
+	cache = response_cache.stats()
+	lines += render_samples("btcml_response_cache_bytes", "gauge", "Bytes ocupados no cache de respostas.", [({}, cache["bytes"])])
+	lines += render_samples("btcml_response_cache_entries", "gauge", "Entradas no cache de respostas.", [({}, cache["entries"])])
+	lines += render_samples("btcml_response_cache_requests_total", "counter", "Consultas ao cache de respostas por resultado.",
+							[({"result": k}, cache[k]) for k in ("hits", "misses", "not_modified")])
+
+	batchers = list(predict_service._batchers.items())
+	lines += render_samples("btcml_predict_calls_total", "counter", "Chamadas ao /predict por mercado.",
+							[({"market": m.key}, b.calls) for m, b in batchers])
+	lines += render_samples("btcml_predict_batches_total", "counter", "Lotes executados pelo micro-batcher do /predict por mercado.",
+							[({"market": m.key}, b.batches) for m, b in batchers])
+
+	stream = kline_stream.stats()
+	lines += render_samples("btcml_kline_stream_connected", "gauge", "1 quando o WebSocket de klines está conectado.",
+							[({}, int(stream["connected"]))])
+	lines += render_samples("btcml_kline_stream_messages_total", "counter", "Mensagens recebidas do WebSocket de klines.",
+							[({}, stream["messages"])])
+	lines += render_samples("btcml_kline_stream_errors_total", "counter", "Erros do consumidor do WebSocket de klines.",
+							[({}, stream["errors"])])
+	return "\n".join(lines) + "\n"
+
+
+@router.get("", summary="Telemetria (formato Prometheus)", response_class=PlainTextResponse, description="Histogramas de latência no formato de exposição em texto do Prometheus: requisições HTTP por rota/método/status, etapas (db_read, features, model_load, predict, response_build, db_write, fit, publish, fetch) por operação (series_data, build_series_cache, save_predictions_for_times, train_job, backfill_job) e jobs registrados em job_logs; mais contadores do cache de respostas, do micro-batcher do /predict e do stream de klines. Os valores são do processo (zeram ao reiniciar).")
+async def telemetry():
+	return PlainTextResponse(render_telemetry(), media_type=CONTENT_TYPE)
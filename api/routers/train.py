@@ -1,16 +1,67 @@
-from fastapi import APIRouter, Query
-from services.training_service import train_job
-from services.series_cache_service import build_series_cache
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from core.executor import run_cpu
+from core.response_cache import response_cache
+from core.markets import Market, market_param, markets_param, job_key
+from services.training_service import train_markets
+from services.series_cache_service import rebuild_job
+from routers.jobs import dispatch
 from models.schemas import TrainResponse
 
 router = APIRouter(prefix="/train", tags=["train"])
 
-@router.post("", response_model=TrainResponse, summary="Treino de modelos (XGB)", description="Treina regressões para OHLC/amp e classificador de direção, com split temporal 80/20. Retorna métricas de validação para close_next.")
-def train(days: int = Query(90, ge=1, le=90)):
-    return train_job(days=days)
+@router.post("", response_model=TrainResponse, summary="Treino de modelos (XGB)", description="Treina regressões para OHLC/amp e classificador de direção, com split temporal 80/20. Roda como job: responde 202 com job_id (acompanhe em /jobs/{id}) ou, com wait=true, as métricas de validação para close_next. Um disparo enquanto outro treino está na fila ou rodando é unido a ele. Com mode=incremental continua o boosting do modelo atual apenas sobre os candles novos (cai para o treino completo por agenda ou se a validação piorar). Sem symbol/interval treina todos os mercados de MARKETS, cada um com seus modelos, em paralelo no pool de mercados.")
+async def train(
+    days: int = Query(90, ge=1, le=90),
+    mode: str = Query("full", pattern="^(full|incremental)$", description="full: do zero; incremental: warm start sobre o modelo atual"),
+    rounds: Optional[int] = Query(None, ge=1, le=400, description="Árvores extras no modo incremental (padrão TRAIN_INCREMENTAL_ROUNDS)"),
+    wait: bool = Query(False, description="Espera o fim do treino em vez de responder 202"),
+    markets: list[Market] = Depends(markets_param),
+):
+    return await dispatch(job_key("train", markets), train_markets, days=days, mode=mode, rounds=rounds, markets=markets, wait=wait,
+                          params={"days": days, "mode": mode, "rounds": rounds, "markets": [m.key for m in markets]})
 
 
-@router.post("/apply", summary="Materializa série consolidada pós-treino")
-def apply_series(days: int = Query(90, ge=1, le=90)):
-    n = build_series_cache(days)
-    return {"status":"ok","materialized": n}
+@router.post("/apply", summary="Materializa série consolidada pós-treino", description="Roda como job (202 + job_id; acompanhe em /jobs/{id}); com wait=true responde ao terminar.")
+async def apply_series(days: int = Query(90, ge=1, le=90), wait: bool = Query(False),
+                       markets: list[Market] = Depends(markets_param)):
+    return await dispatch(job_key("rebuild", markets), rebuild_job, days, markets=markets, wait=wait,
+                          params={"days": days, "markets": [m.key for m in markets]})
+
+
+@router.get("/model", summary="Versão dos modelos em memória", description="Retorna a versão dos artefatos carregados no registro de modelos (recarregados automaticamente após cada treino).")
+async def model_version(market: Market = Depends(market_param)):
+    from ml.registry import registry_for
+    try:
+        snap = await run_cpu(registry_for(market).get)
+    except FileNotFoundError:
+        return {"status":"empty"}
+    meta = snap.reg_bundle.get("meta") if isinstance(snap.reg_bundle, dict) else None
+    return {"status":"ok","version": snap.version, "loaded_at": snap.loaded_at.isoformat(), "train": meta}
+
+
+@router.get("/versions", summary="Versões de modelos disponíveis", description="Lista as versões guardadas no diretório de artefatos (mais nova primeiro), com as métricas de cada manifest e qual está publicada.")
+def model_versions(market: Market = Depends(market_param)):
+    from ml.artifact_store import store_for
+    store = store_for(market)
+    current = store.current()
+    out = []
+    for v in reversed(store.versions()):
+        m = store.manifest(v)
+        out.append({"version": v, "current": v == current, "mode": m.get("mode"), "trained_at": m.get("trained_at"),
+                    "samples": m.get("samples"), "mae": m.get("mae"), "trees": m.get("trees")})
+    return {"status":"ok","current": current, "versions": out}
+
+
+@router.post("/rollback", summary="Republica uma versão anterior", description="Troca o ponteiro da versão publicada sem retreinar. Sem 'version', volta para a versão imediatamente anterior à atual.")
+async def rollback(version: Optional[str] = Query(None, description="Versão a publicar (ver /train/versions)"),
+                   market: Market = Depends(market_param)):
+    from ml.artifact_store import store_for
+    from ml.registry import registry_for
+    try:
+        published = await run_cpu(store_for(market).rollback, version)
+    except FileNotFoundError as e:
+        return {"status":"error","message":str(e)}
+    await run_cpu(registry_for(market).reload)
+    response_cache.invalidate()
+    return {"status":"ok","version": published}
@@ -1,11 +1,14 @@
 
 CREATE TABLE IF NOT EXISTS btc_candles (
-  time   TIMESTAMP PRIMARY KEY,
-  open   NUMERIC NOT NULL,
-  high   NUMERIC NOT NULL,
-  low    NUMERIC NOT NULL,
-  close  NUMERIC NOT NULL,
-  volume NUMERIC NOT NULL
+  symbol   TEXT NOT NULL,
+  interval TEXT NOT NULL,
+  time     TIMESTAMP NOT NULL,
+  open     NUMERIC NOT NULL,
+  high     NUMERIC NOT NULL,
+  low      NUMERIC NOT NULL,
+  close    NUMERIC NOT NULL,
+  volume   NUMERIC NOT NULL,
+  PRIMARY KEY (symbol, interval, time)
 );
 
 CREATE TABLE IF NOT EXISTS job_logs (
@@ -14,5 +17,9 @@ CREATE TABLE IF NOT EXISTS job_logs (
   status      TEXT NOT NULL,
   message     TEXT,
   started_at  TIMESTAMP NOT NULL,
-  finished_at TIMESTAMP NOT NULL
+  finished_at TIMESTAMP,
+  params      JSONB,
+  result      JSONB,
+  progress    REAL
 );
+CREATE INDEX IF NOT EXISTS job_logs_name_id_idx ON job_logs (job_name, id DESC);
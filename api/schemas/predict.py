@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class PredictInput(BaseModel):
 	close: float
@@ -16,3 +16,19 @@ class PredictLiteInput(BaseModel):
 	volume: float
 	high: Optional[float] = None
 	low: Optional[float] = None
+
+class PredictOutput(BaseModel):
+	open_next: float
+	high_next: float
+	low_next: float
+	close_next: float
+	amp_next: float
+	prob_up: float
+	prob_down: float
+	dir_next: int
+	err_close_abs: Optional[float] = None
+	err_amp_abs: Optional[float] = None
+
+class PredictResponse(BaseModel):
+	model_version: Optional[str] = None
+	predictions: List[PredictOutput] = []
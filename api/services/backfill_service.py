@@ -0,0 +1,215 @@
+import threading, time, requests
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+from core.config import settings
+from core.db import pg_conn
+from core.logging import log_job
+from core.jobs import report_progress
+from core.ratelimit import TokenBucket, binance_limiter
+from core.markets import Market
+from core.telemetry import operation, span
+from services.ingestion_service import normalize_klines_payload, upsert_candles, interval_to_ms, KLINES_WEIGHT
+
+
+def ensure_table() -> None:
+    """Checkpoints por janela do backfill (permite retomar um backfill interrompido)."""
+    with pg_conn() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                  symbol        TEXT NOT NULL,
+                  interval      TEXT NOT NULL,
+                  window_start  TIMESTAMP NOT NULL,
+                  window_end    TIMESTAMP NOT NULL,
+                  fetched       INTEGER NOT NULL,
+                  inserted      INTEGER NOT NULL,
+                  done_at       TIMESTAMP NOT NULL DEFAULT NOW(),
+                  PRIMARY KEY (symbol, interval, window_start)
+                );
+                """
+            )
+
+
+def _ms_to_dt(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+def plan_windows(start_ms: int, end_ms: int, interval_ms: int, limit: int) -> list[tuple[int, int]]:
+    """Janelas [início, fim) de `limit` candles alinhadas a uma grade absoluta.
+
+    O alinhamento faz com que execuções em momentos diferentes gerem as mesmas janelas,
+    o que permite reaproveitar os checkpoints já gravados.
+    """
+    span = interval_ms * limit
+    first = (start_ms // span) * span
+    return [(s, s + span) for s in range(first, end_ms, span)]
+
+
+def _done_windows(symbol: str, interval: str) -> set[datetime]:
+    with pg_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT window_start FROM backfill_checkpoints WHERE symbol=%s AND interval=%s",
+                (symbol, interval),
+            )
+            return {r[0] for r in cur.fetchall()}
+
+
+def _save_checkpoint(symbol: str, interval: str, start: datetime, end: datetime, fetched: int, inserted: int) -> None:
+    with pg_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO backfill_checkpoints(symbol, interval, window_start, window_end, fetched, inserted)
+                VALUES (%s,%s,%s,%s,%s,%s)
+                ON CONFLICT (symbol, interval, window_start) DO UPDATE SET
+                  window_end = EXCLUDED.window_end,
+                  fetched = EXCLUDED.fetched,
+                  inserted = EXCLUDED.inserted,
+                  done_at = NOW()
+                """,
+                (symbol, interval, start, end, fetched, inserted),
+            )
+
+
+class BackfillEngine:
+    """Backfill concorrente: janelas distribuídas em um pool de workers limitado pelo token bucket,
+    com busca (HTTP) e gravação (Postgres) sobrepostas e checkpoint por janela concluída.
+    """
+
+    def __init__(self, symbol: str, interval: str, limit: int = 1000, workers: int | None = None,
+                 limiter: TokenBucket | None = None, base_url: str | None = None,
+                 api_key: str | None = None, sleep_ms: int = 0, max_retries: int | None = None):
+        self.symbol = symbol
+        self.interval = interval
+        self.limit = limit
+        self.workers = max(1, workers or settings.BACKFILL_WORKERS)
+        self.limiter = limiter or binance_limiter
+        self.base_url = base_url or settings.BINANCE_BASE
+        self.api_key = api_key if api_key is not None else settings.BINANCE_API_KEY
+        self.sleep_ms = sleep_ms
+        self.max_retries = max_retries if max_retries is not None else settings.BACKFILL_MAX_RETRIES
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = self._local.session = requests.Session()
+            if self.api_key:
+                s.headers["X-MBX-APIKEY"] = self.api_key
+        return s
+
+    def fetch_window(self, start_ms: int, end_ms: int) -> list:
+        """Busca os klines de [start_ms, end_ms), respeitando o limitador e re-tentando 418/429/5xx."""
+        url = f"{self.base_url}/api/v3/klines"
+        params = {"symbol": self.symbol, "interval": self.interval, "limit": self.limit,
+                  "startTime": start_ms, "endTime": end_ms - 1}
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(KLINES_WEIGHT)
+            with self._calls_lock:
+                self.calls += 1
+            try:
+                with span("fetch"):
+                    resp = self._session().get(url, params=params, timeout=30)
+            except requests.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(30.0, 0.5 * 2 ** attempt))
+                continue
+            used = resp.headers.get("X-MBX-USED-WEIGHT-1M")
+            if used and used.isdigit():
+                self.limiter.sync_used(int(used))
+            if resp.status_code in (418, 429) or resp.status_code >= 500:
+                if attempt == self.max_retries:
+                    resp.raise_for_status()
+                retry_after = resp.headers.get("Retry-After")
+                backoff = float(retry_after) if retry_after and retry_after.isdigit() else min(60.0, 2.0 * 2 ** attempt)
+                if resp.status_code in (418, 429):
+                    # Ban/limite é por IP: pausa todos os workers, não só este
+                    self.limiter.pause(backoff)
+                else:
+                    time.sleep(backoff)
+                continue
+            resp.raise_for_status()
+            if self.sleep_ms:
+                time.sleep(self.sleep_ms / 1000.0)
+            return resp.json()
+        return []
+
+    def _write(self, start_ms: int, end_ms: int, data: list, complete: bool) -> tuple[int, int]:
+        df = normalize_klines_payload(data) if data else None
+        with span("db_write"):
+            inserted = upsert_candles(df, Market(self.symbol, self.interval)) if df is not None and len(df) else 0
+        fetched = len(df) if df is not None else 0
+        # A janela que contém "agora" ainda vai receber candles: não entra no checkpoint
+        if complete:
+            with span("db_write"):
+                _save_checkpoint(self.symbol, self.interval, _ms_to_dt(start_ms), _ms_to_dt(end_ms), fetched, inserted)
+        return fetched, inserted
+
+    def run(self, start_ms: int, end_ms: int, resume: bool = True) -> dict:
+        windows = plan_windows(start_ms, end_ms, interval_to_ms(self.interval), self.limit)
+        done = _done_windows(self.symbol, self.interval) if resume else set()
+        pending = [w for w in windows if _ms_to_dt(w[0]) not in done]
+        total_fetched = total_inserted = written = 0
+
+        # Workers buscam; esta thread grava à medida que as janelas chegam (no máximo 2×workers em voo)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backfill") as pool:
+            queue = iter(pending)
+            in_flight = {}
+            def submit_next():
+                w = next(queue, None)
+                if w is not None:
+                    # Com o contexto desta thread, para as etapas dos workers caírem na operação do job
+                    in_flight[pool.submit(copy_context().run, self.fetch_window, *w)] = w
+            for _ in range(self.workers * 2):
+                submit_next()
+            try:
+                while in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        w = in_flight.pop(fut)
+                        data = fut.result()
+                        submit_next()
+                        fetched, inserted = self._write(w[0], w[1], data, complete=w[1] <= end_ms)
+                        total_fetched += fetched
+                        total_inserted += inserted
+                        written += 1
+                        report_progress(written / len(pending), f"{written}/{len(pending)} janelas")
+            except BaseException:
+                for fut in in_flight:
+                    fut.cancel()
+                raise
+
+        return {"fetched": total_fetched, "inserted": total_inserted, "calls": self.calls,
+                "windows": len(windows), "skipped": len(windows) - len(pending)}
+
+
+@operation("backfill_job")
+def backfill_job(days: int|None=None, symbol: str|None=None, interval: str|None=None,
+                 sleep_ms: int|None=None, limit: int=1000, workers: int|None=None, resume: bool=True):
+    start_ts = datetime.utcnow()
+    try:
+        days = days or settings.BACKFILL_DAYS
+        symbol = symbol or settings.BINANCE_SYMBOL
+        interval = interval or settings.BINANCE_INTERVAL
+        sleep_ms = sleep_ms if sleep_ms is not None else settings.BACKFILL_SLEEP_MS
+
+        now_ms = int(datetime.now(timezone.utc).timestamp()*1000)
+        start_ms = now_ms - days*86_400_000
+        engine = BackfillEngine(symbol, interval, limit=limit, workers=workers, sleep_ms=sleep_ms)
+        res = engine.run(start_ms, now_ms, resume=resume)
+
+        msg = (f"Backfill {symbol} {interval} {days}d: fetched={res['fetched']}, inserted={res['inserted']}, "
+               f"calls={res['calls']}, windows={res['windows']}, resumed_skip={res['skipped']}")
+        log_job("backfill","ok",msg,start_ts,datetime.utcnow())
+        return {"status":"ok","fetched":res["fetched"],"inserted":res["inserted"],"calls":res["calls"],
+                "windows":res["windows"],"skipped":res["skipped"],"days":days}
+    except Exception as e:
+        log_job("backfill","error",str(e),start_ts,datetime.utcnow())
+        return {"status":"error","message":str(e)}
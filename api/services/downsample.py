@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+# Redução de resolução das séries dos gráficos (parâmetro max_points).
+#
+# As linhas são divididas em max_points buckets contíguos de tamanho quase igual (o bucket k vai
+# da linha ⌊k·n/m⌋ até antes de ⌊(k+1)·n/m⌋). Os candles de cada bucket viram um candle agregado
+# (open do primeiro, high máximo, low mínimo, close do último, volume somado, time do início do
+# bucket). Previsão, classe e probabilidades vêm da última linha do bucket, a mesma do close
+# mostrado; os erros são os piores do bucket (maior erro absoluto e o erro com sinal de maior
+# módulo), porque a média achataria os picos. A mesma agregação roda em SQL para series_cache
+# (series_cache_service), com resultado idêntico.
+#
+# /futures devolve linhas inteiras, escolhidas pelo LTTB (Largest-Triangle-Three-Buckets) sobre a
+# curva do close previsto: em cada bucket, a que forma o maior triângulo com a linha escolhida no
+# bucket anterior e a média do bucket seguinte; o primeiro e o último bucket ficam com a primeira e
+# a última linha da série.
+
+# Colunas tiradas da última linha do bucket
+LAST_COLS = [
+    "pred_open_next", "pred_high_next", "pred_low_next", "pred_close_next", "pred_amp_next",
+    "cls_dir_next", "prob_up", "prob_down",
+]
+
+
+def bucket_edges(n: int, max_points: int | None) -> np.ndarray | None:
+    """Limites [início, fim) dos buckets, ou None quando a série já cabe em max_points."""
+    if not max_points or n <= max_points:
+        return None
+    return np.arange(max_points + 1, dtype=np.int64) * n // max_points
+
+
+def _epoch_seconds(times) -> np.ndarray:
+    return pd.to_datetime(times).to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+
+
+def _curve(primary: pd.Series, fallback: pd.Series) -> np.ndarray:
+    # Sem previsão (sem modelo, última linha) a curva segue o real, para o LTTB nunca ver NaN
+    y = pd.to_numeric(primary, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    alt = pd.to_numeric(fallback, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    y = np.where(np.isfinite(y), y, alt)
+    return np.nan_to_num(pd.Series(y).ffill().bfill().to_numpy(), nan=0.0)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Índice da linha escolhida pelo LTTB em cada bucket definido por `edges`."""
+    starts, ends = edges[:-1], edges[1:]
+    m = len(starts)
+    counts = ends - starts
+    # Médias de todos os buckets de uma vez (terceiro vértice do triângulo)
+    mean_x = np.add.reduceat(x, starts) / counts
+    mean_y = np.add.reduceat(y, starts) / counts
+    out = np.empty(m, dtype=np.int64)
+    out[0], out[-1] = 0, len(x) - 1
+    a = 0
+    for i in range(1, m - 1):
+        s, e = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - mean_x[i + 1]) * (y[s:e] - ay) - (ax - x[s:e]) * (mean_y[i + 1] - ay))
+        a = out[i] = s + int(np.argmax(area))
+    return out
+
+
+def ohlcv_buckets(df: pd.DataFrame, edges: np.ndarray) -> pd.DataFrame:
+    """Um candle agregado por bucket: time e open do primeiro, high/low extremos, close do último, volume somado."""
+    starts, ends = edges[:-1], edges[1:]
+    return pd.DataFrame({
+        "time": df["time"].to_numpy()[starts],
+        "open": df["open"].to_numpy(dtype=np.float64)[starts],
+        "high": np.maximum.reduceat(df["high"].to_numpy(dtype=np.float64), starts),
+        "low": np.minimum.reduceat(df["low"].to_numpy(dtype=np.float64), starts),
+        "close": df["close"].to_numpy(dtype=np.float64)[ends - 1],
+        "volume": np.add.reduceat(df["volume"].to_numpy(dtype=np.float64), starts),
+    })
+
+
+def _floats(col: pd.Series) -> np.ndarray:
+    return pd.to_numeric(col, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _worst_signed(signed: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Erro com sinal de maior módulo em cada bucket (o primeiro em empate; NaN se o bucket não tem erro)
+    mag = np.where(np.isnan(signed), -1.0, np.abs(signed))
+    bucket = np.repeat(np.arange(len(starts)), ends - starts)
+    # Ordena por bucket, módulo decrescente e posição: a primeira linha de cada bucket é a escolhida
+    order = np.lexsort((np.arange(len(signed)), -mag, bucket))
+    return signed[order[starts]]
+
+
+def downsample_series(df: pd.DataFrame, max_points: int | None) -> pd.DataFrame:
+    """Série em colunas planas (layout de series_cache) com no máximo max_points linhas."""
+    edges = bucket_edges(len(df), max_points)
+    if edges is None:
+        return df
+    starts, ends = edges[:-1], edges[1:]
+    out = ohlcv_buckets(df, edges)
+    for k in LAST_COLS:
+        out[k] = df[k].to_numpy()[ends - 1]
+    for k in ("err_close_abs", "err_amp_abs"):
+        out[k] = np.fmax.reduceat(_floats(df[k]), starts)
+    out["err_close_signed"] = _worst_signed(_floats(df["err_close_signed"]), starts, ends)
+    return out[list(df.columns)]
+
+
+def downsample_futures(df: pd.DataFrame, max_points: int | None) -> pd.DataFrame:
+    """Série 'futures' (time, pred_close, real_close, err_close) reduzida pelo LTTB (linhas inteiras)."""
+    edges = bucket_edges(len(df), max_points)
+    if edges is None:
+        return df
+    pick = lttb_indices(_epoch_seconds(df["time"]), _curve(df["pred_close"], df["real_close"]), edges)
+    return df.iloc[pick].reset_index(drop=True)
@@ -1,68 +1,98 @@
-from datetime import datetime
+import json, threading
+from datetime import datetime, timedelta
 from typing import Iterable, List, Optional
 import pandas as pd
-import joblib
-from core.db import pg_conn
-from ml.features import build_features_targets
-from ml.model_paths import REG_PATH
+from core.db import pg_conn, iter_query_frames
+from ml.features import add_features_targets, feature_rows, FEATURE_COLS, TARGET_REG_COLS
+from ml.online_features import OnlineFeatureState, VOL_WINDOW
+from ml.registry import registry_for
+from core.markets import Market, DEFAULT_MARKET, migrate_market_key
+from services.ingestion_service import interval_to_ms
+from core import aiodb
+from core.aiodb import as_timestamp
+from core.executor import run_cpu
+from core.telemetry import operation, span
+from services.series_format import futures_points, ndjson_stream, ndjson_stream_async, single_frame
+from services.downsample import downsample_futures
 
 
 def ensure_table():
-    conn = pg_conn()
-    old_autocommit = conn.autocommit
-    try:
+    with pg_conn() as conn:
         conn.autocommit = True
         with conn.cursor() as cur:
             cur.execute(
                 """
                 CREATE TABLE IF NOT EXISTS futures (
-                  time        TIMESTAMP PRIMARY KEY,
+                  symbol      TEXT NOT NULL,
+                  interval    TEXT NOT NULL,
+                  time        TIMESTAMP NOT NULL,
                   pred_close  NUMERIC,
                   real_close  NUMERIC,
-                  err_close   NUMERIC
+                  err_close   NUMERIC,
+                  PRIMARY KEY (symbol, interval, time)
+                );
+                CREATE TABLE IF NOT EXISTS feature_state (
+                  key         TEXT PRIMARY KEY,
+                  state       JSONB NOT NULL,
+                  updated_at  TIMESTAMP NOT NULL DEFAULT NOW()
                 );
                 """
             )
-    finally:
-        conn.autocommit = old_autocommit
-        conn.close()
+            migrate_market_key(cur, "futures")
+
+
+def _load_reg_bundle(market: Market = DEFAULT_MARKET):
+    return registry_for(market).get().reg_bundle
 
 
-def _load_reg_bundle():
-    return joblib.load(REG_PATH)
+# Upsert de uma previsão prospectiva do mercado
+UPSERT_FUTURE = """
+INSERT INTO futures(symbol, interval, time, pred_close, real_close, err_close)
+VALUES (%s,%s,%s,%s,%s,%s)
+ON CONFLICT (symbol, interval, time) DO UPDATE SET
+  pred_close = EXCLUDED.pred_close,
+  real_close = EXCLUDED.real_close,
+  err_close = EXCLUDED.err_close
+"""
 
 
-def save_predictions_for_times(times: Iterable[datetime]):
+@operation("save_predictions_for_times")
+def save_predictions_for_times(times: Iterable[datetime], market: Market = DEFAULT_MARKET):
     """Para cada time em 'times', calcula a previsão de close_next baseada no candle anterior
     e insere (pred, real, erro) em 'futuros'. Ignora tempos já existentes.
     """
     times = sorted(set([t if isinstance(t, datetime) else pd.to_datetime(t).to_pydatetime() for t in times]))
     if not times:
         return 0
-    ensure_table()
     min_time = min(times)
-    with pg_conn() as conn:
+    with span("db_read"), pg_conn() as conn:
         df = pd.read_sql(
             """
             SELECT time, open, high, low, close, volume
             FROM btc_candles
-            WHERE time >= %s - INTERVAL '3 days'
+            WHERE symbol = %s AND interval = %s AND time >= %s - INTERVAL '3 days'
             ORDER BY time
             """,
             conn,
-            params=(min_time,),
+            params=(*market, min_time),
         )
     if df.empty or len(df) < 3:
         return 0
-    # Monta features com dropna (remove o último da janela consultada, mantendo pares prev->next)
-    df2, X, Yreg, _ = build_features_targets(df)
-    # Mapa: time_next -> idx_prev (features em T-1 geram target em T)
+    # Todas as linhas: o T a gravar pode ser o último da janela (sem alvo próprio)
+    with span("features"):
+        df2 = add_features_targets(df)
+        X = df2[FEATURE_COLS]
+        rows = feature_rows(df2)
+    # Mapa: time_next -> idx_prev (features em T-1 geram target em T). Só vale se T-1 tem features e
+    # o próximo candle dele está no mesmo trecho (close_next não nulo): previsões não atravessam lacunas
     next_to_prev = {}
+    has_next = df2["close_next"].notna().to_numpy()
     for i in range(len(df2)-1):
-        T_next = df2.iloc[i+1]["time"]
-        next_to_prev[T_next] = i
+        if rows[i] and has_next[i]:
+            next_to_prev[df2.iloc[i+1]["time"]] = i
     # Carrega modelo
-    reg_bundle = _load_reg_bundle()
+    with span("model_load"):
+        reg_bundle = _load_reg_bundle(market)
     def predict_close_next_one(x_row):
         if isinstance(reg_bundle, dict) and "models" in reg_bundle:
             model = reg_bundle["models"].get("close_next")
@@ -74,68 +104,201 @@ def save_predictions_for_times(times: Iterable[datetime]):
             return float(pred[idx])
     # Construir inserts apenas quando houver par (T-1, T)
     inserts: List[tuple] = []
-    for T in times:
-        T = pd.to_datetime(T).to_pydatetime()
-        idx_prev = next_to_prev.get(pd.Timestamp(T))
-        if idx_prev is None:
-            continue
-        idx_next = idx_prev + 1
-        x_row = X.iloc[idx_prev]
-        pred_close = predict_close_next_one(x_row)
-        real_close = float(df2.iloc[idx_next]["close"])
-        err = abs(pred_close - real_close)
-        inserts.append((T, pred_close, real_close, err))
+    with span("predict"):
+        for T in times:
+            T = pd.to_datetime(T).to_pydatetime()
+            idx_prev = next_to_prev.get(pd.Timestamp(T))
+            if idx_prev is None:
+                continue
+            idx_next = idx_prev + 1
+            x_row = X.iloc[idx_prev]
+            pred_close = predict_close_next_one(x_row)
+            real_close = float(df2.iloc[idx_next]["close"])
+            err = abs(pred_close - real_close)
+            inserts.append((*market, T, pred_close, real_close, err))
     if not inserts:
         return 0
-    with pg_conn() as conn:
+    with span("db_write"), pg_conn() as conn:
         with conn.cursor() as cur:
-            cur.executemany(
-                """
-                INSERT INTO futures(time, pred_close, real_close, err_close)
-                VALUES (%s,%s,%s,%s)
-                ON CONFLICT (time) DO UPDATE SET
-                  pred_close = EXCLUDED.pred_close,
-                  real_close = EXCLUDED.real_close,
-                  err_close = EXCLUDED.err_close
-                """,
-                inserts,
-            )
+            cur.executemany(UPSERT_FUTURE, inserts)
             return cur.rowcount
 
 
-def load_futuros_series(start: Optional[str], end: Optional[str]):
-    ensure_table()
-    params = []
-    where = []
+# Estado online das features por mercado (cache em memória do que está persistido em feature_state)
+_live_states: dict[Market, OnlineFeatureState | None] = {}
+_live_locks: dict[Market, threading.Lock] = {}
+_live_locks_guard = threading.Lock()
+# Candles anteriores usados para semear o estado (ret, acc e a janela de volume)
+_SEED_CANDLES = VOL_WINDOW + 2
+
+
+def _live_lock(market: Market) -> threading.Lock:
+    with _live_locks_guard:
+        return _live_locks.setdefault(market, threading.Lock())
+
+
+def _state_key(market: Market = DEFAULT_MARKET) -> str:
+    return market.key
+
+
+def _step(market: Market) -> timedelta:
+    return timedelta(milliseconds=interval_to_ms(market.interval))
+
+
+def _load_state(market: Market = DEFAULT_MARKET) -> OnlineFeatureState | None:
+    with pg_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT state FROM feature_state WHERE key=%s", (_state_key(market),))
+            row = cur.fetchone()
+    return OnlineFeatureState.from_dict(row[0], _step(market)) if row else None
+
+
+def _seed_state(before: datetime, market: Market = DEFAULT_MARKET) -> OnlineFeatureState:
+    with pg_conn() as conn:
+        df = pd.read_sql(
+            """
+            SELECT * FROM (
+              SELECT time, open, high, low, close, volume FROM btc_candles
+              WHERE symbol = %s AND interval = %s AND time < %s ORDER BY time DESC LIMIT %s
+            ) t ORDER BY time
+            """,
+            conn,
+            params=(*market, before, _SEED_CANDLES),
+        )
+    return OnlineFeatureState.replay(df, _step(market))
+
+
+def live_features(candles: list, market: Market = DEFAULT_MARKET) -> list:
+    """Features de cada candle como se fosse o próximo após o último ingerido (estado online atual, sem alterá-lo)."""
+    with _live_lock(market):
+        if _live_states.get(market) is None:
+            _live_states[market] = _load_state(market)
+        state = _live_states[market]
+        if state is None:
+            return [None] * len(candles)
+        return [state.peek(*c) for c in candles]
+
+
+def _predict_close_next(reg_bundle, X: pd.DataFrame):
+    if isinstance(reg_bundle, dict) and "models" in reg_bundle:
+        return reg_bundle["models"]["close_next"].predict(X)
+    return reg_bundle.predict(X)[:, TARGET_REG_COLS.index("close_next")]
+
+
+def save_live_predictions(until: datetime, market: Market = DEFAULT_MARKET) -> int:
+    """Caminho ao vivo do /ingest: avança o estado online de features até o candle fechado
+    'until' e grava em 'futures' a previsão de cada candle novo (feita com as features do
+    candle anterior), sem reconsultar a janela de dias nem refazer build_features_targets.
+    """
+    until = until if isinstance(until, datetime) else pd.to_datetime(until).to_pydatetime()
+    with _live_lock(market):
+        state = _live_states.get(market)
+        state = state if state is not None else _load_state(market)
+        # Estado ausente ou muito defasado: semeia com os candles imediatamente anteriores
+        if state is None or state.last_time is None or until - state.last_time > timedelta(days=3):
+            state = _seed_state(until, market)
+        if state.last_time is not None and until <= state.last_time:
+            _live_states[market] = state
+            return 0
+        with pg_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT time, open, high, low, close, volume FROM btc_candles
+                       WHERE symbol = %s AND interval = %s
+                         AND time > COALESCE(%s, '-infinity'::timestamp) AND time <= %s ORDER BY time""",
+                    (*market, state.last_time, until),
+                )
+                candles = cur.fetchall()
+        try:
+            pending = []
+            for t, o, h, l, c, v in candles:
+                # Depois de uma lacuna o candle anterior não é o T-1 deste: não há previsão a gravar
+                x_prev = state.feature_row() if state.is_next(t) else None
+                if x_prev is not None:
+                    pending.append((t, x_prev, float(c)))
+                state.push(t, float(o), float(h), float(l), float(c), float(v))
+            inserts = []
+            try:
+                reg_bundle = _load_reg_bundle(market) if pending else None
+            except FileNotFoundError:
+                # Mercado ainda sem modelo treinado: o estado avança, só não há previsão a gravar
+                reg_bundle = None
+            if reg_bundle is not None:
+                X = pd.DataFrame([x for _, x, _ in pending], columns=FEATURE_COLS)
+                preds = _predict_close_next(reg_bundle, X)
+                inserts = [(*market, t, float(p), real, abs(float(p) - real)) for (t, _, real), p in zip(pending, preds)]
+            with pg_conn() as conn:
+                with conn.cursor() as cur:
+                    if inserts:
+                        cur.executemany(UPSERT_FUTURE, inserts)
+                    cur.execute(
+                        """
+                        INSERT INTO feature_state(key, state, updated_at) VALUES (%s,%s,NOW())
+                        ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state, updated_at = NOW()
+                        """,
+                        (_state_key(market), json.dumps(state.to_dict())),
+                    )
+        except Exception:
+            # Descarta o estado em memória (parcialmente avançado); recarrega do banco na próxima chamada
+            _live_states[market] = None
+            raise
+        _live_states[market] = state
+    return len(inserts)
+
+
+def _futuros_query(start: Optional[str], end: Optional[str], market: Market = DEFAULT_MARKET):
+    params = list(market)
+    where = ["symbol = %s AND interval = %s"]
     if start and end:
         where.append("time BETWEEN %s AND %s")
-        params.extend([start, end])
+        params.extend([as_timestamp(start), as_timestamp(end)])
     query = "SELECT time, pred_close, real_close, err_close FROM futures"
     if where:
         query += " WHERE " + " AND ".join(where)
     query += " ORDER BY time"
+    return query, tuple(params)
+
+
+def load_futuros_series(start: Optional[str], end: Optional[str], market: Market = DEFAULT_MARKET):
+    query, params = _futuros_query(start, end, market)
     with pg_conn() as conn:
-        df = pd.read_sql(query, conn, params=tuple(params))
+        df = pd.read_sql(query, conn, params=params)
     if df.empty:
         return {"points": []}
-    # Sanitiza NaN/Inf para None para compatibilidade com JSON
-    def f(x):
-        try:
-            import math
-            if x is None:
-                return None
-            xv = float(x)
-            if math.isnan(xv) or math.isinf(xv):
-                return None
-            return xv
-        except Exception:
-            return None
-    points = []
-    for _, r in df.iterrows():
-        points.append({
-            "time": pd.to_datetime(r["time"]).isoformat(),
-            "pred_close": f(r.get("pred_close")),
-            "real_close": f(r.get("real_close")),
-            "err_close": f(r.get("err_close")),
-        })
-    return {"points": points}
+    return {"points": futures_points(df)}
+
+
+def load_futuros_frame(start: Optional[str], end: Optional[str], market: Market = DEFAULT_MARKET) -> pd.DataFrame:
+    """Série 'futures' em colunas planas (para o formato colunar)."""
+    query, params = _futuros_query(start, end, market)
+    with pg_conn() as conn:
+        return pd.read_sql(query, conn, params=params)
+
+
+def stream_futuros_series(start: Optional[str], end: Optional[str], market: Market = DEFAULT_MARKET):
+    """Série 'futures' em NDJSON, lida em blocos de um cursor server-side."""
+    query, params = _futuros_query(start, end, market)
+    return ndjson_stream(iter_query_frames(query, params), futures_points)
+
+
+async def load_futuros_series_async(start: Optional[str], end: Optional[str], max_points: Optional[int] = None,
+                                    market: Market = DEFAULT_MARKET):
+    df = await load_futuros_frame_async(start, end, max_points, market)
+    if df.empty:
+        return {"points": []}
+    return {"points": await run_cpu(futures_points, df)}
+
+
+async def load_futuros_frame_async(start: Optional[str], end: Optional[str], max_points: Optional[int] = None,
+                                   market: Market = DEFAULT_MARKET) -> pd.DataFrame:
+    query, params = _futuros_query(start, end, market)
+    df = await aiodb.fetch_frame(query, *params)
+    return await run_cpu(downsample_futures, df, max_points) if max_points else df
+
+
+def stream_futuros_series_async(start: Optional[str], end: Optional[str], max_points: Optional[int] = None,
+                                market: Market = DEFAULT_MARKET):
+    if max_points:
+        return ndjson_stream_async(single_frame(load_futuros_frame_async(start, end, max_points, market)), futures_points)
+    query, params = _futuros_query(start, end, market)
+    return ndjson_stream_async(aiodb.iter_frames(query, *params), futures_points)
@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from core import aiodb
+from core.aiodb import as_timestamp
+from core.config import settings
+from core.db import pg_conn
+from core.logging import log_job
+from core.markets import Market, DEFAULT_MARKET, MARKETS, run_markets
+from core.response_cache import response_cache
+from services.backfill_service import BackfillEngine
+from services.ingestion_service import normalize_klines_payload, upsert_candles, interval_to_ms
+from services.series_cache_service import build_series_cache, FEATURE_WARMUP
+
+# Slots da grade do intervalo sem candle, agrupados em lacunas contíguas (ilhas: time - n·passo é
+# constante dentro de uma sequência). Começa no primeiro candle gravado: antes dele é histórico
+# que ainda não foi baixado (trabalho do backfill), não lacuna.
+GAPS_QUERY = """
+WITH missing AS (
+  SELECT s.time
+  FROM generate_series(
+         GREATEST(%s::timestamp,
+                  COALESCE((SELECT MIN(time) FROM btc_candles WHERE symbol = %s AND interval = %s), 'infinity')),
+         %s::timestamp, %s::interval) AS s(time)
+  LEFT JOIN btc_candles c ON c.symbol = %s AND c.interval = %s AND c.time = s.time
+  WHERE c.time IS NULL
+)
+SELECT MIN(time) AS start, MAX(time) AS "end", COUNT(*) AS missing
+FROM (SELECT time, time - ROW_NUMBER() OVER (ORDER BY time) * %s::interval AS grp FROM missing) g
+GROUP BY grp
+ORDER BY start
+"""
+
+
+def _ms_to_dt(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+def _dt_to_ms(dt: datetime) -> int:
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def scan_window(days: Optional[int] = None, start=None, end=None, market: Market = DEFAULT_MARKET) -> tuple:
+    """(início, fim, passo) da varredura, alinhados à grade do intervalo; o fim é o último candle fechado."""
+    step = interval_to_ms(market.interval)
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    last_closed = (now_ms // step) * step - step
+    hi = min(_dt_to_ms(as_timestamp(end)), last_closed) if end is not None else last_closed
+    lo = _dt_to_ms(as_timestamp(start)) if start is not None else now_ms - (days or settings.LOOKBACK_DAYS) * 86_400_000
+    lo = -(-lo // step) * step
+    return _ms_to_dt(lo), _ms_to_dt(hi), timedelta(milliseconds=step)
+
+
+def _gaps_params(lo: datetime, hi: datetime, step: timedelta, market: Market) -> tuple:
+    return (lo, *market, hi, step, *market, step)
+
+
+def _gap_dict(row, step: timedelta) -> dict:
+    start, end, missing = row
+    # 'end' é o último slot vazio; o intervalo sem dados vai até o fechamento dele
+    return {"start": start.isoformat(), "end": (end + step).isoformat(), "missing": missing}
+
+
+def find_gaps(days: Optional[int] = None, start=None, end=None, market: Market = DEFAULT_MARKET) -> list[tuple]:
+    """Lacunas de btc_candles na janela: lista de (primeiro slot, último slot, candles faltando)."""
+    lo, hi, step = scan_window(days, start, end, market)
+    with pg_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(GAPS_QUERY, _gaps_params(lo, hi, step, market))
+            return cur.fetchall()
+
+
+async def gaps_report(days: Optional[int] = None, start=None, end=None, limit: int = 500,
+                      market: Market = DEFAULT_MARKET) -> dict:
+    """Relatório do /candles/gaps (leitura no pool asyncpg)."""
+    lo, hi, step = scan_window(days, start, end, market)
+    rows = await aiodb.fetch(GAPS_QUERY, *_gaps_params(lo, hi, step, market))
+    return {
+        "symbol": market.symbol, "interval": market.interval,
+        "start": lo.isoformat(), "end": (hi + step).isoformat(),
+        "gap_count": len(rows), "missing": sum(r["missing"] for r in rows),
+        "gaps": [_gap_dict(r, step) for r in rows[:limit]],
+    }
+
+
+def _affected_windows(repaired: list[tuple], step: timedelta) -> list[tuple]:
+    """Janelas [início, fim) de series_cache afetadas pelas lacunas reparadas, unidas quando se sobrepõem.
+
+    O candle anterior à lacuna ganha alvo (o close seguinte) e os FEATURE_WARMUP candles depois dela
+    mudam de features; o resto da série não muda.
+    """
+    windows = []
+    for first, last in sorted(repaired):
+        lo, hi = first - step, last + (FEATURE_WARMUP + 1) * step
+        if windows and lo <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], hi))
+        else:
+            windows.append((lo, hi))
+    return windows
+
+
+def repair_gaps(days: Optional[int] = None, start=None, end=None, market: Market = DEFAULT_MARKET) -> dict:
+    """Busca na Binance só os intervalos que faltam (em janelas de até 1000 candles) e grava.
+
+    Slots que continuam vazios depois da busca são períodos sem negociação na exchange (ex.:
+    manutenção) e seguem aparecendo no relatório. Com candles novos, series_cache é
+    rematerializada só em volta das lacunas reparadas (as features ali mudam).
+    """
+    started = datetime.utcnow()
+    try:
+        gaps = find_gaps(days, start, end, market)
+        engine = BackfillEngine(market.symbol, market.interval, limit=1000)
+        step = interval_to_ms(market.interval)
+        span = step * engine.limit
+        missing = fetched = inserted = 0
+        repaired = []
+        for first, last, n in gaps:
+            missing += n
+            stop = _dt_to_ms(last) + step
+            before = inserted
+            for s in range(_dt_to_ms(first), stop, span):
+                data = engine.fetch_window(s, min(s + span, stop))
+                if data:
+                    fetched += len(data)
+                    inserted += upsert_candles(normalize_klines_payload(data), market)
+            if inserted > before:
+                repaired.append((first, last))
+        materialized = sum(build_series_cache(days, market=market, window=w)
+                           for w in _affected_windows(repaired, timedelta(milliseconds=step)))
+    except Exception as e:
+        log_job("repair", "error", f"{market.key}: {e}", started, datetime.utcnow())
+        return {"status": "error", "message": str(e)}
+    msg = (f"{market.key}: gaps={len(gaps)}, missing={missing}, fetched={fetched}, inserted={inserted}, "
+           f"calls={engine.calls}, unfilled={missing - inserted}")
+    log_job("repair", "ok", msg, started, datetime.utcnow())
+    return {"status": "ok", "gaps": len(gaps), "missing": missing, "fetched": fetched, "inserted": inserted,
+            "unfilled": missing - inserted, "calls": engine.calls, "materialized": materialized}
+
+
+def repair_job(days: Optional[int] = None, start=None, end=None, markets: Optional[list] = None) -> dict:
+    """Reparo disparado pela API (/candles/gaps/repair) via core.jobs; um mercado por vez no pool de mercados."""
+    res = run_markets(repair_gaps, markets or MARKETS, days, start, end)
+    response_cache.invalidate()
+    return res
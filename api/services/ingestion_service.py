@@ -1,8 +1,13 @@
-import time, requests, pandas as pd
-from datetime import datetime, timedelta, timezone
+import requests, pandas as pd
 from core.config import settings
 from core.db import pg_conn
-from core.logging import log_job
+from core.bulk import copy_upsert
+from core.http import http_client
+from core.ratelimit import binance_limiter
+from core.markets import Market, DEFAULT_MARKET, migrate_market_key
+
+# Peso de request da Binance para GET /api/v3/klines
+KLINES_WEIGHT = 2
 
 def fetch_binance_klines(symbol=None, interval=None, limit=None) -> pd.DataFrame:
     symbol = symbol or settings.BINANCE_SYMBOL
@@ -15,21 +20,79 @@ def fetch_binance_klines(symbol=None, interval=None, limit=None) -> pd.DataFrame
     data = r.json()
     return normalize_klines_payload(data)
 
-def upsert_candles(df: pd.DataFrame) -> int:
-    sql = """INSERT INTO btc_candles (time, open, high, low, close, volume)
-             VALUES (%s,%s,%s,%s,%s,%s)
-             ON CONFLICT (time) DO NOTHING;"""
-    rows = list(df.itertuples(index=False, name=None))
+async def fetch_binance_klines_async(symbol=None, interval=None, limit=None, start_ms: int | None = None) -> pd.DataFrame:
+    """Versão async de fetch_binance_klines (cliente HTTP compartilhado, sem ocupar thread).
+
+    Com start_ms, busca a partir desse horário de abertura (preenchimento de lacunas) em vez dos últimos `limit`.
+    """
+    symbol = symbol or settings.BINANCE_SYMBOL
+    interval = interval or settings.BINANCE_INTERVAL
+    limit = limit or settings.BINANCE_LIMIT
+    params = {"symbol":symbol,"interval":interval,"limit":limit}
+    if start_ms is not None:
+        params["startTime"] = start_ms
+    await binance_limiter.acquire_async(KLINES_WEIGHT)
+    r = await http_client().get(f"{settings.BINANCE_BASE}/api/v3/klines", params=params)
+    r.raise_for_status()
+    return normalize_klines_payload(r.json())
+
+async def fetch_new_klines_async(market: Market = DEFAULT_MARKET, limit=None) -> pd.DataFrame:
+    """Ingestão delta: klines a partir do último candle gravado do mercado (ele incluído, pois pode
+    ter sido gravado ainda aberto), paginando até o candle atual. Sem candles gravados, os últimos `limit`.
+    """
+    from core import aiodb
+    limit = limit or settings.BINANCE_LIMIT
+    row = await aiodb.fetchrow("SELECT MAX(time) FROM btc_candles WHERE symbol = %s AND interval = %s", *market)
+    if row is None or row[0] is None:
+        return await fetch_binance_klines_async(market.symbol, market.interval, limit)
+    start = int(pd.Timestamp(row[0]).tz_localize("UTC").value // 1_000_000)
+    pages = []
+    while True:
+        df = await fetch_binance_klines_async(market.symbol, market.interval, limit, start_ms=start)
+        pages.append(df)
+        if len(df) < limit:
+            break
+        start = int(df["time"].iloc[-1].value // 1_000_000) + interval_to_ms(market.interval)
+    return pd.concat(pages, ignore_index=True) if len(pages) > 1 else pages[0]
+
+CANDLE_COLS = ["time","open","high","low","close","volume"]
+MARKET_COLS = ["symbol","interval"]
+
+def ensure_table() -> None:
+    """Candles de todos os mercados em btc_candles, chaveados por (symbol, interval, time)."""
     with pg_conn() as conn:
+        conn.autocommit = True
         with conn.cursor() as cur:
-            cur.executemany(sql, rows)
-            inserted = cur.rowcount
-    return inserted
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS btc_candles (
+                  symbol   TEXT NOT NULL,
+                  interval TEXT NOT NULL,
+                  time     TIMESTAMP NOT NULL,
+                  open     NUMERIC NOT NULL,
+                  high     NUMERIC NOT NULL,
+                  low      NUMERIC NOT NULL,
+                  close    NUMERIC NOT NULL,
+                  volume   NUMERIC NOT NULL,
+                  PRIMARY KEY (symbol, interval, time)
+                );
+                """
+            )
+            migrate_market_key(cur, "btc_candles")
+
+def upsert_candles(df: pd.DataFrame, market: Market = DEFAULT_MARKET, overwrite: bool = False) -> int:
+    # COPY + INSERT ... ON CONFLICT (symbol, interval, time) DO NOTHING: candles já gravados não são alterados.
+    # overwrite=True (candles fechados do stream) sobrescreve OHLCV, corrigindo um candle ainda aberto gravado pelo polling.
+    rows = ((*market, *r) for r in df[CANDLE_COLS].itertuples(index=False, name=None))
+    with pg_conn() as conn:
+        return copy_upsert(conn, "btc_candles", MARKET_COLS + CANDLE_COLS, rows, key=["symbol","interval","time"],
+                           update=CANDLE_COLS[1:] if overwrite else None).inserted
+
+KLINE_PAYLOAD_COLS = ["open_time","open","high","low","close","volume","close_time",
+                      "quote_asset_volume","trades","taker_buy_base","taker_buy_quote","ignore"]
 
 def normalize_klines_payload(data: list) -> pd.DataFrame:
-    cols = ["open_time","open","high","low","close","volume","close_time",
-            "quote_asset_volume","trades","taker_buy_base","taker_buy_quote","ignore"]
-    df = pd.DataFrame(data, columns=cols)
+    df = pd.DataFrame(data, columns=KLINE_PAYLOAD_COLS)
     for c in ["open","high","low","close","volume"]:
         df[c] = df[c].astype(float)
     df["time"] = pd.to_datetime(df["open_time"], unit="ms", utc=True).dt.tz_convert(None)
@@ -38,50 +101,4 @@ def normalize_klines_payload(data: list) -> pd.DataFrame:
 
 def interval_to_ms(interval: str) -> int:
     unit = interval[-1]; val = int(interval[:-1])
-    return {"m":60_000, "h":3_600_000, "d":86_400_000, "w":7*86_400_000}[unit]*val
-
-def fetch_klines_window(symbol: str, interval: str, start_ms: int, limit: int=1000, api_key: str|None=None):
-    url = f"{settings.BINANCE_BASE}/api/v3/klines"
-    headers = {"X-MBX-APIKEY": api_key} if api_key else {}
-    resp = requests.get(url, params={"symbol":symbol,"interval":interval,"limit":limit,"startTime":start_ms},
-                        headers=headers, timeout=30)
-    if resp.status_code in (418,429):
-        time.sleep(2.0)
-        resp = requests.get(url, params={"symbol":symbol,"interval":interval,"limit":limit,"startTime":start_ms},
-                            headers=headers, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
-    if not data: return [], None
-    return data, data[-1][0]
-
-def backfill_job(days: int|None=None, symbol: str|None=None, interval: str|None=None,
-                 sleep_ms: int|None=None, limit: int=1000):
-    start_ts = datetime.utcnow()
-    try:
-        days = days or settings.BACKFILL_DAYS
-        symbol = symbol or settings.BINANCE_SYMBOL
-        interval = interval or settings.BINANCE_INTERVAL
-        sleep_ms = sleep_ms if sleep_ms is not None else settings.BACKFILL_SLEEP_MS
-
-        now_ms = int(datetime.now(timezone.utc).timestamp()*1000)
-        start_ms = now_ms - days*86_400_000
-        interval_ms = interval_to_ms(interval)
-        total_fetched = total_inserted = loops = 0
-        current_ms = start_ms
-        while True:
-            data, last_open = fetch_klines_window(symbol, interval, current_ms, limit=limit, api_key=settings.BINANCE_API_KEY)
-            loops += 1
-            if not data: break
-            df = normalize_klines_payload(data)
-            total_inserted += upsert_candles(df)
-            total_fetched += len(df)
-            current_ms = last_open + interval_ms
-            if current_ms >= now_ms: break
-            time.sleep(sleep_ms/1000.0)
-
-        msg = f"Backfill {symbol} {interval} {days}d: fetched={total_fetched}, inserted={total_inserted}, calls={loops}"
-        log_job("backfill","ok",msg,start_ts,datetime.utcnow())
-        return {"status":"ok","fetched":total_fetched,"inserted":total_inserted,"calls":loops,"days":days}
-    except Exception as e:
-        log_job("backfill","error",str(e),start_ts,datetime.utcnow())
-        return {"status":"error","message":str(e)}
+    return {"s":1_000, "m":60_000, "h":3_600_000, "d":86_400_000, "w":7*86_400_000}[unit]*val
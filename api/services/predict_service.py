@@ -0,0 +1,115 @@
+import asyncio
+from functools import partial
+import numpy as np
+from core.config import settings
+from core.executor import run_cpu
+from ml.inference import engine_for, OUTPUT_COLS
+from ml.registry import registry_for
+from core.markets import Market, DEFAULT_MARKET
+
+def predict_matrix(X: np.ndarray, market: Market = DEFAULT_MARKET) -> tuple[np.ndarray, str]:
+    """Prevê as linhas de X (float32, colunas em FEATURE_COLS) com os modelos publicados.
+
+    Retorna (matriz n × OUTPUT_COLS do ml.inference, versão do modelo), sem montar DataFrame.
+    """
+    snap = registry_for(market).get()
+    return engine_for(snap).predict(X), snap.version
+
+
+class MicroBatcher:
+    """Junta chamadas concorrentes de poucas linhas em um único predict.
+
+    A primeira chamada abre uma janela de `window_ms`; as que chegam dentro dela entram no mesmo
+    lote, que é despachado ao fechar a janela ou ao atingir `max_rows`. O predict roda no executor
+    de CPU e cada chamada recebe de volta só as suas linhas. Chamadas com max_rows linhas ou mais
+    vão direto, sem esperar a janela.
+    """
+
+    def __init__(self, fn, window_ms: float, max_rows: int):
+        self.fn = fn
+        self.window = window_ms / 1000.0
+        self.max_rows = max_rows
+        self._pending: list = []
+        self._rows = 0
+        self._timer: asyncio.TimerHandle | None = None
+        # Lotes em andamento: a referência impede que o loop descarte a task no meio do predict
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = self.calls = 0
+
+    async def predict(self, X: np.ndarray):
+        self.calls += 1
+        if len(X) >= self.max_rows:
+            self.batches += 1
+            return await run_cpu(self.fn, X)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((X, fut))
+        self._rows += len(X)
+        if self._rows >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush) if self.window > 0 else loop.call_soon(self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._rows = self._pending, [], 0
+        if batch:
+            self.batches += 1
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def drain(self) -> None:
+        """Despacha o que está na janela e espera os lotes em andamento (shutdown)."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, batch) -> None:
+        try:
+            X = batch[0][0] if len(batch) == 1 else np.concatenate([x for x, _ in batch])
+            out, version = await run_cpu(self.fn, X)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        i = 0
+        for x, fut in batch:
+            if not fut.done():
+                fut.set_result((out[i:i + len(x)], version))
+            i += len(x)
+
+
+predict_batcher = MicroBatcher(predict_matrix, settings.PREDICT_BATCH_WINDOW_MS, settings.PREDICT_BATCH_MAX_ROWS)
+# Um lote só junta linhas do mesmo mercado (modelos diferentes)
+_batchers: dict[Market, MicroBatcher] = {DEFAULT_MARKET: predict_batcher}
+
+
+def batcher_for(market: Market = DEFAULT_MARKET) -> MicroBatcher:
+    b = _batchers.get(market)
+    if b is None:
+        b = _batchers[market] = MicroBatcher(partial(predict_matrix, market=market),
+                                             settings.PREDICT_BATCH_WINDOW_MS, settings.PREDICT_BATCH_MAX_ROWS)
+    return b
+
+
+async def drain_batchers() -> None:
+    await asyncio.gather(*(b.drain() for b in list(_batchers.values())))
+
+
+def prediction_rows(out: np.ndarray, real_close_next=None, real_amp_next=None) -> list:
+    """Linhas da resposta do /predict a partir da matriz de predict_matrix."""
+    rows = []
+    for i, p in enumerate(out.tolist()):
+        row = dict(zip(OUTPUT_COLS, p))
+        row["dir_next"] = int(row["dir_next"])
+        if real_close_next is not None and real_close_next[i] is not None:
+            row["err_close_abs"] = abs(row["close_next"] - real_close_next[i])
+        if real_amp_next is not None and real_amp_next[i] is not None:
+            row["err_amp_abs"] = abs(row["amp_next"] - real_amp_next[i])
+        rows.append(row)
+    return rows
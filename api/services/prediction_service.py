@@ -1,67 +1,115 @@
-import joblib, numpy as np, pandas as pd
+import numpy as np, pandas as pd
 from typing import Optional
+from core import aiodb
+from core.aiodb import as_timestamp
 from core.db import pg_conn
-from ml.features import build_features_targets, TARGET_REG_COLS
-from ml.model_paths import REG_PATH, CLS_PATH
-
-
-def load_models():
-	return joblib.load(REG_PATH), joblib.load(CLS_PATH)
-
-
-def _predict_regressors(reg_bundle, X: pd.DataFrame) -> pd.DataFrame:
-	"""Suporta tanto o formato antigo (um único modelo multi-saída) quanto o novo (dict por alvo)."""
-	# Formato novo: um dicionário com vários modelos
-	if isinstance(reg_bundle, dict) and "models" in reg_bundle:
-		preds = {}
-		for target in TARGET_REG_COLS:
-			model = reg_bundle["models"].get(target)
-			if model is None:
-				preds[target] = np.full((len(X),), np.nan)
-			else:
-				preds[target] = model.predict(X)
-		return pd.DataFrame(preds, index=X.index)
-	# Formato antigo: modelo único, .predict() retorna uma matriz com várias colunas (uma por target)
-	else:
-		arr = reg_bundle.predict(X)
-		return pd.DataFrame(arr, columns=TARGET_REG_COLS, index=X.index)
-
-
-def series_data(start: Optional[str], end: Optional[str], fallback_days: int=90):
-	with pg_conn() as conn:
-		if start and end:
-			q = """SELECT time, open, high, low, close, volume FROM btc_candles
-				   WHERE time BETWEEN %s AND %s ORDER BY time;"""
-			df = pd.read_sql(q, conn, params=(start,end))
-		else:
-			q = """SELECT time, open, high, low, close, volume FROM btc_candles
-				   WHERE time >= NOW() - INTERVAL %s ORDER BY time;"""
-			df = pd.read_sql(q, conn, params=(f'{fallback_days} days',))
-	if df.empty or len(df) < 30: return {"points":[]}
-
-	df2, X, Yreg, Ycls = build_features_targets(df)
+from core.executor import run_cpu
+from core.telemetry import operation, span
+from ml.features import add_features_targets, feature_rows, FEATURE_COLS
+from ml.inference import engine_for
+from ml.registry import registry_for
+from core.markets import Market, DEFAULT_MARKET
+from services.series_format import series_points, series_frame, cached_points, scatter_predictions, SERIES_COLUMNS
+from services.downsample import downsample_series
+
+
+def load_models(market: Market = DEFAULT_MARKET):
+	snap = registry_for(market).get()
+	return snap.reg_bundle, snap.cls
+
+
+def _candles_query(start: Optional[str], end: Optional[str], fallback_days: int=90, market: Market=DEFAULT_MARKET):
+	if start and end:
+		q = """SELECT time, open, high, low, close, volume FROM btc_candles
+			   WHERE symbol = %s AND interval = %s AND time BETWEEN %s AND %s ORDER BY time;"""
+		return q, (*market, as_timestamp(start), as_timestamp(end))
+	q = """SELECT time, open, high, low, close, volume FROM btc_candles
+		   WHERE symbol = %s AND interval = %s AND time >= NOW() - make_interval(days => %s) ORDER BY time;"""
+	return q, (*market, int(fallback_days))
+
+
+def _predict_inputs(df: pd.DataFrame, market: Market=DEFAULT_MARKET):
+	"""Todos os candles com features (df2) e as previsões de regressão/classificação por linha.
+
+	Só as linhas com features completas são previstas; as demais (aquecimento da janela e de cada
+	trecho depois de uma lacuna) seguem na série só com o real.
+	"""
+	if df.empty or len(df) < 30: return None
+
+	with span("features"):
+		df2 = add_features_targets(df)
+		rows = feature_rows(df2)
+		X = df2.loc[rows, FEATURE_COLS].reset_index(drop=True)
 	try:
-		reg_bundle, cls = load_models()
-		reg_pred = _predict_regressors(reg_bundle, X)
-		cls_pred = cls.predict(X); prob = cls.predict_proba(X)
+		with span("model_load"):
+			engine = engine_for(registry_for(market).get())
+		# Regressores e classificador em uma passada sobre o mesmo buffer float32
+		with span("predict"):
+			reg_pred, cls_pred, prob = scatter_predictions(rows, *engine.predict_parts(X))
 	except Exception:
 		reg_pred = cls_pred = prob = None
+	return df2, reg_pred, cls_pred, prob
+
+
+def _load_candles(start: Optional[str], end: Optional[str], fallback_days: int=90, market: Market=DEFAULT_MARKET) -> pd.DataFrame:
+	q, params = _candles_query(start, end, fallback_days, market)
+	with span("db_read"), pg_conn() as conn:
+		return pd.read_sql(q, conn, params=params)
+
+
+async def _fetch_candles(start: Optional[str], end: Optional[str], fallback_days: int=90, market: Market=DEFAULT_MARKET) -> pd.DataFrame:
+	q, params = _candles_query(start, end, fallback_days, market)
+	with span("db_read"):
+		return await aiodb.fetch_frame(q, *params)
+
+
+def _points(df: pd.DataFrame, market: Market=DEFAULT_MARKET):
+	inputs = _predict_inputs(df, market)
+	if inputs is None: return {"points":[]}
+	with span("response_build"):
+		return {"points": series_points(*inputs)}
+
+
+def _frame(df: pd.DataFrame, market: Market=DEFAULT_MARKET) -> pd.DataFrame:
+	inputs = _predict_inputs(df, market)
+	if inputs is None: return pd.DataFrame(columns=SERIES_COLUMNS)
+	with span("response_build"):
+		return series_frame(*inputs)
+
+
+@operation("series_data")
+def series_data(start: Optional[str], end: Optional[str], fallback_days: int=90, market: Market=DEFAULT_MARKET):
+	return _points(_load_candles(start, end, fallback_days, market), market)
+
+
+@operation("series_data")
+def series_data_frame(start: Optional[str], end: Optional[str], fallback_days: int=90, market: Market=DEFAULT_MARKET) -> pd.DataFrame:
+	"""Mesma série de series_data em colunas planas (para o formato colunar)."""
+	return _frame(_load_candles(start, end, fallback_days, market), market)
+
+
+async def series_data_async(start: Optional[str], end: Optional[str], fallback_days: int=90, max_points: Optional[int]=None,
+							market: Market=DEFAULT_MARKET):
+	"""series_data com leitura via asyncpg e features/predict no executor de CPU."""
+	with operation("series_data"):
+		if max_points:
+			# Reduzida, a série sai das colunas planas (mesma estrutura de pontos do /series/cached)
+			frame = await _series_frame_async(start, end, fallback_days, max_points, market)
+			with span("response_build"):
+				return {"points": await run_cpu(cached_points, frame) if len(frame) else []}
+		return await run_cpu(_points, await _fetch_candles(start, end, fallback_days, market), market)
+
+
+async def _series_frame_async(start: Optional[str], end: Optional[str], fallback_days: int, max_points: Optional[int],
+							  market: Market) -> pd.DataFrame:
+	frame = await run_cpu(_frame, await _fetch_candles(start, end, fallback_days, market), market)
+	if not max_points:
+		return frame
+	with span("downsample"):
+		return await run_cpu(downsample_series, frame, max_points)
+
 
-	out = []
-	for i in range(len(df2)):
-		real = {k: (float(df2.iloc[i][k]) if k!="time" else df2.iloc[i]["time"].isoformat())
-				for k in ["time","open","high","low","close","volume"]}
-		pred = {k: float(reg_pred.iloc[i][k]) for k in TARGET_REG_COLS} if reg_pred is not None else None
-		clsinfo = ({"dir_next": int(cls_pred[i]), "prob_up": float(prob[i][1]), "prob_down": float(prob[i][0])}
-				   if cls_pred is not None else None)
-		err = None
-		if pred is not None and i+1 < len(df2):
-			real_next_close = float(df2.iloc[i+1]["close"])
-			real_next_amp = float(df2.iloc[i+1]["high"] - df2.iloc[i+1]["low"])
-			err = {
-				"close_abs": abs(pred["close_next"] - real_next_close),
-				"close_signed": pred["close_next"] - real_next_close,
-				"amp_abs": abs(pred["amp_next"] - real_next_amp)
-			}
-		out.append({"real": real, "pred": pred, "cls": clsinfo, "err": err})
-	return {"points": out}
+async def series_data_frame_async(start: Optional[str], end: Optional[str], fallback_days: int=90, max_points: Optional[int]=None,
+								  market: Market=DEFAULT_MARKET) -> pd.DataFrame:
+	with operation("series_data"):
+		return await _series_frame_async(start, end, fallback_days, max_points, market)
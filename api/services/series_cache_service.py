@@ -1,24 +1,32 @@
-from typing import Optional, List, Tuple
+from typing import Optional
 import pandas as pd
-import numpy as np
-import joblib
-from core.db import pg_conn
+from core import aiodb
+from core.aiodb import as_timestamp
+from core.db import pg_conn, iter_query_frames
+from core.executor import run_cpu
+from core.bulk import copy_upsert
+from core.response_cache import response_cache
 from core.config import settings
-from ml.features import build_features_targets, TARGET_REG_COLS
-from ml.model_paths import REG_PATH, CLS_PATH
+from core.telemetry import operation, span
+from ml.features import add_features_targets, feature_rows, FEATURE_COLS
+from ml.registry import registry_for
+from core.markets import Market, DEFAULT_MARKET, MARKETS, migrate_market_key, run_markets
+from ml.inference import engine_for
+from services.series_format import cached_points, ndjson_stream, ndjson_stream_async, single_frame, series_frame, scatter_predictions, SERIES_COLUMNS
+from services.downsample import LAST_COLS
 
 
 def ensure_table() -> None:
     """Create cached series table if not exists (materialized series for charts)."""
-    conn = pg_conn()
-    old_autocommit = conn.autocommit
-    try:
+    with pg_conn() as conn:
         conn.autocommit = True
         with conn.cursor() as cur:
             cur.execute(
                 """
                 CREATE TABLE IF NOT EXISTS series_cache (
-                  time                TIMESTAMP PRIMARY KEY,
+                  symbol              TEXT NOT NULL,
+                  interval            TEXT NOT NULL,
+                  time                TIMESTAMP NOT NULL,
                   open                NUMERIC,
                   high                NUMERIC,
                   low                 NUMERIC,
@@ -34,231 +42,243 @@ def ensure_table() -> None:
                   prob_down           NUMERIC,
                   err_close_abs       NUMERIC,
                   err_close_signed    NUMERIC,
-                  err_amp_abs         NUMERIC
+                  err_amp_abs         NUMERIC,
+                  PRIMARY KEY (symbol, interval, time)
                 );
+                ALTER TABLE series_cache ADD COLUMN IF NOT EXISTS model_version TEXT;
                 """
             )
-    finally:
-        conn.autocommit = old_autocommit
-        conn.close()
+            migrate_market_key(cur, "series_cache")
 
 
-def _load_models():
-    return joblib.load(REG_PATH), joblib.load(CLS_PATH)
+CACHE_COLS = SERIES_COLUMNS + ["model_version"]
+MARKET_COLS = ["symbol", "interval"]
 
+# Candles anteriores necessários para recalcular as features da primeira linha (rolling(10) de volume, ret, acc)
+FEATURE_WARMUP = 16
 
-def _predict_regressors(reg_bundle, X: pd.DataFrame) -> pd.DataFrame:
-    if isinstance(reg_bundle, dict) and "models" in reg_bundle:
-        preds = {}
-        for target in TARGET_REG_COLS:
-            model = reg_bundle["models"].get(target)
-            preds[target] = model.predict(X) if model is not None else np.full((len(X),), np.nan)
-        return pd.DataFrame(preds, index=X.index)
-    else:
-        arr = reg_bundle.predict(X)
-        return pd.DataFrame(arr, columns=TARGET_REG_COLS, index=X.index)
 
+def _last_materialized(market: Market = DEFAULT_MARKET):
+    """(time, model_version) da linha mais recente do mercado em series_cache, ou None se vazia."""
+    with pg_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT time, model_version FROM series_cache WHERE symbol = %s AND interval = %s ORDER BY time DESC LIMIT 1",
+                tuple(market),
+            )
+            return cur.fetchone()
 
-def build_series_cache(days: Optional[int] = None) -> int:
-    """Recalcula a série utilizada pelos gráficos e materializa na tabela series_cache.
-    Retorna número de linhas upsertadas.
-    """
-    ensure_table()
-    days = days or settings.LOOKBACK_DAYS
+
+def _load_candles(days: int, market: Market = DEFAULT_MARKET) -> pd.DataFrame:
     with pg_conn() as conn:
-        df = pd.read_sql(
+        return pd.read_sql(
             """
             SELECT time, open, high, low, close, volume
             FROM btc_candles
-            WHERE time >= NOW() - %s::interval
+            WHERE symbol = %s AND interval = %s AND time >= NOW() - %s::interval
             ORDER BY time
             """,
             conn,
-            params=(f"{days} days",),
+            params=(*market, f"{days} days"),
+        )
+
+
+def _load_candles_since(since, market: Market = DEFAULT_MARKET, until=None) -> pd.DataFrame:
+    # Inclui FEATURE_WARMUP candles anteriores a 'since' para que as features de 'since' fiquem completas
+    # (e, com 'until', vai até ele inclusive: o close seguinte da última linha da janela)
+    with pg_conn() as conn:
+        return pd.read_sql(
+            """
+            SELECT time, open, high, low, close, volume
+            FROM btc_candles
+            WHERE symbol = %s AND interval = %s AND time >= COALESCE(
+              (SELECT time FROM btc_candles WHERE symbol = %s AND interval = %s AND time < %s
+               ORDER BY time DESC OFFSET %s LIMIT 1),
+              '-infinity'::timestamp
+            ) AND time <= COALESCE(%s::timestamp, 'infinity'::timestamp)
+            ORDER BY time
+            """,
+            conn,
+            params=(*market, *market, since, FEATURE_WARMUP - 1, until),
         )
-    if df.empty or len(df) < 3:
-        return 0
 
-    df2, X, Yreg, Ycls = build_features_targets(df)
+
+@operation("build_series_cache")
+def build_series_cache(days: Optional[int] = None, incremental: bool = False, market: Market = DEFAULT_MARKET,
+                       window: Optional[tuple] = None) -> int:
+    """Recalcula a série utilizada pelos gráficos e materializa na tabela series_cache.
+
+    No modo incremental recalcula apenas a partir da última linha materializada (ela própria
+    incluída, pois seus erros dependem do close seguinte). Se a versão do modelo mudou desde a
+    última materialização, ou se a tabela está vazia, faz o rebuild completo da janela.
+    Com `window` = (início, fim), recalcula só as linhas em [início, fim) (ex.: em volta de
+    lacunas reparadas), limitado aos últimos `days` dias.
+    Retorna número de linhas upsertadas.
+    """
+    days = days or settings.LOOKBACK_DAYS
     try:
-        reg_bundle, cls = _load_models()
-        reg_pred = _predict_regressors(reg_bundle, X)
-        cls_pred = cls.predict(X)
-        prob = cls.predict_proba(X)
+        with span("model_load"):
+            snap = registry_for(market).get()
     except Exception:
         # se modelos não existirem ainda, materializa somente o real
-        reg_pred = cls_pred = prob = None
+        snap = None
+    version = snap.version if snap is not None else None
 
-    # construir linhas alinhadas i (real em i) com pred de i (para i+1) e erros conforme real i+1
-    import math
-    def safe_float(x):
+    with span("db_read"):
+        since = until = None
+        if window is not None:
+            lookback = pd.Timestamp.now(tz="UTC").tz_localize(None) - pd.Timedelta(days=days)
+            since, until = max(pd.Timestamp(window[0]), lookback), pd.Timestamp(window[1])
+            if since >= until:
+                return 0
+        elif incremental:
+            last = _last_materialized(market)
+            if last is not None and last[1] == version:
+                since = last[0]
+        df = _load_candles(days, market) if since is None else _load_candles_since(since, market, until)
+    if df.empty or len(df) < 3:
+        return 0
+
+    with span("features"):
+        df2 = add_features_targets(df)
+        rows = feature_rows(df2)
+        X = df2.loc[rows, FEATURE_COLS].reset_index(drop=True)
+    reg_pred = cls_pred = prob = None
+    if snap is not None:
         try:
-            xv = float(x)
-            if math.isnan(xv) or math.isinf(xv):
-                return None
-            return xv
+            with span("model_load"):
+                engine = engine_for(snap)
+            with span("predict"):
+                reg_pred, cls_pred, prob = scatter_predictions(rows, *engine.predict_parts(X))
         except Exception:
-            return None
-    inserts: List[Tuple] = []
-    for i in range(len(df2)):
-        real = df2.iloc[i]
-        time_i = pd.to_datetime(real["time"]).to_pydatetime()
-        open_i  = safe_float(real["open"]) 
-        high_i  = safe_float(real["high"]) 
-        low_i   = safe_float(real["low"]) 
-        close_i = safe_float(real["close"]) 
-        vol_i   = safe_float(real["volume"]) 
-
-        pred_open = pred_high = pred_low = pred_close = pred_amp = None
-        cls_dir = None
-        p_up = p_down = None
-        err_close_abs = err_close_signed = err_amp_abs = None
-
-        if reg_pred is not None:
-            pred_open  = safe_float(reg_pred.iloc[i]["open_next"]) if i < len(reg_pred) else None
-            pred_high  = safe_float(reg_pred.iloc[i]["high_next"]) if i < len(reg_pred) else None
-            pred_low   = safe_float(reg_pred.iloc[i]["low_next"])  if i < len(reg_pred) else None
-            pred_close = safe_float(reg_pred.iloc[i]["close_next"]) if i < len(reg_pred) else None
-            pred_amp   = safe_float(reg_pred.iloc[i]["amp_next"]) if i < len(reg_pred) else None
-        if cls_pred is not None:
-            cls_dir = int(cls_pred[i]) if i < len(cls_pred) else None
-            if prob is not None and i < len(prob):
-                p_down = safe_float(prob[i][0])
-                p_up   = safe_float(prob[i][1])
-
-        if pred_close is not None and i + 1 < len(df2):
-            real_next_close = safe_float(df2.iloc[i + 1]["close"]) 
-            real_next_amp = safe_float(df2.iloc[i + 1]["high"] - df2.iloc[i + 1]["low"]) 
-            if real_next_close is not None:
-                err_close_abs = safe_float(abs(pred_close - real_next_close))
-                err_close_signed = safe_float(pred_close - real_next_close)
-            if pred_amp is not None and real_next_amp is not None:
-                err_amp_abs = safe_float(abs(pred_amp - real_next_amp))
-
-        inserts.append(
-            (
-                time_i,
-                open_i, high_i, low_i, close_i, vol_i,
-                pred_open, pred_high, pred_low, pred_close, pred_amp,
-                cls_dir, p_up, p_down,
-                err_close_abs, err_close_signed, err_amp_abs,
-            )
-        )
+            reg_pred = cls_pred = prob = None
+            version = None
 
-    if not inserts:
+    with span("response_build"):
+        frame = series_frame(df2, reg_pred, cls_pred, prob)
+        frame["model_version"] = version
+        if since is not None:
+            frame = frame[frame["time"] >= pd.Timestamp(since)]
+        if until is not None:
+            frame = frame[frame["time"] < until]
+    if frame.empty:
         return 0
 
-    with pg_conn() as conn:
-        with conn.cursor() as cur:
-            cur.executemany(
-                """
-                INSERT INTO series_cache(
-                  time, open, high, low, close, volume,
-                  pred_open_next, pred_high_next, pred_low_next, pred_close_next, pred_amp_next,
-                  cls_dir_next, prob_up, prob_down,
-                  err_close_abs, err_close_signed, err_amp_abs
-                ) VALUES (
-                  %s,%s,%s,%s,%s,%s,
-                  %s,%s,%s,%s,%s,
-                  %s,%s,%s,
-                  %s,%s,%s
-                )
-                ON CONFLICT (time) DO UPDATE SET
-                  open = EXCLUDED.open,
-                  high = EXCLUDED.high,
-                  low  = EXCLUDED.low,
-                  close= EXCLUDED.close,
-                  volume= EXCLUDED.volume,
-                  pred_open_next = EXCLUDED.pred_open_next,
-                  pred_high_next = EXCLUDED.pred_high_next,
-                  pred_low_next  = EXCLUDED.pred_low_next,
-                  pred_close_next= EXCLUDED.pred_close_next,
-                  pred_amp_next  = EXCLUDED.pred_amp_next,
-                  cls_dir_next   = EXCLUDED.cls_dir_next,
-                  prob_up        = EXCLUDED.prob_up,
-                  prob_down      = EXCLUDED.prob_down,
-                  err_close_abs  = EXCLUDED.err_close_abs,
-                  err_close_signed=EXCLUDED.err_close_signed,
-                  err_amp_abs    = EXCLUDED.err_amp_abs
-                """,
-                inserts,
-            )
-            return cur.rowcount
+    rows = ((*market, *r) for r in frame.itertuples(index=False, name=None))
+    with span("db_write"), pg_conn() as conn:
+        res = copy_upsert(
+            conn, "series_cache", MARKET_COLS + CACHE_COLS, rows,
+            key=MARKET_COLS + ["time"], update=CACHE_COLS[1:],
+        )
+    return res.inserted + res.updated
+
+
+def _rebuild_market(days: Optional[int] = None, incremental: bool = False, market: Market = DEFAULT_MARKET) -> dict:
+    return {"status": "ok", "materialized": build_series_cache(days, incremental=incremental, market=market)}
+
 
+def rebuild_job(days: Optional[int] = None, incremental: bool = False, markets: Optional[list] = None) -> dict:
+    """Materialização disparada pela API (/series/rebuild, /train/apply) via core.jobs.
 
-def load_series_cached(start: Optional[str], end: Optional[str], fallback_days: int = 90):
-    ensure_table()
-    params = []
-    where = []
+    Com vários mercados, cada um é materializado em paralelo no pool de mercados.
+    """
+    res = run_markets(_rebuild_market, markets or MARKETS, days, incremental=incremental)
+    response_cache.invalidate()
+    return res
+
+
+def _cached_where(start: Optional[str], end: Optional[str], fallback_days: int, market: Market = DEFAULT_MARKET):
+    params = list(market)
+    where = ["symbol = %s AND interval = %s"]
     if start and end:
         where.append("time BETWEEN %s AND %s")
-        params.extend([start, end])
+        params.extend([as_timestamp(start), as_timestamp(end)])
     else:
-        where.append("time >= NOW() - %s::interval")
-        params.append(f"{fallback_days} days")
-    q = """
-        SELECT time, open, high, low, close, volume,
-               pred_open_next, pred_high_next, pred_low_next, pred_close_next, pred_amp_next,
-               cls_dir_next, prob_up, prob_down,
-               err_close_abs, err_close_signed, err_amp_abs
-        FROM series_cache
-    """
-    if where:
-        q += " WHERE " + " AND ".join(where)
-    q += " ORDER BY time"
+        where.append("time >= NOW() - make_interval(days => %s)")
+        params.append(int(fallback_days))
+    return " AND ".join(where), params
+
+
+def _cached_query(start: Optional[str], end: Optional[str], fallback_days: int, columns: list = SERIES_COLUMNS,
+                  market: Market = DEFAULT_MARKET):
+    where, params = _cached_where(start, end, fallback_days, market)
+    return f"SELECT {', '.join(columns)} FROM series_cache WHERE {where} ORDER BY time", tuple(params)
+
+
+# Redução de resolução (max_points) no Postgres, com a mesma agregação de downsample_series: só os
+# buckets saem do banco. (row_number·m − 1) div n é o bucket k de bucket_edges (linhas ⌊k·n/m⌋ até
+# antes de ⌊(k+1)·n/m⌋); com n ≤ m cada linha é o próprio bucket e a série vem completa.
+BUCKETS_QUERY = """
+WITH w AS (
+  SELECT {columns}, (row_number() OVER (ORDER BY time) * %s - 1) / count(*) OVER () AS bucket
+  FROM series_cache WHERE {where}
+)
+SELECT min(time) AS time, (array_agg(open ORDER BY time))[1] AS open, max(high) AS high, min(low) AS low,
+       (array_agg(close ORDER BY time DESC))[1] AS close, sum(volume) AS volume,
+       {last},
+       max(err_close_abs) AS err_close_abs,
+       (array_agg(err_close_signed ORDER BY abs(err_close_signed) DESC NULLS LAST, time))[1] AS err_close_signed,
+       max(err_amp_abs) AS err_amp_abs
+FROM w GROUP BY bucket ORDER BY bucket
+"""
 
+
+def _buckets_query(start: Optional[str], end: Optional[str], fallback_days: int, max_points: int,
+                   market: Market = DEFAULT_MARKET):
+    where, params = _cached_where(start, end, fallback_days, market)
+    last = ", ".join(f"(array_agg({k} ORDER BY time DESC))[1] AS {k}" for k in LAST_COLS)
+    q = BUCKETS_QUERY.format(columns=", ".join(SERIES_COLUMNS), where=where, last=last)
+    return q, (int(max_points), *params)
+
+
+def load_series_cached(start: Optional[str], end: Optional[str], fallback_days: int = 90, market: Market = DEFAULT_MARKET):
+    q, params = _cached_query(start, end, fallback_days, market=market)
     with pg_conn() as conn:
-        df = pd.read_sql(q, conn, params=tuple(params))
+        df = pd.read_sql(q, conn, params=params)
     if df.empty:
         return {"points": []}
 
-    import math
-    def safe(x):
-        if pd.isna(x):
-            return None
-        try:
-            v = float(x)
-            if math.isnan(v) or math.isinf(v):
-                return None
-            return v
-        except:
-            return None
-    
-    points = []
-    for _, r in df.iterrows():
-        real = {
-            "time": pd.to_datetime(r["time"]).isoformat(),
-            "open": safe(r["open"]),
-            "high": safe(r["high"]),
-            "low": safe(r["low"]),
-            "close": safe(r["close"]),
-            "volume": safe(r["volume"]),
-        }
-        pred = None
-        pcn = safe(r["pred_close_next"])
-        if pcn is not None:
-            pred = {
-                "open_next": safe(r["pred_open_next"]),
-                "high_next": safe(r["pred_high_next"]),
-                "low_next": safe(r["pred_low_next"]),
-                "close_next": pcn,
-                "amp_next": safe(r["pred_amp_next"]),
-            }
-        cls = None
-        cdn = safe(r["cls_dir_next"])
-        if cdn is not None:
-            cls = {
-                "dir_next": int(cdn),
-                "prob_up": safe(r["prob_up"]),
-                "prob_down": safe(r["prob_down"]),
-            }
-        err = None
-        eca = safe(r["err_close_abs"])
-        if eca is not None:
-            err = {
-                "close_abs": eca,
-                "close_signed": safe(r["err_close_signed"]),
-                "amp_abs": safe(r["err_amp_abs"]),
-            }
-        points.append({"real": real, "pred": pred, "cls": cls, "err": err})
-    return {"points": points}
+    return {"points": cached_points(df)}
+
+
+def load_series_cached_frame(start: Optional[str], end: Optional[str], fallback_days: int = 90,
+                             market: Market = DEFAULT_MARKET) -> pd.DataFrame:
+    """Série materializada em colunas planas (para o formato colunar)."""
+    q, params = _cached_query(start, end, fallback_days, market=market)
+    with pg_conn() as conn:
+        return pd.read_sql(q, conn, params=params)
+
+
+def stream_series_cached(start: Optional[str], end: Optional[str], fallback_days: int = 90, market: Market = DEFAULT_MARKET):
+    """Mesma série de load_series_cached em NDJSON, lida em blocos de um cursor server-side."""
+    q, params = _cached_query(start, end, fallback_days, market=market)
+    return ndjson_stream(iter_query_frames(q, params), cached_points)
+
+
+async def load_series_cached_async(start: Optional[str], end: Optional[str], fallback_days: int = 90, max_points: Optional[int] = None,
+                                   market: Market = DEFAULT_MARKET):
+    with operation("series_cached"):
+        with span("db_read"):
+            df = await load_series_cached_frame_async(start, end, fallback_days, max_points, market)
+        if df.empty:
+            return {"points": []}
+        with span("response_build"):
+            return {"points": await run_cpu(cached_points, df)}
+
+
+async def load_series_cached_frame_async(start: Optional[str], end: Optional[str], fallback_days: int = 90,
+                                         max_points: Optional[int] = None, market: Market = DEFAULT_MARKET) -> pd.DataFrame:
+    if max_points:
+        q, params = _buckets_query(start, end, fallback_days, max_points, market)
+    else:
+        q, params = _cached_query(start, end, fallback_days, market=market)
+    return await aiodb.fetch_frame(q, *params)
+
+
+def stream_series_cached_async(start: Optional[str], end: Optional[str], fallback_days: int = 90, max_points: Optional[int] = None,
+                               market: Market = DEFAULT_MARKET):
+    if max_points:
+        # Reduzida a série cabe em um bloco só: não há o que ganhar com o cursor server-side
+        return ndjson_stream_async(single_frame(load_series_cached_frame_async(start, end, fallback_days, max_points, market)), cached_points)
+    q, params = _cached_query(start, end, fallback_days, market=market)
+    return ndjson_stream_async(aiodb.iter_frames(q, *params), cached_points)
@@ -0,0 +1,294 @@
+import json, struct
+import numpy as np
+import pandas as pd
+from ml.features import TARGET_REG_COLS
+
+# Montagem das listas de pontos coluna a coluna. Cada coluna é convertida uma única vez
+# (máscara de NaN/Inf, deslocamento do próximo close, ISO dos timestamps) e os dicts são
+# apenas costurados no final; a saída é idêntica à das versões antigas linha a linha.
+
+
+SERIES_COLUMNS = [
+    "time", "open", "high", "low", "close", "volume",
+    "pred_open_next", "pred_high_next", "pred_low_next", "pred_close_next", "pred_amp_next",
+    "cls_dir_next", "prob_up", "prob_down",
+    "err_close_abs", "err_close_signed", "err_amp_abs",
+]
+
+
+def iso_times(times: pd.Series) -> list:
+    """Equivalente a [pd.Timestamp(t).isoformat() for t in times], em lote."""
+    t = pd.to_datetime(times)
+    if t.dt.tz is None:
+        v = t.to_numpy(dtype="datetime64[ns]")
+        if not np.isnat(v).any() and not (v.astype(np.int64) % 1_000_000_000).any():
+            return np.datetime_as_string(v, unit="s").tolist()
+    return [x.isoformat() for x in t]
+
+
+def finite_or_none(values) -> list:
+    """float(x) para cada valor, com None onde o valor é nulo, NaN, Inf ou não numérico."""
+    arr = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    out = arr.tolist()
+    for i in np.flatnonzero(~np.isfinite(arr)).tolist():
+        out[i] = None
+    return out
+
+
+def _floats(values) -> list:
+    return np.asarray(values, dtype=np.float64).tolist()
+
+
+def scatter_predictions(rows: np.ndarray, reg_pred: pd.DataFrame, cls_pred, prob) -> tuple:
+    """Espalha as previsões feitas só nas linhas `rows` (máscara) para todas as linhas da série.
+
+    Linhas sem previsão ficam com NaN (também em cls_pred, que volta como float).
+    """
+    n = len(rows)
+    reg = pd.DataFrame({k: np.full(n, np.nan) for k in TARGET_REG_COLS})
+    for k in TARGET_REG_COLS:
+        reg.loc[rows, k] = reg_pred[k].to_numpy(dtype=np.float64)
+    cls = np.full(n, np.nan)
+    cls[rows] = np.asarray(cls_pred, dtype=np.float64)
+    pr = np.full((n, 2), np.nan)
+    pr[rows] = np.asarray(prob, dtype=np.float64)
+    return reg, cls, pr
+
+
+def next_errors(df2: pd.DataFrame, pred_close: np.ndarray, pred_amp: np.ndarray) -> tuple:
+    """(abs, signed, amp_abs) da previsão feita em i contra o candle seguinte.
+
+    O real do próximo candle vem de close_next/amp_next de add_features_targets, que são NaN no
+    fim de cada trecho: o erro não atravessa lacunas.
+    """
+    signed = pred_close - df2["close_next"].to_numpy(dtype=np.float64)
+    return np.abs(signed), signed, np.abs(pred_amp - df2["amp_next"].to_numpy(dtype=np.float64))
+
+
+def series_points(df2: pd.DataFrame, reg_pred: pd.DataFrame | None, cls_pred, prob) -> list:
+    """Pontos do /series (on-demand): real em i, previsão feita em i e erro contra o real em i+1.
+
+    df2 vem de add_features_targets (todas as linhas); pred/cls/err ficam None onde não há.
+    """
+    n = len(df2)
+    times = iso_times(df2["time"])
+    opens, highs, lows, closes, vols = (_floats(df2[k]) for k in ["open","high","low","close","volume"])
+    reals = [
+        {"time": t, "open": o, "high": h, "low": l, "close": c, "volume": v}
+        for t, o, h, l, c, v in zip(times, opens, highs, lows, closes, vols)
+    ]
+
+    preds = [None] * n
+    errs = [None] * n
+    if reg_pred is not None:
+        cols = {k: reg_pred[k].to_numpy(dtype=np.float64) for k in TARGET_REG_COLS}
+        has_pred = np.isfinite(cols["close_next"]).tolist()
+        preds = [
+            dict(zip(TARGET_REG_COLS, row)) if ok else None
+            for ok, row in zip(has_pred, zip(*(cols[k].tolist() for k in TARGET_REG_COLS)))
+        ]
+        abs_, signed, amp_abs = next_errors(df2, cols["close_next"], cols["amp_next"])
+        errs = [
+            {"close_abs": a, "close_signed": s, "amp_abs": m} if ok else None
+            for ok, a, s, m in zip(np.isfinite(signed).tolist(), abs_.tolist(), signed.tolist(), amp_abs.tolist())
+        ]
+
+    clss = [None] * n
+    if cls_pred is not None:
+        pr = np.asarray(prob, dtype=np.float64)
+        dirs = np.nan_to_num(np.asarray(cls_pred, dtype=np.float64)).astype(np.int64).tolist()
+        clss = [
+            {"dir_next": d, "prob_up": u, "prob_down": dn} if ok else None
+            for ok, d, u, dn in zip(np.isfinite(pr[:, 1]).tolist(), dirs, _floats(pr[:, 1]), _floats(pr[:, 0]))
+        ]
+
+    return [{"real": r, "pred": p, "cls": c, "err": e} for r, p, c, e in zip(reals, preds, clss, errs)]
+
+
+def series_frame(df2: pd.DataFrame, reg_pred: pd.DataFrame | None, cls_pred, prob) -> pd.DataFrame:
+    """Série em colunas planas (layout de series_cache) alinhada em i: real em i, previsão feita
+    em i (para i+1) e erros contra o real em i+1. Valores ausentes/não finitos ficam como NaN.
+    df2 vem de add_features_targets (todas as linhas, com close_next/amp_next).
+    """
+    n = len(df2)
+    out = pd.DataFrame({"time": pd.to_datetime(df2["time"]).to_numpy()})
+    for k in ["open", "high", "low", "close", "volume"]:
+        out[k] = df2[k].to_numpy(dtype=np.float64)
+    nan = np.full(n, np.nan)
+    for k in TARGET_REG_COLS:
+        out[f"pred_{k}"] = reg_pred[k].to_numpy(dtype=np.float64) if reg_pred is not None else nan
+    cls = np.asarray(cls_pred, dtype=np.float64) if cls_pred is not None else np.full(n, np.nan)
+    out["cls_dir_next"] = pd.Series(
+        [int(d) if ok else None for ok, d in zip(np.isfinite(cls).tolist(), np.nan_to_num(cls).tolist())], dtype=object
+    )
+    out["prob_up"] = np.asarray(prob, dtype=np.float64)[:, 1] if prob is not None else nan
+    out["prob_down"] = np.asarray(prob, dtype=np.float64)[:, 0] if prob is not None else nan
+
+    pred_close = out["pred_close_next"].to_numpy()
+    pred_close = np.where(np.isfinite(pred_close), pred_close, np.nan)
+    abs_, signed, amp_abs = next_errors(df2, pred_close, out["pred_amp_next"].to_numpy())
+    out["err_close_abs"] = abs_
+    out["err_close_signed"] = signed
+    # erro de amplitude só existe quando há previsão de close (mesma regra da versão linha a linha)
+    out["err_amp_abs"] = np.where(np.isnan(pred_close), np.nan, amp_abs)
+    return out[SERIES_COLUMNS]
+
+
+def cached_points(df: pd.DataFrame) -> list:
+    """Pontos do /series/cached a partir das colunas de series_cache."""
+    times = iso_times(df["time"])
+    col = {k: finite_or_none(df[k]) for k in df.columns if k != "time"}
+    reals = [
+        {"time": t, "open": o, "high": h, "low": l, "close": c, "volume": v}
+        for t, o, h, l, c, v in zip(times, col["open"], col["high"], col["low"], col["close"], col["volume"])
+    ]
+    preds = [
+        None if pc is None else
+        {"open_next": po, "high_next": ph, "low_next": pl, "close_next": pc, "amp_next": pa}
+        for po, ph, pl, pc, pa in zip(
+            col["pred_open_next"], col["pred_high_next"], col["pred_low_next"],
+            col["pred_close_next"], col["pred_amp_next"],
+        )
+    ]
+    clss = [
+        None if d is None else {"dir_next": int(d), "prob_up": u, "prob_down": dn}
+        for d, u, dn in zip(col["cls_dir_next"], col["prob_up"], col["prob_down"])
+    ]
+    errs = [
+        None if a is None else {"close_abs": a, "close_signed": s, "amp_abs": m}
+        for a, s, m in zip(col["err_close_abs"], col["err_close_signed"], col["err_amp_abs"])
+    ]
+    return [{"real": r, "pred": p, "cls": c, "err": e} for r, p, c, e in zip(reals, preds, clss, errs)]
+
+
+def futures_points(df: pd.DataFrame) -> list:
+    """Pontos do /futures (pred_close × real_close × err_close)."""
+    return [
+        {"time": t, "pred_close": p, "real_close": r, "err_close": e}
+        for t, p, r, e in zip(
+            iso_times(df["time"]),
+            finite_or_none(df["pred_close"]), finite_or_none(df["real_close"]), finite_or_none(df["err_close"]),
+        )
+    ]
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.btcml.columns"
+
+
+def negotiate_format(format: str | None, accept: str | None) -> str:
+    """Formato de resposta pedido: parâmetro `format` explícito, senão o header Accept, senão json."""
+    if format:
+        return format
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        return "ndjson"
+    if accept and COLUMNAR_MEDIA_TYPE in accept:
+        return "columnar"
+    return "json"
+
+
+def _ndjson_chunk(df, to_points) -> bytes:
+    return "".join(json.dumps(p, separators=(",", ":")) + "\n" for p in to_points(df)).encode()
+
+
+def ndjson_stream(frames, to_points):
+    """Converte blocos (DataFrames) em linhas NDJSON, um ponto por linha, à medida que chegam."""
+    for df in frames:
+        chunk = _ndjson_chunk(df, to_points)
+        if chunk:
+            yield chunk
+
+
+async def ndjson_stream_async(frames, to_points):
+    """Versão async de ndjson_stream: lê blocos de um gerador async e serializa no executor de CPU."""
+    from core.executor import run_cpu
+    async for df in frames:
+        chunk = await run_cpu(_ndjson_chunk, df, to_points)
+        if chunk:
+            yield chunk
+
+
+async def single_frame(frame):
+    """Gerador async de um único bloco, para servir uma série já carregada por ndjson_stream_async."""
+    yield await frame
+
+
+# --- Formato binário colunar ---
+#
+# Layout (little-endian):
+#   b"BTCC" | uint32 versão | uint32 tamanho do cabeçalho | cabeçalho JSON (preenchido até múltiplo de 8) | corpo
+# O cabeçalho lista, para cada coluna, dtype, offset/tamanho do buffer de dados no corpo e, se a
+# coluna tiver nulos, offset/tamanho do bitmap de validade (bit i = 1 quando a linha i é válida,
+# ordem de bits LSB-first como no Arrow). Todo buffer começa em offset múltiplo de 8, então o
+# cliente lê cada coluna direto como Float64Array/Float32Array/BigInt64Array/Int8Array.
+# Previsões e probabilidades saem do XGBoost em float32 e por isso vão como float32 sem perda.
+
+COLUMNAR_MAGIC = b"BTCC"
+COLUMNAR_VERSION = 1
+_COLUMN_DTYPES = {
+    "cls_dir_next": "int8",
+    **{f"pred_{k}": "float32" for k in TARGET_REG_COLS},
+    "prob_up": "float32",
+    "prob_down": "float32",
+}
+
+
+def encode_columns(df: pd.DataFrame) -> bytes:
+    """Codifica um DataFrame de colunas planas (série ou futures) no formato colunar binário."""
+    n = len(df)
+    meta, body = [], bytearray()
+
+    def put(raw: bytes) -> tuple[int, int]:
+        start = len(body)
+        body.extend(raw)
+        body.extend(b"\0" * (-len(raw) % 8))
+        return start, len(raw)
+
+    for name in df.columns:
+        col = df[name]
+        if name == "time":
+            t = pd.to_datetime(col).to_numpy(dtype="datetime64[ms]")
+            valid = ~np.isnat(t)
+            data = np.where(valid, t.astype(np.int64), 0).astype("<i8")
+            dtype = "timestamp_ms"
+        else:
+            dtype = _COLUMN_DTYPES.get(name, "float64")
+            v = pd.to_numeric(col, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = np.isfinite(v)
+            v = np.where(valid, v, 0)
+            data = v.astype({"int8": "<i1", "float32": "<f4", "float64": "<f8"}[dtype])
+        offset, length = put(data.tobytes())
+        entry = {"name": name, "dtype": dtype, "offset": offset, "length": length}
+        if not valid.all():
+            entry["validity_offset"], entry["validity_length"] = put(np.packbits(valid, bitorder="little").tobytes())
+        meta.append(entry)
+
+    header = json.dumps({"rows": n, "columns": meta}, separators=(",", ":")).encode()
+    header += b" " * (-len(header) % 8)
+    return COLUMNAR_MAGIC + struct.pack("<II", COLUMNAR_VERSION, len(header)) + header + bytes(body)
+
+
+def decode_columns(buf: bytes) -> dict:
+    """Inverso de encode_columns: {coluna: ndarray} com NaN (ou NaT) nas posições nulas."""
+    if buf[:4] != COLUMNAR_MAGIC:
+        raise ValueError("payload colunar inválido")
+    _, hlen = struct.unpack_from("<II", buf, 4)
+    header = json.loads(buf[12:12 + hlen])
+    body = memoryview(buf)[12 + hlen:]
+    n = header["rows"]
+    out = {}
+    for c in header["columns"]:
+        np_dtype = {"timestamp_ms": "<i8", "int8": "<i1", "float32": "<f4", "float64": "<f8"}[c["dtype"]]
+        data = np.frombuffer(body[c["offset"]:c["offset"] + c["length"]], dtype=np_dtype)
+        if c["dtype"] == "timestamp_ms":
+            data = data.astype("datetime64[ms]")
+        else:
+            data = data.astype(np.float64)
+        if "validity_offset" in c:
+            bits = np.frombuffer(body[c["validity_offset"]:c["validity_offset"] + c["validity_length"]], dtype=np.uint8)
+            valid = np.unpackbits(bits, bitorder="little")[:n].astype(bool)
+            data = np.where(valid, data, np.datetime64("NaT") if c["dtype"] == "timestamp_ms" else np.nan)
+        out[c["name"]] = data
+    return out
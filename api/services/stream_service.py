@@ -0,0 +1,197 @@
+import asyncio, json, random, time
+from datetime import datetime
+import pandas as pd
+from websockets.asyncio.client import connect
+from core import aiodb
+from core.config import settings
+from core.executor import run_job
+from core.logging import log_job
+from core.markets import Market, MARKETS
+from core.response_cache import response_cache
+from services.ingestion_service import (fetch_binance_klines_async, normalize_klines_payload, upsert_candles,
+                                        interval_to_ms)
+from services.futures_service import save_live_predictions
+from services.series_cache_service import build_series_cache
+
+# Máximo de candles por página no preenchimento de lacunas (limite do GET /api/v3/klines)
+GAP_PAGE = 1000
+
+
+def stream_name(market: Market) -> str:
+    return f"{market.symbol.lower()}@kline_{market.interval}"
+
+
+def kline_row(k: dict) -> list:
+    """Kline do evento do WebSocket ("k") → linha no formato do GET /api/v3/klines."""
+    return [k["t"], k["o"], k["h"], k["l"], k["c"], k["v"], k["T"], k.get("q", "0"), k.get("n", 0),
+            k.get("V", "0"), k.get("Q", "0"), "0"]
+
+
+def store_closed_candles(df: pd.DataFrame, market: Market) -> dict:
+    """Grava candles fechados de um mercado e atualiza futures/series_cache só com eles (executor de jobs)."""
+    inserted = upsert_candles(df, market, overwrite=True)
+    # Candles fechados: o último já tem par com T-1 nas features (no polling era o penúltimo)
+    updated = save_live_predictions(df["time"].iloc[-1], market)
+    materialized = build_series_cache(incremental=True, market=market)
+    response_cache.invalidate()
+    return {"inserted": inserted, "futures_updated": updated, "materialized": materialized}
+
+
+class KlineStream:
+    """Consumidor contínuo do stream combinado de klines da Binance para os mercados de MARKETS.
+
+    Só candles fechados (x=true) são gravados: cada um entra na fila do seu mercado e é gravado
+    no executor de jobs (upsert, previsão em 'futures', series_cache incremental), um lote por vez
+    por mercado. A cada (re)conexão, depois de abrir o socket, as lacunas desde o último candle
+    gravado são preenchidas pelo REST; as mensagens que chegam enquanto isso esperam no buffer
+    do socket e entram na fila depois. Quedas reconectam com backoff exponencial e jitter.
+    """
+
+    def __init__(self, markets: list[Market], base: str | None = None):
+        self.markets = list(markets)
+        self.base = base or settings.BINANCE_WS_BASE
+        self._by_stream = {stream_name(m): m for m in self.markets}
+        self._queues: dict[Market, asyncio.Queue] = {}
+        self._tasks: list[asyncio.Task] = []
+        self.connected = False
+        self.connects = self.messages = self.closed = self.gap_filled = self.errors = 0
+        self.retries = self.dropped = 0
+        self.last_error: str | None = None
+        self._last_close: dict[Market, dict] = {}
+
+    @property
+    def url(self) -> str:
+        return f"{self.base.rstrip('/')}/stream?streams={'/'.join(self._by_stream)}"
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queues = {m: asyncio.Queue() for m in self.markets}
+        self._tasks = [asyncio.create_task(self._run())]
+        self._tasks += [asyncio.create_task(self._worker(m)) for m in self.markets]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.connected = False
+
+    async def _error(self, where: str, e) -> None:
+        self.errors += 1
+        self.last_error = f"{where}: {e}"
+        now = datetime.utcnow()
+        try:
+            await run_job(log_job, "stream", "error", self.last_error, now, now)
+        except Exception:
+            pass
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with connect(self.url, ping_interval=20, max_size=2 ** 20) as ws:
+                    self.connected = True
+                    self.connects += 1
+                    await self._fill_gaps()
+                    backoff = 1.0
+                    async for raw in ws:
+                        self._on_message(raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self._error("conexão", e)
+            finally:
+                self.connected = False
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+            backoff = min(backoff * 2, settings.KLINE_STREAM_MAX_BACKOFF)
+
+    def _on_message(self, raw) -> None:
+        self.messages += 1
+        msg = json.loads(raw)
+        market = self._by_stream.get(msg.get("stream"))
+        k = (msg.get("data") or {}).get("k")
+        if market is None or not k or not k.get("x"):
+            return
+        self.closed += 1
+        self._queues[market].put_nowait(normalize_klines_payload([kline_row(k)]))
+
+    async def _fill_gaps(self) -> None:
+        """Candles fechados que faltam desde o último gravado de cada mercado, pelo REST (paginado)."""
+        async def one(market: Market):
+            step = interval_to_ms(market.interval)
+            row = await aiodb.fetchrow("SELECT MAX(time) FROM btc_candles WHERE symbol = %s AND interval = %s", *market)
+            if row is None or row[0] is None:
+                return
+            # Relê o último candle gravado: o polling pode tê-lo gravado ainda aberto
+            start = int(pd.Timestamp(row[0]).tz_localize("UTC").value // 1_000_000)
+            while True:
+                df = await fetch_binance_klines_async(market.symbol, market.interval, GAP_PAGE, start_ms=start)
+                closed = df[df["time"].astype("datetime64[ms]").astype("int64") + step <= time.time() * 1000]
+                if not closed.empty:
+                    self.gap_filled += int((closed["time"] > row[0]).sum())
+                    self._queues[market].put_nowait(closed.reset_index(drop=True))
+                if len(df) < GAP_PAGE or len(closed) < len(df):
+                    return
+                start = int(df["time"].iloc[-1].value // 1_000_000) + step
+
+        results = await asyncio.gather(*(one(m) for m in self.markets), return_exceptions=True)
+        for m, r in zip(self.markets, results):
+            if isinstance(r, Exception):
+                await self._error(f"lacunas {m.key}", r)
+
+    async def _worker(self, market: Market) -> None:
+        q = self._queues[market]
+        pending, attempt = None, 0
+        while True:
+            # Um lote que falhou volta na frente e se junta ao que chegou enquanto isso
+            frames = [pending] if pending is not None else [await q.get()]
+            # Junta o que acumulou (ex.: o preenchimento de uma lacuna) em uma única gravação
+            while not q.empty():
+                frames.append(q.get_nowait())
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            df = df.drop_duplicates("time", keep="last").sort_values("time").reset_index(drop=True)
+            try:
+                res = await run_job(store_closed_candles, df, market)
+            except Exception as e:
+                attempt += 1
+                if attempt <= settings.KLINE_STREAM_MAX_RETRIES:
+                    self.retries += 1
+                    self.last_error = f"{market.key}: {e}"
+                    pending = df
+                    await asyncio.sleep(min(0.5 * 2 ** attempt, settings.KLINE_STREAM_MAX_BACKOFF) * random.uniform(0.5, 1.0))
+                    continue
+                # Desiste do lote: o intervalo fica registrado para o /candles/gaps/repair
+                self.dropped += len(df)
+                pending, attempt = None, 0
+                await self._error(market.key, f"{len(df)} candles descartados ({df['time'].iloc[0].isoformat()} a "
+                                              f"{df['time'].iloc[-1].isoformat()}) após "
+                                              f"{settings.KLINE_STREAM_MAX_RETRIES} tentativas: {e}")
+                continue
+            pending, attempt = None, 0
+            last = df["time"].iloc[-1]
+            close_ms = last.value // 1_000_000 + interval_to_ms(market.interval)
+            self._last_close[market] = {
+                "last_candle": last.isoformat(),
+                "lag_ms": round(time.time() * 1000 - close_ms),
+                **res,
+            }
+
+    def stats(self) -> dict:
+        return {
+            "enabled": bool(self._tasks),
+            "connected": self.connected,
+            "url": self.url,
+            "connects": self.connects,
+            "messages": self.messages,
+            "closed_candles": self.closed,
+            "gap_filled": self.gap_filled,
+            "errors": self.errors,
+            "retries": self.retries,
+            "dropped_candles": self.dropped,
+            "last_error": self.last_error,
+            "markets": {m.key: self._last_close.get(m) for m in self.markets},
+        }
+
+
+kline_stream = KlineStream(MARKETS)
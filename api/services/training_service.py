@@ -1,19 +1,26 @@
-import joblib, pandas as pd
-from datetime import datetime
+import json, os, queue, time, pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime, timedelta
 from core.config import settings
 from core.db import pg_conn
 from core.logging import log_job
+from core.jobs import report_progress
+from core.response_cache import response_cache
+from core.telemetry import operation, span
 from ml.features import build_features_targets, exp_sample_weights, FEATURE_COLS, TARGET_REG_COLS
-from ml.model_paths import REG_PATH, CLS_PATH
+from ml.artifact_store import store_for
+from ml.registry import registry_for
+from core.markets import Market, DEFAULT_MARKET, MARKETS, run_markets
 
 
-def load_candles_window(days: int) -> pd.DataFrame:
+def load_candles_window(days: int, market: Market = DEFAULT_MARKET) -> pd.DataFrame:
 	with pg_conn() as conn:
 		q = """SELECT time, open, high, low, close, volume
 			   FROM btc_candles
-			   WHERE time >= NOW() - INTERVAL %s
+			   WHERE symbol = %s AND interval = %s AND time >= NOW() - INTERVAL %s
 			   ORDER BY time;"""
-		return pd.read_sql(q, conn, params=(f'{days} days',))
+		return pd.read_sql(q, conn, params=(*market, f'{days} days'))
 
 
 def mean_absolute_percentage_error(y_true, y_pred):
@@ -33,18 +40,228 @@ def symmetric_mape(y_true, y_pred):
 	return float((2.0 * np.abs(y_pred - y_true) / den).mean() * 100.0)
 
 
-def train_job(days: int|None=None, alpha: float|None=None):
+# Hiperparâmetros comuns aos regressores e ao classificador (API nativa do XGBoost)
+XGB_PARAMS = dict(
+	eta=0.05,
+	max_depth=6,
+	subsample=0.8,
+	colsample_bytree=0.8,
+	tree_method="hist",
+	seed=42,
+)
+REG_PARAMS = dict(XGB_PARAMS, objective="reg:squarederror", eval_metric="mae")
+CLS_PARAMS = dict(XGB_PARAMS, objective="binary:logistic", eval_metric="logloss")
+# Teto de árvores do treino completo (o early stopping normalmente para antes)
+FULL_ROUNDS = 400
+# Nome do classificador de direção nos tempos por modelo
+CLS_TARGET = "dir_next"
+
+
+def cpu_budget_split(budget: int, n_tasks: int) -> list[int]:
+	"""Divide `budget` threads entre `n_tasks` modelos treinados ao mesmo tempo (sobra vai para os primeiros)."""
+	workers = max(1, min(n_tasks, budget))
+	base, extra = divmod(max(budget, workers), workers)
+	return [base + (1 if i < extra else 0) for i in range(workers)]
+
+
+def _cpu_budget() -> int:
+	return settings.TRAIN_CPU_BUDGET or os.cpu_count() or 1
+
+
+def _train_parallel(tasks: dict, budget: int | None = None) -> tuple[dict, dict]:
+	"""Executa os treinos (nome -> fn(n_jobs)) em um pool de threads sob o orçamento TRAIN_CPU_BUDGET.
+
+	O XGBoost libera o GIL durante o boosting, então threads bastam; cada modelo recebe sua fatia
+	de n_jobs em vez de todos disputarem todos os núcleos. Retorna (modelos, segundos por modelo).
+	"""
+	budget = budget or _cpu_budget()
+	split = cpu_budget_split(budget, len(tasks))
+	slots = queue.SimpleQueue()
+	for n in split:
+		slots.put(n)
+
+	def run(fn):
+		n_jobs = slots.get()
+		t0 = time.perf_counter()
+		try:
+			return fn(n_jobs), time.perf_counter() - t0
+		finally:
+			slots.put(n_jobs)
+
+	with ThreadPoolExecutor(max_workers=len(split), thread_name_prefix="train") as pool:
+		futures = {name: pool.submit(run, fn) for name, fn in tasks.items()}
+		done = {name: fut.result() for name, fut in futures.items()}
+	return {k: v[0] for k, v in done.items()}, {k: round(v[1], 3) for k, v in done.items()}
+
+
+def _wrap(booster, kind):
+	"""Publica o booster como modelo sklearn (é o que prediction/series_cache/futures consomem)."""
+	model = kind()
+	model.load_model(bytearray(booster.save_raw("ubj")))
+	return model
+
+
+def _fit_models(X_fit, Yreg_fit, Ycls_fit, w_fit, X_val, Yreg_val, Ycls_val, rounds: int,
+				prev_models: dict | None = None, prev_cls=None, budget: int | None = None):
+	"""Treina (ou continua, com prev_*) os cinco regressores e o classificador em paralelo.
+
+	Os alvos só diferem no rótulo, então as matrizes quantizadas (QuantileDMatrix de treino e de
+	validação) são montadas uma vez por treino simultâneo, não por alvo: o alvo que pega um par livre
+	só troca o rótulo (set_label), e um par novo (com os cortes do primeiro, via `ref`) só é montado
+	quando todos estão em uso. Com orçamento de 1 núcleo é um par só; com 6 ou mais, um por modelo,
+	porque set_label não pode mudar a matriz de um treino em andamento. Cada modelo para no melhor
+	ponto da validação temporal (early stopping) e é truncado nessa iteração, então a inferência
+	não paga pelas árvores excedentes.
+	Retorna (regressores, classificador, tempos por modelo, árvores por modelo).
+	"""
+	import numpy as np
+	import xgboost as xgb
 	from xgboost import XGBRegressor, XGBClassifier
+
+	X_fit = np.ascontiguousarray(X_fit.to_numpy(dtype=np.float32))
+	X_val = np.ascontiguousarray(X_val.to_numpy(dtype=np.float32))
+	stop = settings.TRAIN_EARLY_STOPPING_ROUNDS
+
+	def pair(ref=None):
+		dtrain = xgb.QuantileDMatrix(X_fit, weight=w_fit, feature_names=FEATURE_COLS, ref=ref)
+		return dtrain, xgb.QuantileDMatrix(X_val, feature_names=FEATURE_COLS, ref=dtrain)
+
+	# Pares livres; só se monta outro (na thread do treino, com os cortes do primeiro) quando todos
+	# estão em uso, então há no máximo um por treino simultâneo
+	first = pair()
+	pairs = queue.SimpleQueue()
+	pairs.put(first)
+
+	def fit(params, y_fit, y_val, prev, n_jobs):
+		try:
+			dtrain, dval = pairs.get_nowait()
+		except queue.Empty:
+			dtrain, dval = pair(ref=first[0])
+		try:
+			dtrain.set_label(y_fit)
+			dval.set_label(y_val)
+			booster = xgb.train(
+				{**params, "nthread": n_jobs}, dtrain, num_boost_round=rounds,
+				evals=[(dval, "val")], early_stopping_rounds=stop or None, verbose_eval=False,
+				xgb_model=prev.get_booster() if prev is not None else None,
+			)
+		finally:
+			pairs.put((dtrain, dval))
+		if stop:
+			booster = booster[: booster.best_iteration + 1]
+		return booster
+
+	tasks = {
+		t: partial(fit, REG_PARAMS, Yreg_fit[t].values, Yreg_val[t].values, (prev_models or {}).get(t))
+		for t in TARGET_REG_COLS
+	}
+	tasks[CLS_TARGET] = partial(fit, CLS_PARAMS, Ycls_fit.values, Ycls_val.values, prev_cls)
+	boosters, timings = _train_parallel(tasks, budget)
+	trees = {k: b.num_boosted_rounds() for k, b in boosters.items()}
+	cls = _wrap(boosters.pop(CLS_TARGET), XGBClassifier)
+	reg_models = {k: _wrap(b, XGBRegressor) for k, b in boosters.items()}
+	return reg_models, cls, timings, trees
+
+
+def _previous_artifacts(market: Market = DEFAULT_MARKET):
+	"""Bundle de regressão + classificador publicados (ou None se não houver/forem incompatíveis)."""
+	try:
+		snap = registry_for(market).get()
+	except FileNotFoundError:
+		return None
+	bundle = snap.reg_bundle
+	if not isinstance(bundle, dict) or "meta" not in bundle or bundle.get("feature_cols") != FEATURE_COLS:
+		return None
+	return bundle, snap.cls
+
+
+def ensure_table() -> None:
+	"""Registro estruturado dos treinos publicados (lido por /metrics e /metrics/history)."""
+	with pg_conn() as conn:
+		conn.autocommit = True
+		with conn.cursor() as cur:
+			cur.execute(
+				"""
+				CREATE TABLE IF NOT EXISTS train_runs (
+				  id              BIGSERIAL PRIMARY KEY,
+				  model_version   TEXT NOT NULL UNIQUE,
+				  mode            TEXT NOT NULL,
+				  reason          TEXT,
+				  days            INTEGER NOT NULL,
+				  samples         INTEGER NOT NULL,
+				  split_idx       INTEGER NOT NULL,
+				  new_rows        INTEGER NOT NULL,
+				  val_start       TIMESTAMP NOT NULL,
+				  trained_until   TIMESTAMP NOT NULL,
+				  mae             DOUBLE PRECISION,
+				  mape            DOUBLE PRECISION,
+				  smape           DOUBLE PRECISION,
+				  target_metrics  JSONB NOT NULL,
+				  trees           JSONB NOT NULL,
+				  timings         JSONB NOT NULL,
+				  fit_secs        DOUBLE PRECISION,
+				  total_secs      DOUBLE PRECISION,
+				  started_at      TIMESTAMP NOT NULL,
+				  finished_at     TIMESTAMP NOT NULL
+				);
+				ALTER TABLE train_runs ADD COLUMN IF NOT EXISTS symbol TEXT NOT NULL DEFAULT %s;
+				ALTER TABLE train_runs ADD COLUMN IF NOT EXISTS interval TEXT NOT NULL DEFAULT %s;
+				ALTER TABLE train_runs ALTER COLUMN symbol DROP DEFAULT;
+				ALTER TABLE train_runs ALTER COLUMN interval DROP DEFAULT;
+				CREATE INDEX IF NOT EXISTS train_runs_market_idx ON train_runs (symbol, interval, id DESC);
+				""",
+				tuple(DEFAULT_MARKET),
+			)
+
+
+def _record_run(version: str, manifest: dict, started_at: datetime, finished_at: datetime,
+				val_start: datetime, trained_until: datetime, market: Market = DEFAULT_MARKET) -> None:
+	with pg_conn() as conn:
+		with conn.cursor() as cur:
+			cur.execute(
+				"""
+				INSERT INTO train_runs(symbol, interval, model_version, mode, reason, days, samples, split_idx, new_rows,
+				  val_start, trained_until, mae, mape, smape, target_metrics, trees, timings, fit_secs, total_secs,
+				  started_at, finished_at)
+				VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+				""",
+				(
+					*market, version, manifest["mode"], manifest["reason"], manifest["days"], manifest["samples"],
+					manifest["split_idx"], manifest["new_rows"], val_start, trained_until,
+					manifest["mae"], manifest["mape"], manifest["smape"],
+					json.dumps(manifest["metrics"]), json.dumps(manifest["trees"]), json.dumps(manifest["timings"]),
+					manifest["fit_secs"], (finished_at - started_at).total_seconds(), started_at, finished_at,
+				),
+			)
+
+
+@operation("train_job")
+def train_job(days: int|None=None, alpha: float|None=None, mode: str="full", rounds: int|None=None,
+			  market: Market=DEFAULT_MARKET, budget: int|None=None):
+	"""Treina os modelos de um mercado e publica os artefatos (no diretório do mercado).
+
+	mode="full": do zero na janela inteira, até 400 árvores por modelo (early stopping na validação).
+	mode="incremental": continua o boosting do artefato atual por `rounds` árvores apenas sobre as
+	linhas de treino que surgiram desde o último treino. Cai para o completo quando não há artefato
+	compatível, quando o último completo tem mais de TRAIN_FULL_EVERY_HOURS ou quando o MAE de
+	validação piora mais que TRAIN_DEGRADE_TOL em relação ao modelo anterior. `budget` limita as
+	threads do treino (padrão TRAIN_CPU_BUDGET) quando vários mercados treinam ao mesmo tempo.
+	"""
 	from sklearn.metrics import mean_absolute_error
-	import numpy as np
 
 	days = days or settings.LOOKBACK_DAYS
 	alpha = alpha or settings.ALPHA_DECAY
+	rounds = rounds or settings.TRAIN_INCREMENTAL_ROUNDS
 	start = datetime.utcnow()
 	try:
-		df = load_candles_window(days)
+		if mode not in ("full", "incremental"):
+			raise ValueError(f"mode desconhecido: {mode}")
+		with span("db_read"):
+			df = load_candles_window(days, market)
 		if len(df) < 200: raise RuntimeError("Dados insuficientes para treino.")
-		_, X, Yreg, Ycls = build_features_targets(df)
+		with span("features"):
+			df2, X, Yreg, Ycls = build_features_targets(df)
+		report_progress(0.1, f"Features de {len(X)} candles")
 
 		# Split temporal: 80% treino, 20% validação (últimos pontos)
 		n = len(X)
@@ -52,56 +269,133 @@ def train_job(days: int|None=None, alpha: float|None=None):
 		X_train, X_val = X.iloc[:split_idx], X.iloc[split_idx:]
 		Yreg_train, Yreg_val = Yreg.iloc[:split_idx], Yreg.iloc[split_idx:]
 		Ycls_train, Ycls_val = Ycls.iloc[:split_idx], Ycls.iloc[split_idx:]
+		train_times = df2["time"].iloc[:split_idx]
+		trained_until = train_times.iloc[-1].to_pydatetime()
 
 		# Pesos exponenciais apenas no treino
 		w_train = exp_sample_weights(len(X_train), alpha)
+		y_true = Yreg_val["close_next"].values
 
-		# Treino de regressão por alvo (sem early stopping por compatibilidade)
-		reg_models: dict[str, XGBRegressor] = {}
-		for target in TARGET_REG_COLS:
-			reg = XGBRegressor(
-				n_estimators=400,
-				learning_rate=0.05,
-				max_depth=6,
-				subsample=0.8,
-				colsample_bytree=0.8,
-				tree_method="hist",
-				random_state=42,
-			)
-			y_tr = Yreg_train[target].values
-			reg.fit(X_train, y_tr, sample_weight=w_train)
-			reg_models[target] = reg
-
-		# Treino do classificador (sem early stopping por compatibilidade)
-		cls = XGBClassifier(
-			n_estimators=400,
-			learning_rate=0.05,
-			max_depth=6,
-			subsample=0.8,
-			colsample_bytree=0.8,
-			tree_method="hist",
-			use_label_encoder=False,
-			random_state=42,
-		)
-		cls.fit(X_train, Ycls_train, sample_weight=w_train)
+		used_mode, reason, new_rows = "full", "requested", len(X_train)
+		reg_models = cls = timings = trees = None
+		fit_start = time.perf_counter()
+		last_full_at = start
+		if mode == "incremental":
+			with span("model_load"):
+				prev = _previous_artifacts(market)
+			meta = prev[0]["meta"] if prev else None
+			prev_until = datetime.fromisoformat(meta["trained_until"]) if meta else None
+			new_mask = (train_times > prev_until).to_numpy() if prev_until else None
+			if prev is None:
+				reason = "no_previous"
+			elif start - datetime.fromisoformat(meta["last_full_at"]) >= timedelta(hours=settings.TRAIN_FULL_EVERY_HOURS):
+				reason = "schedule"
+			elif new_mask.all():
+				reason = "window_moved"
+			elif not new_mask.any():
+				msg = f"Treino incremental {market.key} ignorado: sem candles novos desde {meta['trained_until']}"
+				log_job("train","ok", msg, start, datetime.utcnow())
+				return {"status":"ok","mode":"skipped","samples":n,"new_rows":0,
+						"mae":meta.get("mae"),"mape":meta.get("mape"),"smape":meta.get("smape")}
+			else:
+				prev_models, prev_cls = prev[0]["models"], prev[1]
+				new_rows = int(new_mask.sum())
+				report_progress(0.2, f"Treino incremental sobre {new_rows} candles novos")
+				with span("fit"):
+					inc = _fit_models(
+						X_train[new_mask], Yreg_train[new_mask], Ycls_train[new_mask], w_train[new_mask],
+						X_val, Yreg_val, Ycls_val, rounds, prev_models, prev_cls, budget,
+					)
+				inc_models = inc[0]
+				# Referência: modelo anterior avaliado na mesma validação
+				with span("predict"):
+					mae_prev = float(mean_absolute_error(y_true, prev_models["close_next"].predict(X_val)))
+					mae_inc = float(mean_absolute_error(y_true, inc_models["close_next"].predict(X_val)))
+				if mae_inc > mae_prev * (1 + settings.TRAIN_DEGRADE_TOL):
+					reason = f"degraded ({mae_inc:.4f} > {mae_prev:.4f})"
+					new_rows = len(X_train)
+				else:
+					used_mode, reason = "incremental", "ok"
+					reg_models, cls, timings, trees = inc
+					last_full_at = datetime.fromisoformat(meta["last_full_at"])
 
-		# Métricas no conjunto de validação para close_next
-		y_true = Yreg_val["close_next"].values
-		y_pred = reg_models["close_next"].predict(X_val)
-		mae = float(mean_absolute_error(y_true, y_pred))
-		mape = mean_absolute_percentage_error(y_true, y_pred)
-		smape = symmetric_mape(y_true, y_pred)
+		if reg_models is None:
+			report_progress(0.3, f"Treino completo ({reason})")
+			with span("fit"):
+				reg_models, cls, timings, trees = _fit_models(
+					X_train, Yreg_train, Ycls_train, w_train, X_val, Yreg_val, Ycls_val, FULL_ROUNDS, budget=budget,
+				)
+
+		fit_secs = round(time.perf_counter() - fit_start, 3)
+		report_progress(0.8, f"Modelos treinados em {fit_secs}s; avaliando")
+
+		# Métricas no conjunto de validação por alvo (close_next segue como métrica principal)
+		target_metrics = {}
+		with span("predict"):
+			for t in TARGET_REG_COLS:
+				yt, yp = Yreg_val[t].values, reg_models[t].predict(X_val)
+				target_metrics[t] = {"mae": float(mean_absolute_error(yt, yp)),
+									 "mape": mean_absolute_percentage_error(yt, yp), "smape": symmetric_mape(yt, yp)}
+			prob_up = cls.predict_proba(X_val)[:, 1]
+		target_metrics[CLS_TARGET] = {"accuracy": float(((prob_up >= 0.5).astype(int) == Ycls_val.values).mean())}
+		mae, mape, smape = (target_metrics["close_next"][k] for k in ("mae", "mape", "smape"))
 
-		# Persistência: salvar regressão como dict e classificador separado
-		joblib.dump({"models": reg_models, "feature_cols": FEATURE_COLS}, REG_PATH)
-		joblib.dump(cls, CLS_PATH)
+		# Persistência: nova versão no artifact store (boosters nativos + manifest), publicada atomicamente
+		manifest = {
+			"symbol": market.symbol,
+			"interval": market.interval,
+			"features": FEATURE_COLS,
+			"days": days,
+			"alpha": alpha,
+			"samples": n,
+			"split_idx": split_idx,
+			"val_start": df2["time"].iloc[split_idx].isoformat(),
+			"mode": used_mode,
+			"reason": reason,
+			"trained_at": start.isoformat(),
+			"trained_until": trained_until.isoformat(),
+			"last_full_at": last_full_at.isoformat(),
+			"new_rows": new_rows,
+			"trees": trees,
+			"mae": mae, "mape": mape, "smape": smape,
+			"metrics": target_metrics,
+			"fit_secs": fit_secs, "timings": timings,
+		}
+		with span("publish"):
+			version = store_for(market).publish(reg_models, cls, CLS_TARGET, manifest)
+		with span("model_load"):
+			registry_for(market).reload()
+		response_cache.invalidate()
+		warning = None
+		with span("db_write"):
+			try:
+				_record_run(version, manifest, start, datetime.utcnow(), df2["time"].iloc[split_idx].to_pydatetime(), trained_until, market)
+			except Exception as e:
+				# O modelo já está publicado e em uso: o treino vale, só falta a linha no histórico (train_runs)
+				warning = f"train_runs não gravado: {e}"
 
 		msg = (
-			f"Treinado {days}d, n={n}, split={split_idx}/{n}. "
-			f"Val close_next -> MAE={mae:.4f}, MAPE={mape:.2f}%, SMAPE={smape:.2f}%"
+			f"Treinado {market.key} {days}d -> {version} ({used_mode}, {reason}), n={n}, split={split_idx}/{n}, novas={new_rows}. "
+			f"Val close_next -> MAE={mae:.4f}, MAPE={mape:.2f}%, SMAPE={smape:.2f}%. "
+			f"Fit {fit_secs:.1f}s (mais lento: {max(timings, key=timings.get)} {max(timings.values()):.1f}s)"
 		)
+		if warning:
+			msg += f". Aviso: {warning}"
 		log_job("train","ok", msg, start, datetime.utcnow())
-		return {"status":"ok","samples":n,"mae":mae,"mape":mape,"smape":smape}
+		out = {"status":"ok","version":version,"mode":used_mode,"reason":reason,"samples":n,"new_rows":new_rows,
+			   "mae":mae,"mape":mape,"smape":smape,"fit_secs":fit_secs,"timings":timings,"trees":trees}
+		if warning:
+			out["warning"] = warning
+		return out
 	except Exception as e:
 		log_job("train","error",str(e),start,datetime.utcnow())
 		return {"status":"error","message":str(e)}
+
+
+def train_markets(days: int|None=None, alpha: float|None=None, mode: str="full", rounds: int|None=None,
+				  markets: list|None=None):
+	"""Job do /train: treina cada mercado no pool de mercados, dividindo TRAIN_CPU_BUDGET entre os que rodam juntos."""
+	markets = markets or MARKETS
+	concurrent = min(len(markets), settings.MARKET_WORKERS)
+	budget = max(1, _cpu_budget() // concurrent) if concurrent > 1 else None
+	return run_markets(train_job, markets, days, alpha, mode, rounds, budget=budget)
@@ -0,0 +1,9 @@
+import os
+
+# Configurações obrigatórias do core.config: valores de teste para importar os módulos sem .env
+# (os testes não abrem conexão com o Postgres nem com a Binance real)
+for key, value in {
+    "PG_PORT": "5432", "BINANCE_BASE": "http://127.0.0.1:9", "BINANCE_SYMBOL": "BTCUSDT",
+    "BINANCE_INTERVAL": "5m", "BINANCE_LIMIT": "1000", "BACKFILL_DAYS": "1", "BACKFILL_SLEEP_MS": "0",
+}.items():
+    os.environ.setdefault(key, value)
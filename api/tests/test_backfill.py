@@ -0,0 +1,164 @@
+import threading, time
+from collections import Counter
+import pandas as pd
+import pytest
+from bench import fake_binance
+from core.ratelimit import TokenBucket
+from services import backfill_service
+from services.backfill_service import BackfillEngine, plan_windows
+
+SYMBOL, INTERVAL, LIMIT = "BTCUSDT", "1m", 100
+STEP_MS = fake_binance.interval_ms(INTERVAL)
+# Alinhado à grade das janelas (plan_windows), para cada janela ter exatamente LIMIT candles
+START_MS = int(pd.Timestamp("2025-01-01").value // 1_000_000) // (LIMIT * STEP_MS) * (LIMIT * STEP_MS)
+
+
+def window_range(n: int) -> tuple[int, int]:
+    return START_MS, START_MS + n * LIMIT * STEP_MS
+
+
+class Interrupted(Exception):
+    pass
+
+
+class MemoryStore:
+    """btc_candles e backfill_checkpoints em memória (no lugar de upsert_candles e dos checkpoints)."""
+
+    def __init__(self, fail_after: int | None = None):
+        self.rows: dict[pd.Timestamp, float] = {}
+        self.inserts = Counter()
+        self.checkpoints: dict = {}
+        self.fail_after = fail_after
+        self.lock = threading.Lock()
+
+    def upsert(self, df: pd.DataFrame, market) -> int:
+        if self.fail_after is not None and len(self.checkpoints) >= self.fail_after:
+            raise Interrupted()
+        new = 0
+        with self.lock:
+            for t, close in zip(df["time"], df["close"]):
+                if t not in self.rows:
+                    self.rows[t] = close
+                    self.inserts[t] += 1
+                    new += 1
+        return new
+
+    def done(self, symbol: str, interval: str) -> set:
+        return set(self.checkpoints)
+
+    def save(self, symbol, interval, start, end, fetched, inserted) -> None:
+        self.checkpoints[start] = (end, fetched, inserted)
+
+    def assert_complete(self, start_ms: int, end_ms: int):
+        times = pd.date_range(pd.Timestamp(start_ms, unit="ms"), pd.Timestamp(end_ms - STEP_MS, unit="ms"),
+                              freq=f"{STEP_MS}ms")
+        assert sorted(self.rows) == list(times)
+        assert all(n == 1 for n in self.inserts.values())
+        for t in times:
+            assert self.rows[t] == float(fake_binance.kline(int(t.value // 1_000_000), STEP_MS)[4])
+
+
+class SpyBucket(TokenBucket):
+    def __init__(self):
+        super().__init__(6000, 60.0)
+        self.pauses = []
+
+    def pause(self, seconds: float) -> None:
+        self.pauses.append(seconds)
+        super().pause(seconds)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(backfill_service, "upsert_candles", store.upsert)
+    monkeypatch.setattr(backfill_service, "_done_windows", store.done)
+    monkeypatch.setattr(backfill_service, "_save_checkpoint", store.save)
+    return store
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(fake_binance.start(0, **kwargs))
+        return servers[-1]
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+
+
+def engine(srv, workers: int = 4, limiter: TokenBucket | None = None) -> BackfillEngine:
+    return BackfillEngine(SYMBOL, INTERVAL, limit=LIMIT, workers=workers, limiter=limiter or SpyBucket(),
+                          base_url=srv.base_url, api_key="", max_retries=3)
+
+
+def test_concurrent_windows_land_complete_and_deduplicated(store, server):
+    srv = server(latency_ms=100)
+    start_ms, end_ms = window_range(12)
+    eng = engine(srv, workers=4)
+    t0 = time.perf_counter()
+    res = eng.run(start_ms, end_ms)
+    elapsed = time.perf_counter() - t0
+
+    assert res == {"fetched": 12 * LIMIT, "inserted": 12 * LIMIT, "calls": 12, "windows": 12, "skipped": 0}
+    assert srv.requests == 12
+    store.assert_complete(start_ms, end_ms)
+    assert len(store.checkpoints) == 12
+    # 12 janelas × 100 ms de latência em série levariam 1,2 s; 4 workers buscam ao mesmo tempo
+    assert elapsed < 0.8
+
+    # Rodar de novo sem retomar refaz as janelas, mas não duplica candles
+    again = engine(srv).run(start_ms, end_ms, resume=False)
+    assert again["fetched"] == 12 * LIMIT and again["inserted"] == 0
+    store.assert_complete(start_ms, end_ms)
+
+
+@pytest.mark.parametrize("status", [418, 429])
+def test_rate_limit_pauses_the_bucket_and_retries(store, server, status):
+    srv = server(rate_limit_every=4, retry_after=1, rate_limit_status=status)
+    start_ms, end_ms = window_range(6)
+    limiter = SpyBucket()
+    t0 = time.perf_counter()
+    res = engine(srv, workers=2, limiter=limiter).run(start_ms, end_ms)
+    elapsed = time.perf_counter() - t0
+
+    assert srv.rate_limited >= 1
+    # Cada 418/429 pausa o limitador compartilhado pelo Retry-After e a janela é buscada de novo
+    assert limiter.pauses == [1.0] * srv.rate_limited
+    assert res["calls"] == 6 + srv.rate_limited
+    assert elapsed >= 1.0
+    store.assert_complete(start_ms, end_ms)
+    assert len(store.checkpoints) == 6
+
+
+def test_interrupted_run_resumes_from_checkpoints(store, server, monkeypatch):
+    srv = server()
+    start_ms, end_ms = window_range(10)
+    windows = plan_windows(start_ms, end_ms, STEP_MS, LIMIT)
+    fetched = []
+    fetch = BackfillEngine.fetch_window
+
+    def spy(self, s, e):
+        fetched.append(s)
+        return fetch(self, s, e)
+
+    monkeypatch.setattr(BackfillEngine, "fetch_window", spy)
+
+    store.fail_after = 4
+    with pytest.raises(Interrupted):
+        engine(srv, workers=2).run(start_ms, end_ms)
+    done = {int(pd.Timestamp(t).value // 1_000_000) for t in store.checkpoints}
+    assert len(done) == 4
+
+    store.fail_after = None
+    fetched.clear()
+    res = engine(srv, workers=2).run(start_ms, end_ms)
+
+    assert res["skipped"] == 4 and res["windows"] == 10
+    # Só as janelas sem checkpoint são buscadas de novo
+    assert sorted(fetched) == sorted(s for s, _ in windows if s not in done)
+    store.assert_complete(start_ms, end_ms)
+    assert len(store.checkpoints) == 10
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from bench.series_format import synthetic_frames
+from services.downsample import bucket_edges, downsample_series, LAST_COLS
+
+
+@pytest.mark.parametrize("n,m", [(26_000, 1000), (1001, 1000), (997, 10), (10, 3), (50_001, 49_999)])
+def test_sql_bucket_formula_matches_bucket_edges(n, m):
+    edges = bucket_edges(n, m)
+    assert edges[0] == 0 and edges[-1] == n and (np.diff(edges) >= 1).all()
+    # BUCKETS_QUERY: (row_number·m − 1) div n, com row_number começando em 1
+    sql = ((np.arange(1, n + 1, dtype=np.int64) * m) - 1) // n
+    np.testing.assert_array_equal(sql, np.repeat(np.arange(m), np.diff(edges)))
+
+
+def test_buckets_keep_errors_with_their_candles():
+    cache = synthetic_frames(5000)[4].reset_index(drop=True)
+    # Sem previsão/erro no começo (aquecimento) e sem erro na última linha
+    cache.loc[:8, LAST_COLS + ["err_close_abs", "err_close_signed", "err_amp_abs"]] = np.nan
+    cache.loc[len(cache) - 1, ["err_close_abs", "err_close_signed", "err_amp_abs"]] = np.nan
+    out = downsample_series(cache, 300)
+    edges = bucket_edges(len(cache), 300)
+
+    assert len(out) == 300 and list(out.columns) == list(cache.columns)
+    for k, (s, e) in enumerate(zip(edges[:-1], edges[1:])):
+        rows, row = cache.iloc[s:e], out.iloc[k]
+        assert row["time"] == rows["time"].iloc[0]
+        assert row["open"] == rows["open"].iloc[0] and row["close"] == rows["close"].iloc[-1]
+        # Previsão e classe da última linha do bucket, a mesma do close mostrado
+        for c in LAST_COLS:
+            assert row[c] == rows[c].iloc[-1] or (pd.isna(row[c]) and pd.isna(rows[c].iloc[-1]))
+        # Erros: os piores do bucket
+        signed = rows["err_close_signed"]
+        if signed.isna().all():
+            assert pd.isna(row["err_close_signed"]) and pd.isna(row["err_close_abs"])
+            continue
+        assert row["err_close_abs"] == rows["err_close_abs"].max()
+        assert row["err_amp_abs"] == rows["err_amp_abs"].max()
+        assert row["err_close_signed"] == signed.loc[signed.abs().idxmax()]
+    # O maior pico de erro da série sempre sobrevive
+    assert np.nanmax(np.abs(out["err_close_signed"])) == np.nanmax(np.abs(cache["err_close_signed"]))
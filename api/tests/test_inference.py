@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from xgboost import XGBRegressor, XGBClassifier
+from ml import inference
+from ml.features import FEATURE_COLS, TARGET_REG_COLS
+from ml.inference import InferenceEngine
+
+ROWS = [1, 256, 5000]
+PARAMS = dict(n_estimators=40, max_depth=4, learning_rate=0.1, tree_method="hist", n_jobs=1)
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(11)
+    X = pd.DataFrame(rng.normal(size=(max(ROWS), len(FEATURE_COLS))), columns=FEATURE_COLS).astype(np.float32)
+    Y = pd.DataFrame({t: X["close"] * (i + 1) + rng.normal(size=len(X)) for i, t in enumerate(TARGET_REG_COLS)})
+    return X, Y, classifier(X, Y)
+
+
+def bundle(X, Y, cols):
+    return {"models": {t: XGBRegressor(**PARAMS).fit(X[cols], Y[t]) for t in TARGET_REG_COLS}, "feature_cols": cols}
+
+
+def classifier(X, Y, cols=FEATURE_COLS):
+    return XGBClassifier(**PARAMS).fit(X[cols], (Y["close_next"] > 0).astype(int))
+
+
+@pytest.fixture(params=[False, True], ids=["serial", "parallel"])
+def pool(request, monkeypatch):
+    # Com um núcleo só a engine nunca usaria o pool; aqui ele é forçado para cobrir os dois caminhos
+    if request.param:
+        ex = ThreadPoolExecutor(max_workers=2)
+        monkeypatch.setattr(inference, "_pool", ex)
+        monkeypatch.setattr(inference, "_CORES", 4)
+        monkeypatch.setattr(inference, "PARALLEL_MIN_ROWS", 256)
+        yield
+        ex.shutdown()
+    else:
+        monkeypatch.setattr(inference, "_pool", None)
+        yield
+
+
+def old_path(reg_bundle, cls, X: pd.DataFrame):
+    """Caminho anterior à engine: um predict por modelo sobre o DataFrame, mais predict/predict_proba."""
+    if isinstance(reg_bundle, dict):
+        cols = reg_bundle["feature_cols"]
+        reg = np.column_stack([reg_bundle["models"][t].predict(X[cols]) for t in TARGET_REG_COLS])
+    else:
+        cols = FEATURE_COLS
+        reg = reg_bundle.predict(X)
+    return reg, cls.predict(X[cols]), cls.predict_proba(X[cols])
+
+
+def assert_parity(engine, reg_bundle, cls, X):
+    ref_reg, ref_cls, ref_prob = old_path(reg_bundle, cls, X)
+    for inp in (X, X.to_numpy()):
+        reg, cls_pred, prob = engine.predict_parts(inp)
+        np.testing.assert_array_equal(reg.to_numpy(), ref_reg)
+        np.testing.assert_array_equal(cls_pred, ref_cls)
+        np.testing.assert_array_equal(prob, ref_prob)
+    assert list(reg.columns) == TARGET_REG_COLS
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_parity_per_target_models(data, pool, rows):
+    X, Y, cls = data
+    reg_bundle = bundle(X, Y, FEATURE_COLS)
+    assert_parity(InferenceEngine(reg_bundle, cls), reg_bundle, cls, X.iloc[:rows])
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_parity_feature_order_remap(data, pool, rows):
+    # Modelos treinados com as colunas em outra ordem: o array em FEATURE_COLS passa pelo _order
+    X, Y, _ = data
+    cols = FEATURE_COLS[::-1]
+    reg_bundle, cls = bundle(X, Y, cols), classifier(X, Y, cols)
+    engine = InferenceEngine(reg_bundle, cls)
+    assert engine._order is not None
+    assert_parity(engine, reg_bundle, cls, X.iloc[:rows])
+
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_parity_legacy_multi_output(data, pool, rows):
+    X, Y, cls = data
+    legacy = XGBRegressor(**PARAMS).fit(X, Y[TARGET_REG_COLS])
+    assert_parity(InferenceEngine(legacy, cls), legacy, cls, X.iloc[:rows])
+
+
+def test_engine_does_not_change_shared_boosters(data, monkeypatch):
+    X, Y, cls = data
+    monkeypatch.setattr(inference, "_pool", SimpleNamespace())
+    monkeypatch.setattr(inference, "_CORES", 12)
+    reg_bundle = bundle(X, Y, FEATURE_COLS)
+    before = cls.get_booster().save_config()
+    InferenceEngine(reg_bundle, cls)
+    assert cls.get_booster().save_config() == before
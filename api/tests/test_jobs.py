@@ -0,0 +1,256 @@
+import asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from core import jobs, markets
+from core.jobs import JobRunner
+from core.markets import Market, job_key
+
+MARKETS = [Market("BTCUSDT", "5m"), Market("ETHUSDT", "1m")]
+
+
+class Locks:
+    """Advisory locks do Postgres: cada sessão fake devolve os seus ao fechar."""
+
+    def __init__(self):
+        self.held: dict[int, object] = {}
+        self.sessions = 0
+        self.running: list[int] = []
+        self.finished: dict[int, str] = {}
+        self.guard = threading.Lock()
+
+    def try_lock(self, session, lock) -> bool:
+        with self.guard:
+            if self.held.get(lock, session) is not session:
+                return False
+            self.held[lock] = session
+            return True
+
+    def close(self, session) -> None:
+        with self.guard:
+            for lock in [k for k, v in self.held.items() if v is session]:
+                del self.held[lock]
+
+
+class FakeAsyncConn:
+    def __init__(self, locks: Locks):
+        self.locks = locks
+
+    async def fetchval(self, q, lock):
+        return self.locks.try_lock(self, lock)
+
+    async def execute(self, q, started_at, job_id):
+        self.locks.running.append(job_id)
+
+    async def close(self):
+        self.locks.close(self)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn, self.row = conn, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, q, params):
+        if "pg_try_advisory_lock" in q:
+            self.row = (self.conn.locks.try_lock(self.conn, params[0]),)
+        else:
+            self.conn.locks.running.append(params[1])
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConn:
+    autocommit = False
+
+    def __init__(self, locks: Locks):
+        self.locks = locks
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.locks.close(self)
+
+
+@pytest.fixture
+def locks(monkeypatch):
+    locks = Locks()
+    ids = iter(range(1, 1000))
+
+    async def fetchrow(q, *args):
+        return (next(ids),)
+
+    async def fetch(q, *args):
+        if "UPDATE job_logs" in q:
+            locks.finished[args[-1]] = args[0]
+        return []
+
+    async def aconnect():
+        locks.sessions += 1
+        return FakeAsyncConn(locks)
+
+    def connect():
+        with locks.guard:
+            locks.sessions += 1
+        return FakeConn(locks)
+
+    monkeypatch.setattr(jobs.aiodb, "fetchrow", fetchrow)
+    monkeypatch.setattr(jobs.aiodb, "fetch", fetch)
+    monkeypatch.setattr(jobs.aiodb, "connect", aconnect)
+    monkeypatch.setattr(jobs.db, "connect", connect)
+    monkeypatch.setattr(markets, "MARKETS", MARKETS)
+    return locks
+
+
+@pytest.fixture
+def runner(locks):
+    return JobRunner()
+
+
+def test_single_market_request_joins_running_all_markets_job(runner):
+    async def run():
+        gate = asyncio.Event()
+
+        async def work(tag):
+            await gate.wait()
+            return {"status": "ok", "tag": tag}
+
+        id_all, task, coalesced = await runner.submit(job_key("ingest", MARKETS), work, "all")
+        id_one, task_one, coalesced_one = await runner.submit(job_key("ingest", MARKETS[:1]), work, "one")
+        gate.set()
+        await task
+        return id_all, id_one, coalesced, coalesced_one
+
+    id_all, id_one, coalesced, coalesced_one = asyncio.run(run())
+    assert not coalesced and coalesced_one and id_one == id_all
+
+
+def test_all_markets_request_waits_for_overlapping_single_market_job(runner):
+    order = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def single():
+            order.append("single:start")
+            await gate.wait()
+            order.append("single:end")
+            return {"status": "ok"}
+
+        async def everything():
+            order.append("all:start")
+            return {"status": "ok"}
+
+        _, t1, _ = await runner.submit(job_key("ingest", MARKETS[1:]), single)
+        _, t2, coalesced = await runner.submit("ingest", everything)
+        await asyncio.sleep(0.05)
+        assert order == ["single:start"]
+        gate.set()
+        await asyncio.gather(t1, t2)
+        await asyncio.sleep(0)
+        return coalesced
+
+    assert asyncio.run(run()) is False
+    assert order == ["single:start", "single:end", "all:start"]
+    # Jobs terminados saem do registro em memória
+    assert runner._active == {}
+
+
+def test_other_job_names_do_not_block(runner):
+    async def run():
+        gate = asyncio.Event()
+
+        async def slow():
+            await gate.wait()
+            return {"status": "ok"}
+
+        async def fast():
+            return {"status": "ok"}
+
+        _, t1, _ = await runner.submit("train", slow)
+        _, t2, coalesced = await runner.submit("ingest", fast)
+        result = await asyncio.wait_for(t2, 1)
+        gate.set()
+        await t1
+        return result, coalesced
+
+    result, coalesced = asyncio.run(run())
+    assert result == {"status": "ok"} and not coalesced
+
+
+def test_lock_held_elsewhere_skips_job(runner, locks):
+    other = object()
+    locks.held[jobs._lock_key(f"ingest:{MARKETS[0].key}")] = other
+
+    async def run():
+        async def work():
+            return {"status": "ok"}
+
+        _, task, _ = await runner.submit("ingest", work)
+        return await task
+
+    result = asyncio.run(run())
+    assert result["status"] == "skipped"
+    # Os locks pegos antes do que falhou são devolvidos (a sessão do job foi fechada)
+    assert locks.held == {jobs._lock_key(f"ingest:{MARKETS[0].key}"): other}
+    assert locks.running == []
+
+
+def test_queued_sync_job_holds_no_session_until_it_runs(runner, locks, monkeypatch):
+    # Executor de jobs com um worker só: o segundo job fica na fila do executor
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def run_job(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    monkeypatch.setattr(jobs, "run_job", run_job)
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return {"status": "ok"}
+
+    def fast():
+        return {"status": "ok"}
+
+    async def run():
+        id_slow, t1, _ = await runner.submit("train", slow)
+        id_fast, t2, _ = await runner.submit("ingest", fast)
+        await asyncio.sleep(0.1)
+        queued = (locks.sessions, list(locks.running), set(locks.held))
+        release.set()
+        await asyncio.gather(t1, t2)
+        return id_slow, id_fast, queued
+
+    id_slow, id_fast, (sessions, running, held) = asyncio.run(run())
+    executor.shutdown()
+    # Na fila: nenhuma sessão, nenhum lock e a linha não foi marcada como 'running'
+    assert sessions == 1 and running == [id_slow]
+    assert held == {jobs._lock_key(f"train:{m.key}") for m in MARKETS}
+    assert locks.sessions == 2 and locks.running == [id_slow, id_fast]
+    assert locks.held == {}
+    assert locks.finished == {id_slow: "ok", id_fast: "ok"}
+
+
+def test_shutdown_marks_queued_and_running_jobs_cancelled(runner, locks):
+    async def run():
+        async def forever():
+            await asyncio.Event().wait()
+
+        id_running, _, _ = await runner.submit(job_key("ingest", MARKETS[:1]), forever)
+        # Mesmo mercado: espera o primeiro terminar, na fila
+        id_queued, _, _ = await runner.submit("ingest", forever)
+        await asyncio.sleep(0.05)
+        await runner.shutdown()
+        return id_running, id_queued
+
+    id_running, id_queued = asyncio.run(run())
+    assert locks.finished == {id_running: "cancelled", id_queued: "cancelled"}
+    assert locks.running == [id_running]
+    assert locks.held == {} and runner._active == {}
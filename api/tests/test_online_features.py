@@ -0,0 +1,77 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from ml.features import build_features_targets, FEATURE_COLS, VOL_WINDOW
+from ml.online_features import OnlineFeatureState
+from bench.series_format import synthetic_frames
+
+STEP = pd.Timedelta("5min").to_pytimedelta()
+CANDLE_COLS = ["time", "open", "high", "low", "close", "volume"]
+
+
+def candles(n: int = 3000, drop=()) -> pd.DataFrame:
+    df = synthetic_frames(n)[0][CANDLE_COLS]
+    return df.drop(index=df.index[list(drop)]).reset_index(drop=True)
+
+
+def online_rows(df: pd.DataFrame, state: OnlineFeatureState | None = None) -> dict:
+    state = state or OnlineFeatureState(STEP)
+    out = {}
+    for t, o, h, l, c, v in df.itertuples(index=False, name=None):
+        if state.push(t.to_pydatetime(), o, h, l, c, v) is not None:
+            out[t] = state.feature_row()
+    return out
+
+
+def assert_parity(df: pd.DataFrame, online: dict):
+    df2, X, _, _ = build_features_targets(df)
+    # O lote descarta a última linha de cada trecho (sem alvo); o resto tem que coincidir linha a linha
+    assert set(df2["time"]) <= set(online)
+    got = np.array([online[t] for t in df2["time"]])
+    np.testing.assert_allclose(got, X[FEATURE_COLS].to_numpy(), rtol=1e-9, atol=0)
+    return df2
+
+
+def test_parity_without_gaps():
+    df = candles()
+    online = online_rows(df)
+    df2 = assert_parity(df, online)
+    # Sem lacunas só faltam no lote as linhas de aquecimento e a última
+    assert len(df2) == len(df) - (VOL_WINDOW - 1) - 1
+    assert set(online) - set(df2["time"]) == {df["time"].iloc[-1]}
+
+
+@pytest.mark.parametrize("drop", [
+    [500],                              # um candle
+    list(range(1000, 1004)),            # lacuna longa
+    [1500, 1503],                       # trecho menor que a janela de volume
+    list(np.random.default_rng(3).choice(np.arange(1, 2999), 50, replace=False)),
+], ids=["single", "long", "short-segment", "random"])
+def test_parity_around_gaps(drop):
+    df = candles(drop=sorted(drop))
+    online = online_rows(df)
+    df2 = assert_parity(df, online)
+    times = df["time"]
+    after_gap = times[times.diff() > pd.Timedelta(STEP)]
+    # O candle logo depois de uma lacuna recomeça o histórico: sem features nos dois caminhos
+    for t in after_gap:
+        assert t not in online and t not in set(df2["time"])
+
+
+def test_state_round_trip_keeps_parity():
+    # Estado persistido (feature_state) e retomado no meio da série, atravessando uma lacuna
+    df = candles(drop=[1210])
+    state = OnlineFeatureState(STEP)
+    head = online_rows(df.iloc[:1200], state)
+    restored = OnlineFeatureState.from_dict(json.loads(json.dumps(state.to_dict(), default=str)), STEP)
+    tail = online_rows(df.iloc[1200:], restored)
+    assert_parity(df, {**head, **tail})
+
+
+def test_out_of_order_candle_is_rejected():
+    df = candles(20)
+    state = OnlineFeatureState(STEP)
+    online_rows(df, state)
+    with pytest.raises(ValueError):
+        state.push(df["time"].iloc[5].to_pydatetime(), 1.0, 1.0, 1.0, 1.0, 1.0)
@@ -0,0 +1,59 @@
+import asyncio, gc
+import numpy as np
+from services.predict_service import MicroBatcher
+
+
+def echo(X):
+    return X * 2, "v1"
+
+
+def test_concurrent_calls_share_a_batch_and_get_their_rows():
+    async def run():
+        b = MicroBatcher(echo, window_ms=5, max_rows=256)
+        rows = [np.full((1, 3), i, dtype=np.float32) for i in range(20)]
+        outs = await asyncio.gather(*(b.predict(x) for x in rows))
+        return b, rows, outs
+
+    b, rows, outs = asyncio.run(run())
+    assert b.calls == 20 and b.batches == 1
+    for x, (out, version) in zip(rows, outs):
+        np.testing.assert_array_equal(out, x * 2)
+        assert version == "v1"
+
+
+def test_batch_task_survives_gc_and_drain_waits_for_it():
+    async def run():
+        b = MicroBatcher(echo, window_ms=1, max_rows=256)
+        call = asyncio.ensure_future(b.predict(np.ones((2, 3), dtype=np.float32)))
+        await asyncio.sleep(0.01)
+        gc.collect()
+        await b.drain()
+        assert not b._tasks
+        return await call
+
+    out, _ = asyncio.run(run())
+    np.testing.assert_array_equal(out, np.full((2, 3), 2))
+
+
+def test_errors_reach_every_caller():
+    def boom(X):
+        raise RuntimeError("modelo indisponível")
+
+    async def run():
+        b = MicroBatcher(boom, window_ms=1, max_rows=256)
+        return await asyncio.gather(*(b.predict(np.ones((1, 3))) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_drain_flushes_the_open_window():
+    async def run():
+        b = MicroBatcher(echo, window_ms=10_000, max_rows=256)
+        call = asyncio.ensure_future(b.predict(np.ones((1, 3), dtype=np.float32)))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(b.drain(), 5)
+        return await call
+
+    out, _ = asyncio.run(run())
+    np.testing.assert_array_equal(out, np.full((1, 3), 2))
@@ -0,0 +1,41 @@
+import asyncio, threading
+from ml.registry import ModelRegistry
+
+
+class CountingStore:
+    root = "/nao-existe"
+
+    def __init__(self, version):
+        self.version = version
+        self.reads = []
+
+    def current(self):
+        self.reads.append(threading.current_thread().name)
+        return self.version
+
+
+def test_published_version_is_cached_and_read_off_the_event_loop():
+    store = CountingStore("v1")
+    reg = ModelRegistry(store, None, None, check_secs=60)
+
+    async def poll(n):
+        return [await reg.published_async() for _ in range(n)]
+
+    assert asyncio.run(poll(50)) == ["v1"] * 50
+    # Uma leitura do CURRENT para 50 requisições, e fora da thread do loop
+    assert len(store.reads) == 1 and store.reads[0] != threading.main_thread().name
+
+    store.version = "v2"
+    assert asyncio.run(poll(1)) == ["v1"]
+    # Reload (após treino/rollback) relê o CURRENT e atualiza o valor guardado na hora
+    reg._stamp()
+    assert asyncio.run(poll(1)) == ["v2"]
+
+
+def test_published_expires_after_check_secs():
+    store = CountingStore("v1")
+    reg = ModelRegistry(store, None, None, check_secs=0)
+    reg.published()
+    store.version = "v2"
+    assert reg.published() == "v2"
+    assert len(store.reads) == 2
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from ml.features import FEATURE_COLS, TARGET_REG_COLS, VOL_WINDOW
+from services import prediction_service
+from services.series_format import series_frame, series_points
+
+GAP = list(range(40, 50))
+
+
+class ExactEngine:
+    """Prevê o próximo close como close + 1, que é exato na grade (close = 100 + slot)."""
+
+    def predict_parts(self, X: pd.DataFrame):
+        assert not X[FEATURE_COLS].isna().any().any()
+        reg = pd.DataFrame({k: X["close"] + 1.0 for k in TARGET_REG_COLS})
+        reg["amp_next"] = X["amp"]
+        prob = np.tile([0.4, 0.6], (len(X), 1))
+        return reg, np.ones(len(X), dtype=int), prob
+
+
+@pytest.fixture
+def inputs(monkeypatch):
+    monkeypatch.setattr(prediction_service, "registry_for", lambda market: SimpleNamespace(get=lambda: None))
+    monkeypatch.setattr(prediction_service, "engine_for", lambda snap: ExactEngine())
+    slots = np.arange(120)
+    df = pd.DataFrame({
+        "time": pd.Timestamp("2025-01-01") + pd.to_timedelta(slots * 5, unit="min"),
+        "open": 100.0 + slots, "high": 101.0 + slots, "low": 99.0 + slots, "close": 100.0 + slots,
+        "volume": 1.0,
+    })
+    df = df.drop(index=GAP).reset_index(drop=True)
+    return df, prediction_service._predict_inputs(df)
+
+
+def test_series_keeps_every_candle_and_errors_do_not_span_gaps(inputs):
+    df, parts = inputs
+    frame = series_frame(*parts)
+    # Todos os candles reais ficam na série, inclusive o aquecimento depois da lacuna e o último
+    assert len(frame) == len(df)
+    assert frame["time"].tolist() == df["time"].tolist()
+    np.testing.assert_array_equal(frame["close"], df["close"])
+
+    before_gap = GAP[0] - 1
+    after_gap = before_gap + 1
+    has_err = frame["err_close_signed"].notna().to_numpy()
+    # O candle antes da lacuna tem previsão, mas não tem erro (o próximo candle da grade não existe)
+    assert np.isfinite(frame["pred_close_next"].iloc[before_gap])
+    assert not has_err[before_gap] and not has_err[-1]
+    # Onde há erro ele é contra o candle seguinte da grade: a previsão exata dá zero
+    assert (frame.loc[has_err, "err_close_signed"] == 0).all()
+    assert (frame.loc[has_err, "err_amp_abs"] == 0).all()
+
+    # Sem previsão só no aquecimento da janela e do trecho depois da lacuna
+    no_pred = frame["pred_close_next"].isna().to_numpy()
+    warmup = list(range(VOL_WINDOW - 1)) + list(range(after_gap, after_gap + VOL_WINDOW - 1))
+    assert np.flatnonzero(no_pred).tolist() == warmup
+    assert frame["cls_dir_next"].isna().to_numpy().tolist() == no_pred.tolist()
+    assert has_err.sum() == len(df) - len(warmup) - 2
+
+
+def test_points_match_frame_around_gaps(inputs):
+    df, parts = inputs
+    frame = series_frame(*parts)
+    points = series_points(*parts)
+    assert len(points) == len(df)
+    for p, (_, r) in zip(points, frame.iterrows()):
+        assert (p["pred"] is None) == np.isnan(r["pred_close_next"])
+        assert (p["cls"] is None) == (r["cls_dir_next"] is None)
+        assert (p["err"] is None) == np.isnan(r["err_close_signed"])
+        if p["err"] is not None:
+            assert p["err"]["close_signed"] == r["err_close_signed"] == 0
@@ -0,0 +1,81 @@
+import asyncio, time
+import pandas as pd
+import pytest
+from bench import fake_binance
+from core.config import settings
+from core.http import close_http
+from core.markets import Market
+from services import stream_service
+from services.stream_service import KlineStream
+
+MARKET = Market("BTCUSDT", "1s")
+STEP = pd.Timedelta(seconds=1)
+
+
+class MemoryCandles:
+    """btc_candles em memória: no lugar de store_closed_candles e da leitura do último candle gravado."""
+
+    def __init__(self):
+        self.rows: dict[pd.Timestamp, float] = {}
+        self.inserts: dict[pd.Timestamp, int] = {}
+        self.open_bars = 0
+
+    def store(self, df: pd.DataFrame, market: Market) -> dict:
+        now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+        for t, close in zip(df["time"], df["close"]):
+            if t + STEP > now:
+                self.open_bars += 1
+            if t not in self.rows:
+                self.inserts[t] = self.inserts.get(t, 0) + 1
+            self.rows[t] = close
+        return {"inserted": len(df)}
+
+    async def fetchrow(self, q, *args):
+        return (max(self.rows),) if self.rows else None
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    rest = fake_binance.start(0)
+    ws = fake_binance.start_stream(0, tick_ms=50, drop_after=15)
+    candles = MemoryCandles()
+    errors = []
+    monkeypatch.setattr(settings, "BINANCE_BASE", rest.base_url)
+    monkeypatch.setattr(stream_service, "store_closed_candles", candles.store)
+    monkeypatch.setattr(stream_service.aiodb, "fetchrow", candles.fetchrow)
+    monkeypatch.setattr(stream_service, "log_job", lambda *a: errors.append(a))
+    yield ws, candles, errors
+    ws.shutdown()
+    rest.shutdown()
+
+
+def test_stream_reconnects_and_stores_each_closed_bar_once(fakes):
+    ws, candles, errors = fakes
+
+    async def run():
+        stream = KlineStream([MARKET], base=ws.base_url)
+        stream.start()
+        deadline = time.monotonic() + 20
+        # Pelo menos duas quedas (drop_after) e candles gravados depois da última reconexão
+        while time.monotonic() < deadline and (stream.connects < 3 or len(candles.rows) < 5):
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(1.2)
+        stats = stream.stats()
+        await stream.stop()
+        await close_http()
+        return stats
+
+    stats = asyncio.run(run())
+
+    assert stats["connects"] >= 3
+    assert ws.connections == stats["connects"]
+    assert stats["errors"] == 0 and not errors
+    assert candles.open_bars == 0
+    assert all(n == 1 for n in candles.inserts.values())
+    # Sem buracos: as quedas são cobertas pelo preenchimento de lacunas do REST
+    times = sorted(candles.rows)
+    assert times == list(pd.date_range(times[0], times[-1], freq=STEP))
+    step_ms = fake_binance.interval_ms(MARKET.interval)
+    for t in times:
+        ms = int(t.value // 1_000_000)
+        assert candles.rows[t] == float(fake_binance.kline(ms, step_ms)[4])
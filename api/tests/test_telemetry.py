@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from core import telemetry
+from core.telemetry import Histogram, RequestTimings, TimingMiddleware, operation, span
+
+
+def test_request_timings_are_not_lost_across_threads():
+    timings = RequestTimings()
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        list(ex.map(lambda _: [timings.add("predict", 1.0) for _ in range(2000)], range(8)))
+    assert timings.items() == [("predict", 16000.0)]
+
+
+def test_spans_in_executor_threads_reach_the_request():
+    token = telemetry._timings.set(RequestTimings())
+    try:
+        def stage():
+            with span("features"):
+                pass
+        with operation("series_data"), ThreadPoolExecutor(max_workers=4) as ex:
+            for f in [ex.submit(copy_context().run, stage) for _ in range(50)]:
+                f.result()
+        stages = dict(telemetry._timings.get().items())
+    finally:
+        telemetry._timings.reset(token)
+    assert set(stages) == {"features"}
+    assert telemetry.STAGE_DURATION._series[("series_data", "features")][2] >= 50
+
+
+def test_histogram_render_is_cumulative():
+    h = Histogram("t_seconds", "teste", ("op",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v, 'a"b')
+    lines = h.render()
+    assert 't_seconds_bucket{op="a\\"b",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{op="a\\"b",le="1.0"} 2' in lines
+    assert 't_seconds_bucket{op="a\\"b",le="+Inf"} 3' in lines
+    assert 't_seconds_count{op="a\\"b"} 3' in lines
+
+
+def test_middleware_adds_server_timing():
+    async def app(scope, receive, send):
+        with span("db_read"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/x"}
+    asyncio.run(TimingMiddleware(app, server_timing=True)(scope, None, send))
+    headers = dict(sent[0]["headers"])
+    value = headers[b"server-timing"].decode()
+    assert value.startswith("db_read;dur=") and ", app;dur=" in value
+    assert telemetry.HTTP_DURATION._series[("GET", "unmatched", "200")][2] >= 1
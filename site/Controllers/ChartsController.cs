@@ -19,11 +19,13 @@ _cfg = cfg.Value;
 public IActionResult Index() => View();
 
 [HttpGet]
-public async Task<IActionResult> Series()
+public async Task<IActionResult> Series(int? maxPoints)
 {
 var client = _http.CreateClient();
 
-var json = await client.GetStringAsync($"{_cfg.BaseUrl}/series/cached?fallback_days=90");
+// maxPoints: série reduzida no servidor (zoom amplo); sem ele vem a resolução completa
+var qs = maxPoints.HasValue ? $"&max_points={maxPoints.Value}" : "";
+var json = await client.GetStringAsync($"{_cfg.BaseUrl}/series/cached?fallback_days=90{qs}");
 return Content(json, "application/json");
 }
 
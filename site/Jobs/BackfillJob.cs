@@ -35,7 +35,8 @@ namespace TechChallenge.Jobs
 
                 if (ratio < _cfg.ExpectedCoverageRatio)
                 {
-                    await client.PostAsync($"{_cfg.BaseUrl}/init/backfill", null);
+                    // wait=true: o treino precisa dos candles do backfill já gravados
+                    await client.PostAsync($"{_cfg.BaseUrl}/init/backfill?wait=true", null);
                     await client.PostAsync($"{_cfg.BaseUrl}/train?days={days}", null);
                 }
             }
@@ -20,8 +20,8 @@ namespace TechChallenge.Jobs
             var client = _http.CreateClient();
             try
             {
-				// Treino do modelo
-                await client.PostAsync($"{_cfg.BaseUrl}/train?days=90", null);
+				// Treino do modelo (wait=true: a materialização só roda depois do treino terminar)
+                await client.PostAsync($"{_cfg.BaseUrl}/train?days=90&mode=incremental&wait=true", null);
                 // Materialização dos dados para gráficos rápidos
                 await client.PostAsync($"{_cfg.BaseUrl}/series/rebuild", null);
             }